@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""Compares the time Generator takes to copy a shuffled mapping with each
+copy order.
+
+Page cache hits hide seek costs, so run it as root with ``--drop-caches``,
+on the kind of disk being tuned, and with a source directory larger than
+the readahead window::
+
+    python benchmarks/copy_order.py --files 5000 --drop-caches /mnt/archive
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from subte import locality  # noqa
+from subte.generator import Generator  # noqa
+
+
+def make_corpus(directory, files, size, subdirs):
+    mapping = []
+    for index in xrange(files):
+        name = os.path.join('dir{}'.format(index % subdirs),
+                            'caption{}'.format(index))
+        path = os.path.join(directory, 'source', name + '.srt')
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as fd:
+            fd.write(os.urandom(size))
+        mapping.append({'concept': u'Concept {}'.format(index),
+                        'lecture': name})
+    random.shuffle(mapping)
+    mapping_file = os.path.join(directory, 'mapping.json')
+    with open(mapping_file, 'w') as fd:
+        json.dump(mapping, fd)
+    return mapping_file
+
+
+def drop_caches():
+    os.system('sync')
+    with open('/proc/sys/vm/drop_caches', 'w') as fd:
+        fd.write('3\n')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('directory', nargs='?', default=None)
+    parser.add_argument('--files', type=int, default=2000)
+    parser.add_argument('--size', type=int, default=32 * 1024)
+    parser.add_argument('--subdirs', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--drop-caches', action='store_true', default=False)
+    arguments = parser.parse_args()
+
+    directory = tempfile.mkdtemp(dir=arguments.directory)
+    try:
+        mapping_file = make_corpus(directory, arguments.files,
+                                   arguments.size, arguments.subdirs)
+        for order in locality.ORDERS:
+            timings = []
+            for _ in xrange(arguments.repeat):
+                target_dir = os.path.join(directory, 'target')
+                if arguments.drop_caches:
+                    drop_caches()
+                generator = Generator([
+                    '-s', os.path.join(directory, 'source'),
+                    '-t', target_dir, '-f', '-o', order, '-l', 'ERROR',
+                    'json', mapping_file])
+                start = time.time()
+                generator.run()
+                timings.append(time.time() - start)
+                shutil.rmtree(target_dir)
+            print '{:8s} best {:.3f}s  mean {:.3f}s'.format(
+                order, min(timings), sum(timings) / len(timings))
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    main()
@@ -41,6 +41,17 @@ setup(
     entry_points={
         'console_scripts': [
             'subte-gen = subte.generator:main',
+            'subte-gen-async = subte.generator:main_async',
+            'subte-catalog = subte.catalog:main',
+            'subte-diff = subte.differ:main',
+            'subte-export = subte.exporter:main',
+            'subte-import = subte.importer:main',
+            'subte-index = subte.indexer:main',
+            'subte-lint = subte.linter:main',
+            'subte-merge = subte.merger:main',
+            'subte-resync = subte.resync:main',
+            'subte-serve = subte.server:main',
+            'subte-verify = subte.verifier:main',
         ],
     },
     test_suite='tests.runtests',
@@ -0,0 +1,404 @@
+# -*- coding: utf-8 -*-
+import array
+import codecs
+import collections
+import mmap
+import os
+import os.path
+import re
+import struct
+import sys
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None  # pragma: no cover
+
+CAPTION_EXTENSIONS = ('.srt', '.vtt')
+
+Cue = collections.namedtuple('Cue', ['index', 'start', 'end', 'text'])
+"""Caption cue. ``start`` and ``end`` are in milliseconds."""
+
+TIMING_REGEX = re.compile(r'^\s*((?:\d+:)?\d{1,2}:\d{2}[,.]\d{3})\s*-->\s*'
+                          r'((?:\d+:)?\d{1,2}:\d{2}[,.]\d{3})(?:\s.*)?$')
+TIMESTAMP_REGEX = re.compile(r'^(?:(\d+):)?(\d{1,2}):(\d{2})[,.](\d{3})$')
+TIMING_PARTS_REGEX = re.compile(
+    r'^\s*(?:(\d+):)?(\d{1,2}):(\d{2})[,.](\d{3})\s*-->\s*'
+    r'(?:(\d+):)?(\d{1,2}):(\d{2})[,.](\d{3})(?:\s.*)?$')
+BLOCK_REGEX = re.compile(r'^[^\n]*\S[^\n]*(?:\n[^\n]*\S[^\n]*)*', re.M)
+HEADER_BLOCKS = ('WEBVTT', 'NOTE', 'STYLE', 'REGION')
+
+STORE_MAGIC = 'SUBTECS1'
+STORE_HEADER = struct.Struct('<8sQQQ')
+
+
+class CaptionError(ValueError):
+
+    def __init__(self, message, line=None, code='syntax'):
+        if line is not None:
+            message = 'line {}: {}'.format(line, message)
+        super(CaptionError, self).__init__(message)
+        self.line = line
+        self.code = code
+
+
+def parse_timestamp(value):
+    """Returns the milliseconds of a ``HH:MM:SS,mmm`` or ``MM:SS.mmm``
+    timestamp.
+    """
+    match = TIMESTAMP_REGEX.match(value.strip())
+    if match is None:
+        raise CaptionError('invalid timestamp {!r}'.format(value),
+                           code='timestamp')
+    hours, minutes, seconds, millis = match.groups()
+    if int(minutes) > 59 or int(seconds) > 59:
+        raise CaptionError('invalid timestamp {!r}'.format(value),
+                           code='timestamp')
+    return (((int(hours or 0) * 60 + int(minutes)) * 60 + int(seconds)) *
+            1000 + int(millis))
+
+
+def _millis(hours, minutes, seconds, millis):
+    minutes = int(minutes)
+    seconds = int(seconds)
+    if minutes > 59 or seconds > 59:
+        raise CaptionError('invalid timestamp {}:{}:{}'.format(
+            hours or 0, minutes, seconds), code='timestamp')
+    return ((int(hours) * 60 if hours else 0) + minutes) * 60000 + \
+        seconds * 1000 + int(millis)
+
+
+def format_timestamp(value, separator=','):
+    seconds, millis = divmod(int(value), 1000)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return '{:02d}:{:02d}:{:02d}{}{:03d}'.format(hours, minutes, seconds,
+                                                 separator, millis)
+
+
+def iter_cues(lines):
+    """Yields the cues of SRT or WebVTT ``lines`` as they are read.
+
+    Byte lines are decoded as UTF-8, ignoring a byte order mark. Raises
+    ``CaptionError`` on undecodable text and malformed timings.
+    """
+    block = []
+    number = 0
+    for number, line in enumerate(lines, 1):
+        if isinstance(line, str):
+            if number == 1 and line.startswith(codecs.BOM_UTF8):
+                line = line[len(codecs.BOM_UTF8):]
+            try:
+                line = line.decode('utf-8')
+            except UnicodeDecodeError as e:
+                raise CaptionError('invalid UTF-8: {}'.format(e), number,
+                                   'encoding')
+        elif number == 1:
+            line = line.lstrip(u'\ufeff')
+        line = line.rstrip(u'\r\n')
+        if line.strip():
+            block.append((number, line))
+        elif block:
+            cue = _parse_block(block)
+            if cue is not None:
+                yield cue
+            block = []
+    if block:
+        cue = _parse_block(block)
+        if cue is not None:
+            yield cue
+
+
+def _parse_block(block):
+    first_number, first = block[0]
+    if first.startswith(HEADER_BLOCKS):
+        return None
+    timing_at = 1 if len(block) > 1 and u'-->' not in first else 0
+    number, timing = block[timing_at]
+    match = TIMING_REGEX.match(timing)
+    if match is None:
+        raise CaptionError('invalid cue timing {!r}'.format(timing), number,
+                           'timing')
+    index = first.strip() if timing_at else None
+    text = u'\n'.join(line for _, line in block[timing_at + 1:])
+    try:
+        return Cue(index, parse_timestamp(match.group(1)),
+                   parse_timestamp(match.group(2)), text)
+    except CaptionError as e:
+        raise CaptionError(str(e), number, e.code)
+
+
+def read_cues(path):
+    with open(path, 'rb') as fd:
+        return list(iter_cues(fd))
+
+
+def iter_captions(paths):
+    """Yields the caption files in ``paths``, walking directories.
+    """
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        for directory, _, names in os.walk(path):
+            for name in sorted(names):
+                if name.lower().endswith(CAPTION_EXTENSIONS):
+                    yield os.path.join(directory, name)
+
+
+def is_vtt(path):
+    return path.lower().endswith('.vtt')
+
+
+def write_cues(fd, cues, vtt=False):
+    """Writes ``cues`` to a binary file object, numbering SRT cues in
+    order.
+    """
+    separator = '.' if vtt else ','
+    if vtt:
+        fd.write('WEBVTT\n\n')
+    for position, cue in enumerate(cues, 1):
+        if not vtt:
+            fd.write('{}\n'.format(position))
+        elif cue.index:
+            fd.write(cue.index.encode('utf-8') + '\n')
+        fd.write('{} --> {}\n'.format(
+            format_timestamp(cue.start, separator),
+            format_timestamp(cue.end, separator)))
+        fd.write(cue.text.encode('utf-8') + '\n\n')
+
+
+def _little_endian(values):
+    if sys.byteorder == 'big':  # pragma: no cover
+        values = array.array(values.typecode, values)  # pragma: no cover
+        values.byteswap()  # pragma: no cover
+    return values.tostring()
+
+
+class CueStore(object):
+    """Cues held in flat arrays instead of one object per cue.
+
+    Start and end milliseconds are ``int32`` arrays. The UTF-8 text and
+    the identifiers of all the cues are two contiguous buffers, sliced by
+    ``uint32`` offset arrays with one more entry than cues, so the text of
+    a store is limited to 4 GiB.
+
+    ``Cue`` tuples are only built when the store is indexed or iterated.
+    Saved stores are opened with ``CueStore.open``, which memory-maps the
+    file; their times are NumPy views of the map when NumPy is available.
+    """
+
+    def __init__(self):
+        self.starts = array.array('i')
+        self.ends = array.array('i')
+        self.text_offsets = array.array('I', [0])
+        self.index_offsets = array.array('I', [0])
+        self.text = bytearray()
+        self.indexes = bytearray()
+        self._text_base = self._index_base = 0
+        self._map = None
+
+    @classmethod
+    def from_cues(cls, cues):
+        store = cls()
+        for cue in cues:
+            store.append(cue.start, cue.end, cue.text, cue.index)
+        return store
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, position):
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError('cue index out of range')
+        return Cue(self.index(position), int(self.starts[position]),
+                   int(self.ends[position]), self.text_of(position))
+
+    def __iter__(self):
+        for position in xrange(len(self)):
+            yield self[position]
+
+    def index(self, position):
+        start = self._index_base + self.index_offsets[position]
+        end = self._index_base + self.index_offsets[position + 1]
+        return self.indexes[start:end].decode('utf-8') if end > start else None
+
+    def text_of(self, position):
+        start = self._text_base + self.text_offsets[position]
+        end = self._text_base + self.text_offsets[position + 1]
+        return self.text[start:end].decode('utf-8')
+
+    def append(self, start, end, text, index=None):
+        """Appends a cue. ``text`` and ``index`` are unicode or UTF-8 bytes.
+        """
+        if self._map is not None:
+            raise ValueError('Memory-mapped cue stores are read-only.')
+        if isinstance(text, unicode):
+            text = text.encode('utf-8')
+        if isinstance(index, unicode):
+            index = index.encode('utf-8')
+        self.starts.append(start)
+        self.ends.append(end)
+        self.text.extend(text)
+        self.text_offsets.append(len(self.text))
+        if index:
+            self.indexes.extend(index)
+        self.index_offsets.append(len(self.indexes))
+
+    def parse(self, data):
+        """Appends the cues of the SRT or WebVTT ``data`` bytes and returns
+        how many were found. Accepts the same input as ``iter_cues`` and
+        raises the same errors, leaving the store unchanged.
+        """
+        if data.startswith(codecs.BOM_UTF8):
+            data = data[len(codecs.BOM_UTF8):]
+        try:
+            data.decode('utf-8')
+        except UnicodeDecodeError as e:
+            raise CaptionError('invalid UTF-8: {}'.format(e),
+                               data.count('\n', 0, e.start) + 1, 'encoding')
+        if self._map is not None:
+            raise ValueError('Memory-mapped cue stores are read-only.')
+        count = len(self)
+        starts, ends = self.starts.append, self.ends.append
+        text, indexes = self.text, self.indexes
+        text_offsets = self.text_offsets.append
+        index_offsets = self.index_offsets.append
+        for block in BLOCK_REGEX.finditer(data):
+            lines = block.group().split('\n')
+            first = lines[0]
+            if first.startswith(HEADER_BLOCKS):
+                continue
+            timing_at = 1 if len(lines) > 1 and '-->' not in first else 0
+            match = TIMING_PARTS_REGEX.match(lines[timing_at].rstrip('\r'))
+            try:
+                if match is None:
+                    raise CaptionError('invalid cue timing {!r}'.format(
+                        lines[timing_at].rstrip('\r').decode('utf-8')),
+                        code='timing')
+                hours, minutes, seconds, millis = match.group(1, 2, 3, 4)
+                starts(_millis(hours, minutes, seconds, millis))
+                hours, minutes, seconds, millis = match.group(5, 6, 7, 8)
+                ends(_millis(hours, minutes, seconds, millis))
+            except CaptionError as e:
+                self._truncate(count)
+                raise CaptionError(str(e), data.count(
+                    '\n', 0, block.start()) + timing_at + 1, e.code)
+            if '\r' in block.group():
+                lines = [line.rstrip('\r') for line in lines]
+            text.extend('\n'.join(lines[timing_at + 1:]))
+            text_offsets(len(text))
+            if timing_at:
+                indexes.extend(first.strip())
+            index_offsets(len(indexes))
+        return len(self) - count
+
+    def _truncate(self, count):
+        del self.starts[count:]
+        del self.ends[count:]
+        del self.text[self.text_offsets[count]:]
+        del self.text_offsets[count + 1:]
+        del self.indexes[self.index_offsets[count]:]
+        del self.index_offsets[count + 1:]
+
+    @classmethod
+    def read(cls, path):
+        store = cls()
+        with open(path, 'rb') as fd:
+            store.parse(fd.read())
+        return store
+
+    def write(self, fd, vtt=False):
+        """Writes the cues to a binary file object like ``write_cues``.
+        """
+        separator = '.' if vtt else ','
+        chunk = ['WEBVTT\n\n'] if vtt else []
+        for position in xrange(len(self)):
+            if not vtt:
+                chunk.append('{}\n'.format(position + 1))
+            else:
+                start = self._index_base + self.index_offsets[position]
+                end = self._index_base + self.index_offsets[position + 1]
+                if end > start:
+                    chunk.append(str(self.indexes[start:end]) + '\n')
+            start = self._text_base + self.text_offsets[position]
+            end = self._text_base + self.text_offsets[position + 1]
+            chunk.append('{} --> {}\n{}\n\n'.format(
+                format_timestamp(self.starts[position], separator),
+                format_timestamp(self.ends[position], separator),
+                str(self.text[start:end])))
+            if len(chunk) >= 4096:
+                fd.write(''.join(chunk))
+                chunk = []
+        fd.write(''.join(chunk))
+
+    def save(self, path):
+        """Writes the store in the little-endian format read by ``open``.
+        """
+        text = self.text[self._text_base:self._text_base +
+                         self.text_offsets[-1]]
+        indexes = self.indexes[self._index_base:self._index_base +
+                               self.index_offsets[-1]]
+        with open(path, 'wb') as fd:
+            fd.write(STORE_HEADER.pack(STORE_MAGIC, len(self), len(text),
+                                       len(indexes)))
+            for values in (self.starts, self.ends, self.text_offsets,
+                           self.index_offsets):
+                if isinstance(values, array.array):
+                    fd.write(_little_endian(values))
+                else:
+                    fd.write(values.astype('<u4' if values.dtype.kind == 'u'
+                                           else '<i4').tostring())
+            fd.write(text)
+            fd.write(indexes)
+
+    @classmethod
+    def open(cls, path):
+        """Opens a saved store without reading its cues. Close it when done.
+        """
+        with open(path, 'rb') as fd:
+            data = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if len(data) < STORE_HEADER.size:
+                raise ValueError('{} is not a cue store.'.format(path))
+            magic, count, text_size, index_size = STORE_HEADER.unpack_from(
+                data)
+            if magic != STORE_MAGIC:
+                raise ValueError('{} is not a cue store.'.format(path))
+            store = cls()
+            offset = STORE_HEADER.size
+            arrays = []
+            for typecode, length in (('i', count), ('i', count),
+                                     ('I', count + 1), ('I', count + 1)):
+                size = length * 4
+                if numpy is not None:
+                    arrays.append(numpy.frombuffer(
+                        data, '<u4' if typecode == 'I' else '<i4', length,
+                        offset))
+                else:
+                    values = array.array(typecode)
+                    values.fromstring(data[offset:offset + size])
+                    if sys.byteorder == 'big':  # pragma: no cover
+                        values.byteswap()  # pragma: no cover
+                    arrays.append(values)
+                offset += size
+            if offset + text_size + index_size > len(data):
+                raise ValueError('{} is truncated.'.format(path))
+        except Exception:
+            data.close()
+            raise
+        (store.starts, store.ends, store.text_offsets,
+         store.index_offsets) = arrays
+        store.text = store.indexes = store._map = data
+        store._text_base = offset
+        store._index_base = offset + text_size
+        return store
+
+    def close(self):
+        if self._map is not None:
+            self.starts = self.ends = None
+            self.text_offsets = self.index_offsets = None
+            self._map.close()
+            self._map = None
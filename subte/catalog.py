@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+import collections
+import json
+import sqlite3
+import sys
+import threading
+import time
+
+from subte.process import Process, ProcessMode
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS items (
+    course TEXT NOT NULL,
+    number INTEGER NOT NULL,
+    concept TEXT,
+    flat_concept TEXT NOT NULL,
+    status TEXT,
+    updated REAL,
+    PRIMARY KEY (course, number)
+);
+CREATE INDEX IF NOT EXISTS items_concept ON items (concept);
+CREATE INDEX IF NOT EXISTS items_flat_concept ON items (flat_concept);
+CREATE TABLE IF NOT EXISTS outputs (
+    target_dir TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    course TEXT NOT NULL,
+    number INTEGER,
+    file_type TEXT,
+    source_dir TEXT,
+    source TEXT NOT NULL,
+    size INTEGER,
+    digest TEXT,
+    updated REAL,
+    PRIMARY KEY (target_dir, filename)
+);
+CREATE INDEX IF NOT EXISTS outputs_source ON outputs (source);
+CREATE INDEX IF NOT EXISTS outputs_item ON outputs (course, number);
+'''
+
+ITEM_COLUMNS = ('course', 'number', 'concept', 'flat_concept', 'status',
+                'updated')
+OUTPUT_COLUMNS = ('target_dir', 'filename', 'course', 'number', 'file_type',
+                  'source_dir', 'source', 'size', 'digest', 'updated')
+
+
+class Catalog(object):
+    """SQLite catalog of the mapping items and the outputs generated from
+    them.
+
+    Rows are buffered and written in one transaction per ``batch_size``
+    rows. The connection is shared by every thread under a lock. Rows
+    written since the catalog was opened are the ones the run touched.
+    """
+
+    def __init__(self, path, batch_size=500):
+        self.path = path
+        self.batch_size = batch_size
+        self.connection = sqlite3.connect(path, timeout=60,
+                                          check_same_thread=False)
+        self.connection.executescript(SCHEMA)
+        self.opened = time.time()
+        self._items = []
+        self._outputs = []
+        self._lock = threading.Lock()
+
+    def add_item(self, course, number, concept, flat_concept, status):
+        self._add(self._items, (course, number, concept, flat_concept,
+                                status, time.time()))
+
+    def add_output(self, target_dir, filename, course, number, file_type,
+                   source_dir, source, size, digest):
+        self._add(self._outputs, (target_dir, filename, course, number,
+                                  file_type, source_dir, source, size, digest,
+                                  time.time()))
+
+    def _add(self, rows, row):
+        with self._lock:
+            rows.append(row)
+            if len(self._items) + len(self._outputs) >= self.batch_size:
+                self._flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if not self._items and not self._outputs:
+            return
+        with self.connection:
+            for table, columns, rows in (
+                    ('items', ITEM_COLUMNS, self._items),
+                    ('outputs', OUTPUT_COLUMNS, self._outputs)):
+                if rows:
+                    self.connection.executemany(
+                        'INSERT OR REPLACE INTO {} ({}) VALUES ({})'.format(
+                            table, ', '.join(columns),
+                            ', '.join('?' * len(columns))), rows)
+        del self._items[:]
+        del self._outputs[:]
+
+    def delete_outputs(self, target_dir, filenames):
+        """Deletes the outputs of ``target_dir`` named ``filenames``, such
+        as the ones renamed or removed by a synchronization.
+        """
+        with self._lock:
+            self._flush()
+            with self.connection:
+                self.connection.executemany(
+                    'DELETE FROM outputs WHERE target_dir = ? AND '
+                    'filename = ?', [(target_dir, filename)
+                                     for filename in filenames])
+
+    def prune(self, course):
+        """Deletes the items and outputs of ``course`` that were not
+        written since the catalog was opened, such as removed items.
+        Returns the number of deleted rows.
+        """
+        with self._lock:
+            self._flush()
+            with self.connection:
+                deleted = 0
+                for table in ('items', 'outputs'):
+                    deleted += self.connection.execute(
+                        'DELETE FROM {} WHERE course = ? AND '
+                        'updated < ?'.format(table),
+                        (course, self.opened)).rowcount
+        return deleted
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+
+    def query(self, sql, parameters=()):
+        """Returns the rows of ``sql`` as ordered dictionaries.
+        """
+        cursor = self.connection.execute(sql, parameters)
+        columns = [column[0] for column in cursor.description]
+        return [collections.OrderedDict(zip(columns, row)) for row in cursor]
+
+    def find_concept(self, pattern):
+        """Returns the outputs of the items whose concept or flat concept
+        matches the ``pattern`` SQL LIKE pattern.
+        """
+        return self.query(
+            'SELECT items.course, items.number, items.concept, '
+            'items.flat_concept, items.status, outputs.target_dir, '
+            'outputs.filename, outputs.source FROM items LEFT JOIN outputs '
+            'ON outputs.course = items.course AND '
+            'outputs.number = items.number '
+            'WHERE items.concept LIKE ? OR items.flat_concept LIKE ? '
+            'ORDER BY items.course, items.number, outputs.filename',
+            (pattern, pattern))
+
+    def find_source(self, source):
+        """Returns the outputs generated from the ``source`` file.
+        """
+        return self.query(
+            'SELECT {} FROM outputs WHERE source = ? '
+            'ORDER BY target_dir, filename'.format(', '.join(OUTPUT_COLUMNS)),
+            (source,))
+
+
+class ConceptMode(ProcessMode):
+
+    SUBCOMMAND = 'concept'
+    HELPTEXT = 'Find the outputs of the items matching a concept'
+    DESCRIPTION = 'Concept query mode'
+
+    def set_arguments(self, subparser):
+        subparser.add_argument('pattern', type=str,
+                               help='Concept, with %% wildcards')
+
+
+class SourceMode(ProcessMode):
+
+    SUBCOMMAND = 'source'
+    HELPTEXT = 'Find the outputs generated from a source file'
+    DESCRIPTION = 'Source query mode'
+
+    def set_arguments(self, subparser):
+        subparser.add_argument('source', type=str,
+                               help='Source filename, such as abc.srt')
+
+
+class CatalogQuery(Process):
+
+    NAME = 'subte-catalog'
+    MODES = [ConceptMode, SourceMode]
+
+    def set_arguments(self, parser):
+        parser.add_argument('catalog', type=str, help='Catalog database')
+        parser.add_argument('--json', dest='json', action='store_true',
+                            default=False, help='Print JSON lines')
+
+    def handle(self):
+        catalog = Catalog(self.arguments.catalog)
+        try:
+            if self.arguments.subparser_name == 'concept':
+                rows = catalog.find_concept(
+                    self.arguments.pattern.decode('utf-8'))
+            else:
+                rows = catalog.find_source(self.arguments.source)
+        finally:
+            catalog.close()
+        for row in rows:
+            if self.arguments.json:
+                line = json.dumps(row, sort_keys=True)
+            else:
+                line = u'\t'.join(u'' if value is None else unicode(value)
+                                  for value in row.values()).encode('utf-8')
+            sys.stdout.write(line + '\n')
+
+
+def main():
+    query = CatalogQuery()
+    query.run()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+import gzip
+import io
+import os.path
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None  # pragma: no cover
+
+SUFFIXES = {
+    'gzip': '.gz',
+    'zstd': '.zst',
+}
+COMPRESSIONS = sorted(SUFFIXES)
+CHUNK_SIZE = 256 * 1024
+
+
+def check(compression):
+    """Raises ``ValueError`` when ``compression`` is not available.
+    """
+    if compression not in SUFFIXES:
+        raise ValueError('Unknown compression {!r}.'.format(compression))
+    if compression == 'zstd' and zstandard is None:
+        raise ValueError('zstd compression requires the zstandard package.')
+
+
+def detect(path):
+    """Returns the compression of ``path`` according to its suffix, or
+    ``None``.
+    """
+    for compression, suffix in SUFFIXES.items():
+        if path.endswith(suffix):
+            return compression
+    return None
+
+
+def resolve(path):
+    """Returns ``(path, compression)`` for the first of ``path`` and its
+    compressed variants that exists. Missing files resolve to ``path``.
+    """
+    if os.path.exists(path):
+        return path, detect(path)
+    for compression in COMPRESSIONS:
+        candidate = path + SUFFIXES[compression]
+        if os.path.exists(candidate):
+            return candidate, compression
+    return path, None
+
+
+def reader(fd, compression):
+    """Wraps the ``fd`` binary file so reads return decompressed data.
+    """
+    if compression is None:
+        return fd
+    check(compression)
+    if compression == 'gzip':
+        return gzip.GzipFile(fileobj=fd, mode='rb')
+    return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(fd),
+                             CHUNK_SIZE)
+
+
+def writer(fd, compression, level=None, threads=0):
+    """Wraps the ``fd`` binary file so writes are compressed. The wrapper
+    must be closed to flush the compressed stream; ``fd`` is left open.
+
+    gzip streams have no timestamp or name, so the same content always
+    compresses to the same bytes. ``threads`` only applies to zstd.
+    """
+    check(compression)
+    if compression == 'gzip':
+        return gzip.GzipFile(filename='', mode='wb', fileobj=fd, mtime=0,
+                             compresslevel=9 if level is None else level)
+    compressor = zstandard.ZstdCompressor(
+        level=3 if level is None else level, threads=threads)
+    return compressor.stream_writer(fd, closefd=False)
+
+
+def open_file(path):
+    """Opens ``path`` for reading, decompressing it according to its
+    suffix.
+    """
+    compression = detect(path)
+    if compression == 'gzip':
+        return gzip.open(path, 'rb')
+    return reader(open(path, 'rb'), compression)
+
+
+def copy_stream(source, target):
+    """Copies the ``source`` file object into ``target`` and returns the
+    number of bytes read.
+    """
+    size = 0
+    for chunk in iter(lambda: source.read(CHUNK_SIZE), ''):
+        target.write(chunk)
+        size += len(chunk)
+    return size
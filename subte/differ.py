@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+import collections
+import logging
+import multiprocessing
+import os.path
+
+from subte import compression
+from subte.captions import CaptionError, iter_cues
+from subte.generator import Generator
+
+Change = collections.namedtuple('Change', ['old', 'new', 'text', 'timing'])
+"""Aligned cue pair. ``old`` or ``new`` is ``None`` for deleted and inserted
+cues; ``text`` and ``timing`` tell whether each part changed."""
+
+
+def _key(cue):
+    return u' '.join(cue.text.split())
+
+
+def align(old, new):
+    """Aligns two cue sequences by their text in linear time.
+
+    Cues whose text is unique in both sequences are anchors (Heckel's
+    algorithm); matches are then extended to neighbouring cues with equal
+    text, and the remaining cues between two matches are paired in order
+    as text changes. Returns the list of ``Change`` ordered by the new
+    sequence.
+    """
+    table = {}
+    for index, cue in enumerate(old):
+        entry = table.setdefault(_key(cue), [0, 0, None])
+        entry[0] += 1
+        entry[2] = index
+    for cue in new:
+        table.setdefault(_key(cue), [0, 0, None])[1] += 1
+    old_match = [None] * len(old)
+    new_match = [None] * len(new)
+    for index, cue in enumerate(new):
+        old_count, new_count, old_index = table[_key(cue)]
+        if old_count == 1 and new_count == 1:
+            new_match[index] = old_index
+            old_match[old_index] = index
+    for index in xrange(len(new) - 1):
+        old_index = new_match[index]
+        if (old_index is not None and old_index + 1 < len(old) and
+           new_match[index + 1] is None and
+           old_match[old_index + 1] is None and
+           _key(old[old_index + 1]) == _key(new[index + 1])):
+            new_match[index + 1] = old_index + 1
+            old_match[old_index + 1] = index + 1
+    for index in xrange(len(new) - 1, 0, -1):
+        old_index = new_match[index]
+        if (old_index is not None and old_index > 0 and
+           new_match[index - 1] is None and
+           old_match[old_index - 1] is None and
+           _key(old[old_index - 1]) == _key(new[index - 1])):
+            new_match[index - 1] = old_index - 1
+            old_match[old_index - 1] = index - 1
+
+    changes = []
+    old_position = 0
+    inserted = []
+
+    def flush(old_end):
+        unmatched = [index for index in xrange(old_position, old_end)
+                     if old_match[index] is None]
+        for old_index, new_index in zip(unmatched, inserted):
+            changes.append(Change(old_index, new_index, True,
+                                  _timing_changed(old[old_index],
+                                                  new[new_index])))
+        for old_index in unmatched[len(inserted):]:
+            changes.append(Change(old_index, None, True, True))
+        for new_index in inserted[len(unmatched):]:
+            changes.append(Change(None, new_index, True, True))
+        del inserted[:]
+
+    for index, old_index in enumerate(new_match):
+        if old_index is None:
+            inserted.append(index)
+            continue
+        if old_index >= old_position:
+            flush(old_index)
+            old_position = old_index + 1
+        changes.append(Change(old_index, index, False,
+                              _timing_changed(old[old_index], new[index])))
+    flush(len(old))
+    return changes
+
+
+def _timing_changed(old, new):
+    return (old.start, old.end) != (new.start, new.end)
+
+
+def summarize(changes):
+    summary = {'unchanged': 0, 'text': 0, 'timing': 0, 'inserted': 0,
+               'deleted': 0}
+    for change in changes:
+        if change.old is None:
+            summary['inserted'] += 1
+        elif change.new is None:
+            summary['deleted'] += 1
+        else:
+            summary['text'] += change.text
+            summary['timing'] += change.timing
+            summary['unchanged'] += not (change.text or change.timing)
+    return summary
+
+
+def read_captions(path):
+    """Returns the cues of ``path`` or of its compressed variant.
+    """
+    path, _ = compression.resolve(path)
+    with compression.open_file(path) as fd:
+        return list(iter_cues(fd))
+
+
+def diff_files(paths):
+    """Returns ``(old_path, new_path, summary, changes, error)`` for a pair
+    of caption files. Runs in the worker processes.
+    """
+    old_path, new_path = paths
+    try:
+        changes = align(read_captions(old_path), read_captions(new_path))
+    except (IOError, CaptionError) as e:
+        return old_path, new_path, None, None, str(e)
+    summary = summarize(changes)
+    changes = [change for change in changes if change.old is None or
+               change.new is None or change.text or change.timing]
+    return old_path, new_path, summary, changes, None
+
+
+class Differ(Generator):
+    """Compares, cue by cue, each caption already generated in
+    ``target_dir`` with the ``source_dir`` one that would replace it.
+    """
+
+    NAME = 'subte-diff'
+
+    def set_arguments(self, parser):
+        super(Differ, self).set_arguments(parser)
+        parser.set_defaults(jobs=multiprocessing.cpu_count())
+
+    def prepare(self):
+        super(Differ, self).prepare()
+        self.results = None
+        self.report = {}
+
+    def handle(self):
+        pairs = []
+        for number, item in self.get_items():
+            for source, filename in self.plan_item(number, item):
+                origin, destination = self.orient(source, filename)
+                for source_dir, target_dir in self.languages:
+                    pairs.append((os.path.join(target_dir, destination),
+                                  os.path.join(source_dir, origin)))
+        pool = multiprocessing.Pool(max(1, self.arguments.jobs))
+        try:
+            for result in pool.imap_unordered(diff_files, pairs, 16):
+                self.record_diff(*result)
+        finally:
+            pool.close()
+            pool.join()
+
+    def record_diff(self, old_path, new_path, summary, changes, error):
+        name = self.label(os.path.dirname(old_path),
+                          os.path.basename(old_path))
+        if error is not None:
+            logging.error('%s', error, extra={
+                'operation': 'diff', 'source': old_path,
+                'destination': new_path, 'error': error})
+            self.report[name] = {'error': error}
+            return
+        self.report[name] = {
+            'summary': summary,
+            'changes': [change._asdict() for change in changes],
+        }
+        if changes:
+            logging.info('%s: %d text, %d timing, %d inserted, %d deleted',
+                         name, summary['text'], summary['timing'],
+                         summary['inserted'], summary['deleted'])
+
+    def get_report(self):
+        return self.report
+
+
+def main():
+    differ = Differ()
+    differ.run()
+
+if __name__ == '__main__':
+    main()
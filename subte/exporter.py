@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+import collections
+import json
+import logging
+import multiprocessing
+import os
+import os.path
+import sys
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # pragma: no cover
+    pyarrow = None  # pragma: no cover
+
+from subte import compression, storage
+from subte.captions import CaptionError, iter_cues
+from subte.generator import Generator, parse_filename
+
+COLUMNS = ('course', 'number', 'concept', 'file_type', 'index', 'start',
+           'end', 'text')
+PENDING_FILES = 4
+"""Files being parsed per job before the oldest one must be written."""
+
+
+def read_rows(task):
+    """Returns ``(path, rows, error)`` for a ``(path, fields)`` task. Each
+    row is ``fields`` followed by the index, times and text of a cue of the
+    caption, or of its compressed variant.
+    """
+    path, fields = task
+    path, _ = compression.resolve(path)
+    try:
+        with compression.open_file(path) as fd:
+            rows = [fields + (cue.index, cue.start, cue.end, cue.text)
+                    for cue in iter_cues(fd)]
+    except (IOError, CaptionError) as e:
+        return path, None, str(e)
+    return path, rows, None
+
+
+class JSONLinesWriter(object):
+    """Writes rows as JSON objects, one per line, to ``path`` or to the
+    standard output for ``-``. Paths with a compression suffix are
+    compressed.
+    """
+
+    def __init__(self, path):
+        self._file = sys.stdout if path == '-' else open(path, 'wb')
+        self._codec = compression.detect(path)
+        self.fd = self._file
+        if self._codec is not None:
+            self.fd = compression.writer(self._file, self._codec)
+
+    def write(self, rows):
+        self.fd.write(''.join(json.dumps(collections.OrderedDict(
+            zip(COLUMNS, row))) + '\n' for row in rows))
+
+    def close(self):
+        if self._codec is not None:
+            self.fd.close()
+        if self._file is not sys.stdout:
+            self._file.close()
+
+
+class ParquetWriter(object):
+    """Writes rows to a Parquet file, one row group per batch.
+    """
+
+    def __init__(self, path):
+        if pyarrow is None:
+            raise ValueError('Parquet export requires the pyarrow package.')
+        self.schema = pyarrow.schema([
+            ('course', pyarrow.string()), ('number', pyarrow.int32()),
+            ('concept', pyarrow.string()), ('file_type', pyarrow.string()),
+            ('index', pyarrow.string()), ('start', pyarrow.int64()),
+            ('end', pyarrow.int64()), ('text', pyarrow.string())])
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+
+    def write(self, rows):
+        arrays = [pyarrow.array(list(values), type=self.schema.types[index])
+                  for index, values in enumerate(zip(*rows))]
+        self.writer.write_table(pyarrow.Table.from_arrays(
+            arrays, names=list(COLUMNS)))
+
+    def close(self):
+        self.writer.close()
+
+
+FORMATS = {
+    'jsonl': JSONLinesWriter,
+    'parquet': ParquetWriter,
+}
+
+
+class Exporter(Generator):
+    """Exports the cues of the captions of the mapping as rows of a JSON
+    Lines or Parquet file. Captions are read from the source directories
+    and named as ``subte-gen`` would, using the target directory name as
+    the course.
+
+    Captions are parsed by a pool of processes in mapping order. Only a
+    few files per job are pending at a time and rows are written in
+    batches, so memory does not grow with the size of the mapping.
+    """
+
+    NAME = 'subte-export'
+
+    def set_arguments(self, parser):
+        super(Exporter, self).set_arguments(parser)
+        parser.add_argument('-O', '--output', type=str, default='-',
+                            help='Output file, - for the standard output')
+        parser.add_argument('-F', '--format', type=str, default='jsonl',
+                            choices=sorted(FORMATS), help='Output format')
+        parser.add_argument('--batch-size', type=int, default=50000,
+                            help='Rows per written batch')
+        parser.set_defaults(jobs=multiprocessing.cpu_count())
+
+    def prepare(self):
+        self.stats = {'files': 0, 'cues': 0, 'errors': 0}
+        self.errors = []
+        self.languages = [(self.arguments.source_dir,
+                           self.arguments.target_dir)]
+        for pair in self.arguments.pairs or []:
+            self.languages.append(tuple(pair))
+        self.courses = [(source_dir, os.path.basename(os.path.normpath(
+            target_dir))) for source_dir, target_dir in self.languages]
+        for source_dir, _ in self.courses:
+            if storage.is_remote(source_dir):
+                raise ValueError('subte-export needs local source '
+                                 'directories.')
+        self.mapping = self.get_mapping()
+        self.writer = FORMATS[self.arguments.format](self.arguments.output)
+
+    def handle(self):
+        pool = multiprocessing.Pool(max(1, self.arguments.jobs))
+        batch = []
+        try:
+            for path, rows, error in self.parse(pool):
+                if error is not None:
+                    self.stats['errors'] += 1
+                    self.errors.append({'source': path, 'error': error})
+                    logging.error('%s', error, extra={
+                        'operation': 'export', 'source': path,
+                        'error': error})
+                    continue
+                self.stats['files'] += 1
+                self.stats['cues'] += len(rows)
+                batch.extend(rows)
+                if len(batch) >= self.arguments.batch_size:
+                    self.write_batch(batch)
+                    batch = []
+            if batch:
+                self.write_batch(batch)
+        finally:
+            pool.close()
+            pool.join()
+            self.writer.close()
+
+    def finish(self):
+        logging.info('Exported %d cues of %d files, %d errors',
+                     self.stats['cues'], self.stats['files'],
+                     self.stats['errors'])
+        if self.arguments.report:
+            with open(self.arguments.report, 'w') as fd:
+                json.dump(self.get_report(), fd, indent=2, sort_keys=True)
+
+    def iter_tasks(self):
+        """Yields the ``(path, fields)`` task of each caption of the
+        mapping, in mapping order.
+        """
+        for number, item in self.get_items():
+            for source, filename in self.plan_item(number, item):
+                origin, _ = self.orient(source, filename)
+                fields = (number, item.get('concept'),
+                          parse_filename(filename)['file_type'])
+                for source_dir, course in self.courses:
+                    yield os.path.join(source_dir, origin), (course,) + fields
+
+    def parse(self, pool):
+        """Yields the ``read_rows`` results of every task in order, keeping
+        at most ``PENDING_FILES`` files per job in the pool.
+        """
+        pending = collections.deque()
+        limit = max(1, self.arguments.jobs) * PENDING_FILES
+        for task in self.iter_tasks():
+            pending.append(pool.apply_async(read_rows, (task,)))
+            if len(pending) >= limit:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+
+    def write_batch(self, rows):
+        with self.tracer.span('write_batch', 'export', rows=len(rows)):
+            self.writer.write(rows)
+        self.metrics.counter('subte_export_cues_total',
+                             'Exported caption cues').inc(len(rows))
+
+
+def main():
+    exporter = Exporter()
+    exporter.run()
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,18 @@
 # -*- coding: utf-8 -*-
+import argparse
+import collections
 import json
 import logging
+import multiprocessing
 import os
 import os.path
 import re
 import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
 
 from unicodedata import normalize
 
@@ -13,7 +21,71 @@ try:
 except ImportError:  # pragma: no cover
     from pymongo import Connection as MongoClient  # pragma: no cover
 
-from subte.process import Process, ProcessMode
+try:
+    from pymongo import UpdateOne
+    from pymongo.errors import BulkWriteError
+except ImportError:  # pragma: no cover
+    UpdateOne = BulkWriteError = None  # pragma: no cover
+
+from subte import compression, locality, storage, sync
+from subte.catalog import Catalog
+from subte.linter import LintResults, lint_file
+from subte.process import (AsyncProcess, AsyncProcessMode, Pipeline, Process,
+                           ProcessMode, Sink, Source, Stage)
+
+
+FILE_TYPES = ['lecture', 'answer']
+SHARD_COMMAND = 'from {module} import {name}; {name}().run()'
+"""Runs one shard with the class of the coordinating command."""
+COORDINATOR_OPTIONS = ('--report', '--metrics-file', '--metrics-port',
+                       '--trace', '--memory-profile', '--memory-interval')
+"""Options whose output only the coordinator of a sharded run writes."""
+FILENAME_REGEX = re.compile(r'^(?P<number>\d+)-(?P<flat_concept>[^-]*)-'
+                            r'(?P<file_type>lecture|answer)\.'
+                            r'(?P<extension>[^.]+)$')
+
+
+def parse_filename(filename):
+    """Inverse of ``Generator.get_filename``. Returns a dictionary with the
+    number, flat concept, file type and extension of a generated filename,
+    or ``None`` when it does not follow the naming scheme.
+    """
+    match = FILENAME_REGEX.match(filename)
+    if match is None:
+        return None
+    parts = match.groupdict()
+    parts['number'] = int(parts['number'])
+    return parts
+
+
+def strip_options(argv, options):
+    """Returns ``argv`` without the ``options`` and their values, given as
+    ``--option VALUE`` or ``--option=VALUE``.
+    """
+    result = []
+    skip = False
+    for argument in argv:
+        if skip:
+            skip = False
+        elif argument in options:
+            skip = True
+        elif argument.split('=', 1)[0] not in options:
+            result.append(argument)
+    return result
+
+
+def shard_type(value):
+    """Parses a ``K/N`` shard specification, where ``1 <= K <= N``.
+    """
+    try:
+        index, count = [int(part) for part in value.split('/')]
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            'invalid shard {!r}, expected K/N'.format(value))
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(
+            'invalid shard {!r}, K must be between 1 and N'.format(value))
+    return index, count
 
 
 class JSONMode(ProcessMode):
@@ -40,27 +112,104 @@ class MongoDBMode(ProcessMode):
         subparser.add_argument('uri', type=str, help='MongoDB URI')
         subparser.add_argument('collection', type=str,
                                help='MongoDB collection')
+        subparser.add_argument('-w', '--write-back', type=str, default=None,
+                               metavar='FIELD',
+                               help='Store the generated filenames and status '
+                               'of each document in this field')
+        subparser.add_argument('-b', '--batch-size', type=int, default=1000,
+                               help='Documents per write-back bulk operation')
 
     def initialize(self, arguments):
+        if arguments.write_back and UpdateOne is None:
+            raise ValueError('--write-back requires pymongo 3.0 or later.')
+        self.arguments = arguments
         connection = MongoClient(arguments.uri)
-        db = connection.get_default_database()
-        self.mapping = list(db[arguments.collection].find())
-        connection.disconnect()
+        try:
+            db = connection.get_default_database()
+            self.mapping = list(db[arguments.collection].find())
+        finally:
+            connection.close()
+
+    def write_back(self, results):
+        """Stores ``(_id, filenames, status)`` results in the collection.
+        """
+        connection = MongoClient(self.arguments.uri)
+        try:
+            db = connection.get_default_database()
+            self.write_results(db[self.arguments.collection], results)
+        finally:
+            connection.close()
+
+    def write_results(self, collection, results):
+        field = self.arguments.write_back
+        batch_size = max(1, self.arguments.batch_size)
+        modified = 0
+        for start in xrange(0, len(results), batch_size):
+            requests = [UpdateOne({'_id': _id}, {'$set': {field: {
+                'filenames': filenames,
+                'status': status,
+            }}}) for _id, filenames, status in results[start:start +
+                                                       batch_size]]
+            try:
+                result = collection.bulk_write(requests, ordered=False)
+                modified += result.modified_count or 0
+            except BulkWriteError as e:
+                modified += e.details.get('nModified', 0)
+                for error in e.details.get('writeErrors', []):
+                    logging.error('Write-back failed for %s: %s',
+                                  error['op'].get('q', {}).get('_id'),
+                                  error.get('errmsg'))
+        logging.info('Wrote back %d of %d documents', modified, len(results))
+
+
+class MappingSource(Source):
+
+    def __init__(self, generator):
+        super(MappingSource, self).__init__()
+        self.generator = generator
+
+    def produce(self):
+        return self.generator.get_items()
+
+
+class NameResolver(Stage):
+
+    def __init__(self, generator):
+        super(NameResolver, self).__init__()
+        self.generator = generator
+
+    def process(self, numbered_item):
+        number, item = numbered_item
+        return [(item, self.generator.plan_item(number, item))]
+
+
+class FileSink(Sink):
+
+    def __init__(self, generator, workers=None):
+        super(FileSink, self).__init__(workers)
+        self.generator = generator
+
+    def process(self, planned_item):
+        item, pairs = planned_item
+        self.generator.copy_item(item, pairs)
 
 
 class Generator(Process):
 
     NAME = 'subte-gen'
     MODES = [JSONMode, MongoDBMode]
+    QUEUE_SIZE = 1000
     __FILENAME_FORMAT = '{number:02d}-{flat_concept}-{file_type}.{extension}'
     __FLAT_CONCEPT_REGEX = re.compile(r'[\t !"#$%&\'()*\:\;\-/<=>?@\[\\\]^_`{|'
                                       '},.]+')
 
     def set_arguments(self, parser):
         parser.add_argument('-s', '--source_dir', type=str, required=True,
-                            help='Source captions directory')
+                            help='Source captions directory, or a '
+                            'mongodb:// URI to read from GridFS')
         parser.add_argument('-t', '--target_dir', type=str, required=True,
-                            help='Destination captions directory')
+                            help='Destination captions directory, or an '
+                            's3://BUCKET/PREFIX URL')
         parser.add_argument('-c', '--caption_extension', type=str,
                             default='srt', help='Captions extension')
         parser.add_argument('-r', '--reverse', dest='reverse',
@@ -69,41 +218,434 @@ class Generator(Process):
         parser.add_argument('-f', '--force', dest='force', action='store_true',
                             default=False,
                             help='Force creation of destination directory')
+        parser.add_argument('-p', '--pair', dest='pairs', type=str, nargs=2,
+                            action='append', default=None,
+                            metavar=('SOURCE_DIR', 'TARGET_DIR'),
+                            help='Additional source and destination '
+                            'directories, such as another language')
+        parser.add_argument('--shard', type=shard_type, default=None,
+                            metavar='K/N',
+                            help='Only process the K-th of N mapping shards')
+        parser.add_argument('--shards', type=int, default=None, metavar='N',
+                            help='Run N shards as local subprocesses')
+        parser.add_argument('-o', '--order', type=str, default='mapping',
+                            choices=locality.ORDERS,
+                            help='Order in which files are copied')
+        parser.add_argument('--sync', dest='sync', action='store_true',
+                            default=False,
+                            help='Rename the outputs of renumbered items '
+                            'instead of copying them again, and delete the '
+                            'outputs of removed items')
+        parser.add_argument('--lint', dest='lint', action='store_true',
+                            default=False,
+                            help='Validate the copied captions in worker '
+                            'processes')
+        parser.add_argument('--report', type=str, default=None,
+                            help='Write run statistics and errors as JSON')
+        parser.add_argument('--catalog', type=str, default=None,
+                            metavar='PATH',
+                            help='Record the items and outputs in this '
+                            'SQLite catalog')
+        parser.add_argument('-z', '--compress', type=str, default=None,
+                            choices=compression.COMPRESSIONS,
+                            help='Write the outputs compressed')
+        parser.add_argument('--compress-level', type=int, default=None,
+                            help='Compression level')
+        parser.add_argument('--compress-threads', type=int, default=0,
+                            help='Compression threads per file, zstd only')
+        parser.add_argument('--gridfs-bucket', type=str, default='fs',
+                            help='GridFS bucket of mongodb:// sources')
+        parser.add_argument('--s3-endpoint', type=str, default=None,
+                            help='Endpoint of s3:// targets, defaults to '
+                            '$S3_ENDPOINT or AWS')
+        parser.add_argument('--s3-region', type=str, default=None,
+                            help='Region used to sign s3:// requests')
+        parser.add_argument('--s3-part-size', type=int, default=8,
+                            metavar='MB',
+                            help='Multipart upload part size')
+        parser.add_argument('--shard-report', type=str, default=None,
+                            help=argparse.SUPPRESS)
 
     def prepare(self):
+        self.mapping = self.get_mapping()
+        self._lock = threading.Lock()
+        self.stats = {'copied': 0, 'bytes': 0, 'errors': 0, 'skipped': 0,
+                      'unchanged': 0}
+        self.errors = []
+        self.results = None
+        if getattr(self.arguments, 'write_back', None):
+            self.results = []
+        self.lint = LintResults()
+        self._lint_pool = None
+        self._lint_pending = []
+        if self.arguments.lint:
+            self._lint_pool = multiprocessing.Pool()
+        self.languages = [(self.arguments.source_dir,
+                           self.arguments.target_dir)]
+        for pair in self.arguments.pairs or []:
+            self.languages.append(tuple(pair))
+        self.course = self.get_course(self.arguments.target_dir)
+        self.metrics.const_labels['course'] = self.course
+        self.catalog = None
+        if self.arguments.catalog:
+            self.catalog = Catalog(self.arguments.catalog)
+        if self.arguments.compress:
+            compression.check(self.arguments.compress)
+        if self.arguments.sync and (self.arguments.reverse or
+                                    self.arguments.shard or
+                                    self.arguments.shards):
+            raise ValueError('--sync does not support reverse or sharded '
+                             'runs.')
+        self.sources = {}
+        self.backends = {}
+        for source_dir, target_dir in self.languages:
+            if storage.is_remote(source_dir) and storage.is_remote(target_dir):
+                raise ValueError('Remote sources need a local target '
+                                 'directory.')
+            if self.arguments.sync and storage.is_remote(target_dir):
+                raise ValueError('--sync needs local target directories.')
+            self.sources[source_dir] = storage.get_source(source_dir,
+                                                          self.arguments)
+            self.backends[target_dir] = storage.get_backend(target_dir,
+                                                            self.arguments)
+            if (self.arguments.force and not storage.is_remote(target_dir) and
+               not os.path.exists(target_dir)):
+                os.makedirs(target_dir)
+
+    def handle(self):
+        if self.arguments.shards and not self.arguments.shard:
+            self.coordinate(self.arguments.shards)
+            return
+        if self.arguments.sync:
+            self.synchronize()
+            return
+        if self.arguments.order == 'mapping':
+            self.get_pipeline().run()
+            return
+        planned = [(item, self.plan_item(number, item))
+                   for number, item in self.get_items()]
+        copied = self.copy_files([pair for _, pairs in planned
+                                  for pair in pairs])
+        for item, pairs in planned:
+            self.record_item(item, pairs, [filename
+                                           for source, filename in pairs
+                                           if (source, filename) in copied])
+
+    def synchronize(self):
+        """Brings the target directories up to date with the mapping.
+        Outputs of renumbered items are renamed, new or modified ones are
+        copied and the outputs of removed items are deleted.
+        """
+        planned = [(item, self.plan_item(number, item))
+                   for number, item in self.get_items()]
+        pairs = [pair for _, pairs in planned for pair in pairs]
+        failed = set()
+        for directories in self.languages:
+            failed.update(self.synchronize_directory(pairs, directories))
+        for item, pairs in planned:
+            self.record_item(item, pairs, [filename
+                                           for source, filename in pairs
+                                           if (source, filename) not in
+                                           failed])
+
+    def synchronize_directory(self, pairs, directories):
+        """Synchronizes one target directory with the ``(source,
+        filename)`` pairs and returns the pairs that failed to copy.
+
+        Outputs are matched to the pairs by the digest of their content and
+        their compression, so an output is only kept or renamed when it
+        holds what copying its source would write. Outputs whose source
+        cannot be read are left as they are. Outputs of no pair are deleted
+        before the renames, and mismatched outputs in the way of a rename
+        are moved aside and deleted once the renames succeed.
+        """
+        source_dir, target_dir = directories
+        codec = self.arguments.compress
+        suffix = compression.SUFFIXES.get(codec, '')
+        outputs = collections.OrderedDict((filename + suffix,
+                                           (source, filename))
+                                          for source, filename in pairs)
+        if not os.path.isdir(target_dir):
+            os.makedirs(target_dir)
+        wanted = {}
+        failed = set()
+        for name, (source, filename) in outputs.items():
+            try:
+                wanted[name] = self.source_key(source_dir, source, codec)
+            except (IOError, OSError) as e:
+                failed.add((source, filename))
+                self.count('errors')
+                self.errors.append({'source': source, 'destination': name,
+                                    'target_dir': target_dir,
+                                    'error': str(e)})
+                self.metrics.counter('subte_copy_errors_total',
+                                     'Failed caption copies').inc()
+                logging.error('%s, keeping %s', e, name, extra={
+                    'operation': 'sync', 'source': source,
+                    'destination': name, 'error': str(e)})
+        found = dict((name, self.output_key(target_dir, name))
+                     for name in os.listdir(target_dir)
+                     if self.is_output(name) and
+                     (name in wanted or name not in outputs))
+        renames, missing, stale = sync.plan_moves(
+            [name for name in outputs if name in wanted], sorted(found),
+            wanted.get, found.get)
+        targets = set(new for _, new in renames)
+        aside = [(name, sync.temporary_name(name)) for name in sorted(stale)
+                 if name in targets]
+        removed = []
+        for name in sorted(stale):
+            if name not in wanted and self.delete_output(target_dir, name):
+                removed.append(name)
+        sync.apply_moves(target_dir, aside + sync.order_moves(renames))
+        for name, moved in aside:
+            self.delete_output(target_dir, moved)
+        for old, new in renames:
+            removed.append(old)
+            logging.info('Renamed %s to %s', old, new, extra={
+                'operation': 'rename', 'source': old, 'destination': new})
+        self.count('renamed', len(renames))
+        if self.catalog is not None:
+            self.catalog.delete_outputs(target_dir, removed)
+        missing = set(missing)
+        for name, (source, filename) in outputs.items():
+            if name in missing:
+                if not self.copy_file(source, filename, directories):
+                    failed.add((source, filename))
+            elif (self.catalog is not None and
+                  os.path.exists(os.path.join(target_dir, name))):
+                self.catalog_output(source, name, source_dir, target_dir,
+                                    os.path.getsize(os.path.join(target_dir,
+                                                                 name)))
+        return failed
+
+    def delete_output(self, target_dir, name):
+        """Deletes an output of ``target_dir`` and returns whether it
+        succeeded.
+        """
+        try:
+            os.remove(os.path.join(target_dir, name))
+        except OSError as e:
+            self.count('errors')
+            logging.error('%s', e, extra={
+                'operation': 'delete', 'destination': name, 'error': str(e)})
+            return False
+        self.count('deleted')
+        logging.info('Deleted %s', name, extra={
+            'operation': 'delete', 'destination': name})
+        return True
+
+    def is_output(self, name):
+        """Returns whether ``name``, compressed or not, follows the naming
+        scheme of the outputs.
+        """
+        codec = compression.detect(name)
+        if codec is not None:
+            name = name[:-len(compression.SUFFIXES[codec])]
+        parts = parse_filename(name)
+        return (parts is not None and
+                parts['extension'] == self.arguments.caption_extension)
+
+    def source_key(self, source_dir, source, codec):
+        """Returns the ``(digest, codec)`` an output of ``source`` written
+        with ``codec`` would have.
+        """
+        if storage.is_remote(source_dir):
+            stream = self.sources[source_dir].open(source)
+            try:
+                return storage.stream_digest(stream), codec
+            finally:
+                stream.close()
+        path, _ = compression.resolve(os.path.join(source_dir, source))
+        return storage.content_digest(path), codec
+
+    def output_key(self, target_dir, name):
+        """Returns the digest of the decompressed content of an output and
+        its codec, or ``None`` when it cannot be read.
+        """
+        try:
+            return (storage.content_digest(os.path.join(target_dir, name)),
+                    compression.detect(name))
+        except (IOError, OSError):
+            return None
+
+    def get_pipeline(self):
+        """Returns the mapping source, name resolver and file sink pipeline,
+        with one sink worker per job.
+        """
+        return Pipeline([MappingSource(self), NameResolver(self),
+                         FileSink(self, self.arguments.jobs)],
+                        self.QUEUE_SIZE, self.metrics)
+
+    def copy_files(self, pairs):
+        """Copies ``(source, filename)`` pairs for every language sorted by
+        the locality of their origin on disk, and returns the set of pairs
+        copied for all of them.
+        """
+        keyed = []
+        for pair in pairs:
+            for directories in self.languages:
+                origin = os.path.join(directories[0], self.orient(*pair)[0])
+                keyed.append((locality.locality_key(origin,
+                                                    self.arguments.order),
+                              origin, pair, directories))
+        keyed.sort()
+        failed = set()
+        for index, (_, _, pair, directories) in enumerate(keyed):
+            if index + 1 < len(keyed):
+                locality.advise_willneed(keyed[index + 1][1])
+            if not self.copy_file(pair[0], pair[1], directories):
+                failed.add(pair)
+        return set(pairs) - failed
+
+    def finish(self):
+        if self._lint_pool is not None:
+            try:
+                for result in self._lint_pending:
+                    self.lint.add(*result.get())
+            finally:
+                self._lint_pool.close()
+                self._lint_pool.join()
+        for backend in (getattr(self, 'sources', {}).values() +
+                        getattr(self, 'backends', {}).values()):
+            backend.close()
+        if getattr(self, 'catalog', None) is not None:
+            if not self.arguments.shard and not self.arguments.shards:
+                for _, target_dir in self.languages:
+                    self.catalog.prune(self.get_course(target_dir))
+            self.catalog.close()
+        if self.results:
+            self.current_mode.write_back(self.results)
+        for path in (self.arguments.report, self.arguments.shard_report):
+            if path:
+                with open(path, 'w') as fd:
+                    json.dump(self.get_report(), fd, indent=2, sort_keys=True)
+
+    def get_mapping(self):
         if not hasattr(self.current_mode, 'mapping'):
             raise ValueError('current_mode must have a mapping attribute.')
-        self.mapping = self.current_mode.mapping
-        if (self.arguments.force and
-           not os.path.exists(self.arguments.target_dir)):
-            os.makedirs(self.arguments.target_dir)
+        return self.current_mode.mapping
 
-    def handle(self):
+    def get_items(self):
+        """Yields the ``(number, item)`` pairs of the current shard. Numbers
+        always come from the position in the whole mapping.
+        """
+        shard = self.arguments.shard
+        items = self.metrics.gauge('subte_mapping_items',
+                                   'Items in the captions mapping')
         for index, item in enumerate(self.mapping):
-            self.process_item(index + 1, item)
+            items.set(index + 1)
+            if shard is None or index % shard[1] == shard[0] - 1:
+                yield index + 1, item
+
+    def count(self, key, amount=1):
+        with self._lock:
+            self.stats[key] = self.stats.get(key, 0) + amount
+
+    def get_report(self):
+        report = {'stats': self.stats, 'errors': self.errors}
+        if self.arguments.lint:
+            report['lint'] = self.lint.issues
+        return report
+
+    def coordinate(self, count):
+        """Runs ``count`` shards of this command as subprocesses and merges
+        their reports.
+        """
+        directory = tempfile.mkdtemp(prefix='subte-shards-')
+        try:
+            shards = []
+            for index in xrange(1, count + 1):
+                report = os.path.join(directory, '{}.json'.format(index))
+                command = [sys.executable, '-c', SHARD_COMMAND.format(
+                    module=self.__class__.__module__,
+                    name=self.__class__.__name__),
+                    '--shard', '{}/{}'.format(index, count),
+                    '--shard-report', report] + strip_options(
+                        self.argv, COORDINATOR_OPTIONS)
+                shards.append((index, report, subprocess.Popen(command)))
+            for index, report, shard in shards:
+                failure = None
+                if shard.wait() != 0:
+                    failure = 'exited with status {}'.format(shard.returncode)
+                if os.path.exists(report):
+                    with open(report) as fd:
+                        self.merge_report(json.load(fd))
+                elif failure is None:
+                    failure = 'missing report'
+                if failure is not None:
+                    self.count('errors')
+                    self.errors.append({'shard': index, 'error': failure})
+                    self.metrics.counter('subte_shard_failures_total',
+                                         'Shards that failed').inc()
+                    logging.error('Shard %d/%d failed: %s', index, count,
+                                  failure, extra={'operation': 'shard',
+                                                  'error': failure})
+        finally:
+            shutil.rmtree(directory)
+        for key, name in [('copied', 'subte_files_copied_total'),
+                          ('bytes', 'subte_bytes_copied_total'),
+                          ('errors', 'subte_copy_errors_total')]:
+            self.metrics.counter(name, 'Merged from {} shards'.format(
+                count)).inc(self.stats[key])
+        logging.info('Merged %d shards: %d copied, %d errors', count,
+                     self.stats['copied'], self.stats['errors'])
+
+    def merge_report(self, report):
+        for key, value in report['stats'].items():
+            self.stats[key] = self.stats.get(key, 0) + value
+        self.errors.extend(report['errors'])
+        for path, issues in report.get('lint', {}).items():
+            self.lint.add(path, issues)
 
     def process_item(self, number, item):
-        has_lecture = 'lecture' in item
-        has_answer = 'answer' in item
-        if not has_lecture and not has_answer:
-            logging.warning('"{}" has not lecture and answer.'.format(
-                item['concept']))
-            return
-        flat_concept = self.get_flat_concept(item['concept'])
-        if has_lecture != has_answer:
-            file_type = 'lecture' if has_lecture else 'answer'
-            source = '{}.{}'.format(item[file_type],
-                                    self.arguments.caption_extension)
-            filename = self.get_filename(number, flat_concept, file_type)
-            self.copy_file(source, filename)
+        self.copy_item(item, self.plan_item(number, item))
+
+    def copy_item(self, item, pairs):
+        filenames = []
+        for source, filename in pairs:
+            copied = [self.copy_file(source, filename, directories)
+                      for directories in self.languages]
+            if all(copied):
+                filenames.append(filename)
+        self.record_item(item, pairs, filenames)
+
+    def record_item(self, item, pairs, filenames):
+        """Records the outcome of an item given its planned pairs and the
+        filenames actually copied.
+        """
+        if not pairs:
+            self.count('skipped')
+            status = 'skipped'
+        elif len(filenames) < len(pairs):
+            status = 'error'
         else:
-            for file_type in ['lecture', 'answer']:
-                if file_type in item:
-                    source = '{}.{}'.format(item[file_type],
-                                            self.arguments.caption_extension)
-                    filename = self.get_filename(number, flat_concept,
-                                                 file_type)
-                    self.copy_file(source, filename)
+            status = 'ok'
+        if self.results is not None and '_id' in item:
+            self.results.append((item['_id'], filenames, status))
+        if self.catalog is not None and pairs:
+            parts = parse_filename(pairs[0][1])
+            for _, target_dir in self.languages:
+                self.catalog.add_item(self.get_course(target_dir),
+                                      parts['number'], item.get('concept'),
+                                      parts['flat_concept'], status)
+
+    def plan_item(self, number, item):
+        """Returns the ``(source, filename)`` pairs to copy for an item.
+        """
+        if 'lecture' not in item and 'answer' not in item:
+            logging.warning('"%s" has not lecture and answer.',
+                            item['concept'], extra={'operation': 'skip'})
+            return []
+        flat_concept = self.get_flat_concept(item['concept'])
+        pairs = []
+        for file_type in FILE_TYPES:
+            if file_type in item:
+                source = '{}.{}'.format(item[file_type],
+                                        self.arguments.caption_extension)
+                filename = self.get_filename(number, flat_concept, file_type)
+                pairs.append((source, filename))
+        return pairs
 
     def get_flat_concept(self, concept):
         result = []
@@ -121,20 +663,192 @@ class Generator(Process):
             'extension': self.arguments.caption_extension
         })
 
-    def copy_file(self, origin, destination):
+    def orient(self, origin, destination):
+        """Swaps ``origin`` and ``destination`` when running in reverse.
+        """
         if self.arguments.reverse:
-            destination, origin = origin, destination
+            return destination, origin
+        return origin, destination
+
+    def get_course(self, target_dir):
+        """Returns the course of a target directory, its base name.
+        """
+        return os.path.basename(os.path.normpath(target_dir))
+
+    def label(self, target_dir, name):
+        """Returns how reports name the ``name`` output of ``target_dir``:
+        the bare name, or ``COURSE/name`` when the run writes several target
+        directories.
+        """
+        if len(self.languages) == 1:
+            return name
+        return '{}/{}'.format(self.get_course(target_dir), name)
+
+    def copy_file(self, origin, destination, directories=None):
+        """Copies ``origin`` to ``destination`` between the ``(source_dir,
+        target_dir)`` directories, which default to the command line ones.
+        The source directory reader and the target directory backend
+        stream the file, in a ``copy_file`` trace span. Compressed origins
+        are read transparently.
+        """
+        with self.tracer.span('copy_file', origin=origin,
+                              destination=destination):
+            return self._copy_file(origin, destination, directories)
+
+    def _copy_file(self, origin, destination, directories):
+        source_dir, target_dir = directories or (self.arguments.source_dir,
+                                                 self.arguments.target_dir)
+        origin, destination = self.orient(origin, destination)
+        compress = self.arguments.compress
+        if compress:
+            destination += compression.SUFFIXES[compress]
+        start = time.time()
         try:
-            shutil.copy(os.path.join(self.arguments.source_dir, origin),
-                        os.path.join(self.arguments.target_dir, destination))
-            logging.info('Copied {} to {}'.format(origin, destination))
-        except IOError as e:
-            logging.error(e)
+            backend = self.backends[target_dir]
+            if storage.is_remote(source_dir):
+                source = None
+                stream = self.sources[source_dir].open(origin)
+            else:
+                source, codec = compression.resolve(
+                    os.path.join(source_dir, origin))
+                stream = (None if codec == compress else
+                          compression.open_file(source))
+            if stream is None:
+                size, written = backend.copy(source, destination)
+            else:
+                try:
+                    size, written = backend.write(
+                        stream, destination, compress,
+                        self.arguments.compress_level,
+                        self.arguments.compress_threads)
+                finally:
+                    stream.close()
+            if self._lint_pool is not None:
+                if not storage.is_remote(target_dir):
+                    source = os.path.join(target_dir, destination)
+                self._lint_pending.append(self._lint_pool.apply_async(
+                    lint_file, (source,)))
+        except (IOError, OSError) as e:
+            duration = time.time() - start
+            self.count('errors')
+            self.errors.append({'source': origin, 'destination': destination,
+                                'target_dir': target_dir, 'error': str(e)})
+            self.metrics.counter('subte_copy_errors_total',
+                                 'Failed caption copies').inc()
+            logging.error('%s', e, extra={
+                'operation': 'copy',
+                'source': origin,
+                'destination': destination,
+                'duration': duration,
+                'error': str(e),
+            })
+            return False
+        duration = time.time() - start
+        if self.catalog is not None:
+            self.catalog_output(origin, destination, source_dir, target_dir,
+                                size)
+        if not written:
+            self.count('unchanged')
+            self.metrics.counter('subte_files_unchanged_total',
+                                 'Caption files already up to date').inc()
+            logging.debug('Unchanged %s', destination, extra={
+                'operation': 'skip',
+                'source': origin,
+                'destination': destination,
+                'duration': duration,
+            })
+            return True
+        self.count('copied')
+        self.count('bytes', size)
+        self.metrics.counter('subte_files_copied_total',
+                             'Copied caption files').inc()
+        self.metrics.counter('subte_bytes_copied_total',
+                             'Copied caption bytes').inc(size)
+        self.metrics.histogram('subte_copy_duration_seconds',
+                               'Caption copy latency').observe(duration)
+        logging.info('Copied %s to %s', origin, destination, extra={
+            'operation': 'copy',
+            'source': origin,
+            'destination': destination,
+            'bytes': size,
+            'duration': duration,
+        })
+        return True
+
+    def catalog_output(self, origin, destination, source_dir, target_dir,
+                       size):
+        """Records a copied file in the catalog, with the digest of the
+        output when it is local.
+        """
+        generated = origin if self.arguments.reverse else destination
+        codec = compression.detect(generated)
+        if codec is not None:
+            generated = generated[:-len(compression.SUFFIXES[codec])]
+        parts = parse_filename(generated) or {}
+        digest = None
+        if not storage.is_remote(target_dir):
+            digest = storage.file_digest(os.path.join(target_dir,
+                                                      destination))
+        self.catalog.add_output(target_dir, destination,
+                                self.get_course(target_dir),
+                                parts.get('number'), parts.get('file_type'),
+                                source_dir, origin, size, digest)
+
+
+class AsyncJSONMode(AsyncProcessMode, JSONMode):
+
+    def load(self, arguments):
+        with open(arguments.file) as fd:
+            mapping = json.loads(fd.read())
+        for item in mapping:
+            yield item
+
+
+class AsyncMongoDBMode(AsyncProcessMode, MongoDBMode):
+
+    def initialize(self, arguments):
+        if arguments.write_back and UpdateOne is None:
+            raise ValueError('--write-back requires pymongo 3.0 or later.')
+        super(AsyncMongoDBMode, self).initialize(arguments)
+
+    def load(self, arguments):
+        connection = MongoClient(arguments.uri)
+        try:
+            db = connection.get_default_database()
+            for document in db[arguments.collection].find():
+                yield document
+        finally:
+            connection.close()
+
+
+class AsyncGenerator(AsyncProcess, Generator):
+    """Generator that copies the mapping items while they are still being
+    loaded, offloading each copy to the worker threads.
+    """
+
+    MODES = [AsyncJSONMode, AsyncMongoDBMode]
+
+    def get_mapping(self):
+        return self.current_mode.iter_items()
+
+    def handle(self):
+        if ((self.arguments.shards and not self.arguments.shard) or
+           self.arguments.sync or self.arguments.order != 'mapping'):
+            super(AsyncGenerator, self).handle()
+            return
+        for number, item in self.get_items():
+            self.submit(self.process_item, number, item)
+        self.join()
 
 
 def main():
     generator = Generator()
     generator.run()
 
+
+def main_async():
+    generator = AsyncGenerator()
+    generator.run()
+
 if __name__ == '__main__':
     main()
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+import os
+import sys
+
+try:
+    from pymongo import MongoClient
+    from pymongo.errors import BulkWriteError
+except ImportError:  # pragma: no cover
+    MongoClient = BulkWriteError = None  # pragma: no cover
+
+from subte.generator import parse_filename
+from subte.process import Process, ProcessMode
+
+
+def scan_captions(directory, extension='srt'):
+    """Groups the generated captions of ``directory`` into mapping items,
+    ordered by number. Returns the items and the filenames that do not
+    follow the naming scheme.
+
+    The lecture and answer references are the filenames without extension,
+    so generating from ``directory`` reproduces the same names.
+    """
+    items = {}
+    unparsed = []
+    for filename in os.listdir(directory):
+        parts = parse_filename(filename)
+        if parts is None or parts['extension'] != extension:
+            unparsed.append(filename)
+            continue
+        key = parts['number'], parts['flat_concept']
+        item = items.get(key)
+        if item is None:
+            item = items[key] = {
+                'number': parts['number'],
+                'concept': parts['flat_concept'].replace('_', ' '),
+            }
+        item[parts['file_type']] = filename[:-len(extension) - 1]
+    return [items[group] for group in sorted(items)], sorted(unparsed)
+
+
+class JSONLinesMode(ProcessMode):
+
+    SUBCOMMAND = 'jsonl'
+    HELPTEXT = 'Write the mapping as JSON Lines'
+    DESCRIPTION = 'JSON Lines mode'
+
+    def set_arguments(self, subparser):
+        subparser.add_argument('-o', '--output', type=str, default=None,
+                               help='Output file, defaults to the standard '
+                               'output')
+
+    def initialize(self, arguments):
+        self.arguments = arguments
+
+    def write(self, items):
+        fd = (open(self.arguments.output, 'w') if self.arguments.output
+              else sys.stdout)
+        try:
+            for item in items:
+                fd.write(json.dumps(item, sort_keys=True) + '\n')
+        finally:
+            if fd is not sys.stdout:
+                fd.close()
+        return len(items)
+
+
+class MongoDBMode(ProcessMode):
+
+    SUBCOMMAND = 'db'
+    HELPTEXT = 'Insert the mapping into a MongoDB collection'
+    DESCRIPTION = 'MongoDB database mode'
+
+    def set_arguments(self, subparser):
+        subparser.add_argument('uri', type=str, help='MongoDB URI')
+        subparser.add_argument('collection', type=str,
+                               help='MongoDB collection')
+        subparser.add_argument('-b', '--batch-size', type=int, default=1000,
+                               help='Documents per bulk insert')
+
+    def initialize(self, arguments):
+        if BulkWriteError is None:
+            raise ValueError('The db mode requires pymongo 3.0 or later.')
+        self.arguments = arguments
+
+    def write(self, items):
+        connection = MongoClient(self.arguments.uri)
+        try:
+            db = connection.get_default_database()
+            return self.insert_items(db[self.arguments.collection], items)
+        finally:
+            connection.close()
+
+    def insert_items(self, collection, items):
+        batch_size = max(1, self.arguments.batch_size)
+        inserted = 0
+        for start in xrange(0, len(items), batch_size):
+            batch = items[start:start + batch_size]
+            try:
+                collection.insert_many(batch, ordered=False)
+                inserted += len(batch)
+            except BulkWriteError as e:
+                inserted += e.details.get('nInserted', 0)
+                for error in e.details.get('writeErrors', []):
+                    logging.error('Insert failed for %s: %s',
+                                  error.get('op', {}).get('concept'),
+                                  error.get('errmsg'))
+        return inserted
+
+
+class Importer(Process):
+    """Builds a captions mapping from a directory of generated captions.
+    """
+
+    NAME = 'subte-import'
+    MODES = [JSONLinesMode, MongoDBMode]
+
+    def set_arguments(self, parser):
+        parser.add_argument('directory', type=str,
+                            help='Generated captions directory')
+        parser.add_argument('-c', '--caption_extension', type=str,
+                            default='srt', help='Captions extension')
+
+    def handle(self):
+        items, unparsed = scan_captions(self.arguments.directory,
+                                        self.arguments.caption_extension)
+        for filename in unparsed:
+            logging.warning('Ignored %s', filename, extra={
+                'operation': 'import', 'source': filename,
+                'error': 'unparsed'})
+        expected = 1
+        for item in items:
+            if item['number'] != expected:
+                logging.warning('Item %d follows item %d', item['number'],
+                                expected - 1, extra={'operation': 'import'})
+            expected = item['number'] + 1
+        written = self.current_mode.write(items)
+        logging.info('Imported %d of %d items from %s', written, len(items),
+                     self.arguments.directory)
+
+
+def main():
+    importer = Importer()
+    importer.run()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,558 @@
+# -*- coding: utf-8 -*-
+import heapq
+import json
+import logging
+import mmap
+import os
+import os.path
+import re
+import struct
+import sys
+import tempfile
+
+from subte import compression
+from subte.captions import CaptionError, format_timestamp, iter_cues
+from subte.generator import parse_filename
+from subte.process import Process, ProcessMode
+
+MAGIC = 'SUBTEIX3'
+HEADER = struct.Struct('<8sIIIQQQQQQQ')
+TERM = struct.Struct('<IIQI')
+POSTING = struct.Struct('<II')
+CUE = struct.Struct('<IIIQI')
+DOC = struct.Struct('<QII')
+
+MANIFEST = 'manifest.json'
+MANIFEST_VERSION = 3
+SEGMENT_CUES = 500000
+"""Cues buffered in memory before a segment is written."""
+MAX_SEGMENTS = 8
+"""Segments below ``SEGMENT_CUES`` cues allowed before they are merged."""
+
+TOKEN_REGEX = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    return [token.encode('utf-8')
+            for token in TOKEN_REGEX.findall(text.lower())]
+
+
+def doc_key(doc):
+    """Returns what search results are sorted by before the cue start.
+    """
+    return doc['course'], doc['number'], doc['file_type']
+
+
+def _write_atomic(path, data):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path),
+                                    suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            tmp.write(data)
+        os.rename(tmp_path, path)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+
+
+class SegmentWriter(object):
+    """Accumulates documents and cues, and writes them as one immutable
+    segment file.
+    """
+
+    def __init__(self):
+        self.docs = []
+        self.cues = []
+        self.postings = {}
+
+    def add_document(self, doc):
+        self.docs.append(doc)
+        return len(self.docs) - 1
+
+    def add_cue(self, doc_id, start, end, text):
+        cue_id = len(self.cues)
+        self.cues.append((doc_id, start, end, text.encode('utf-8')))
+        for position, term in enumerate(tokenize(text)):
+            self.postings.setdefault(term, []).append((cue_id, position))
+
+    def write(self, path):
+        terms = sorted(self.postings)
+        terms_blob = ''.join(terms)
+        term_table = []
+        postings = []
+        term_offset = posting_offset = 0
+        for term in terms:
+            term_postings = self.postings[term]
+            term_table.append(TERM.pack(term_offset, len(term),
+                                        posting_offset, len(term_postings)))
+            term_offset += len(term)
+            for posting in term_postings:
+                postings.append(POSTING.pack(*posting))
+            posting_offset += len(term_postings) * POSTING.size
+        cue_table = []
+        text_offset = 0
+        for doc_id, start, end, text in self.cues:
+            cue_table.append(CUE.pack(doc_id, start, end, text_offset,
+                                      len(text)))
+            text_offset += len(text)
+        ranks = dict((key, rank) for rank, key in enumerate(
+            sorted(set(doc_key(doc) for doc in self.docs))))
+        doc_table = []
+        docs = []
+        doc_offset = 0
+        for doc in self.docs:
+            data = json.dumps(doc, sort_keys=True, separators=(',', ':'))
+            doc_table.append(DOC.pack(doc_offset, len(data),
+                                      ranks[doc_key(doc)]))
+            docs.append(data)
+            doc_offset += len(data)
+        sections = [terms_blob, ''.join(term_table), ''.join(postings),
+                    ''.join(cue_table), ''.join(doc_table), ''.join(docs)]
+        offsets = []
+        offset = HEADER.size
+        for section in sections:
+            offsets.append(offset)
+            offset += len(section)
+        offsets.append(offset)
+        header = HEADER.pack(MAGIC, len(terms), len(self.cues),
+                             len(self.docs), *offsets)
+        _write_atomic(path, ''.join([header] + sections +
+                                    [text for _, _, _, text in self.cues]))
+
+
+class Segment(object):
+    """Memory-mapped segment with binary searchable terms.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as fd:
+            self.data = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+        if (len(self.data) < HEADER.size or
+           HEADER.unpack_from(self.data)[0] != MAGIC):
+            self.data.close()
+            raise ValueError('{} is not an index segment.'.format(path))
+        (_, self.term_count, self.cue_count, self.doc_count,
+         self.terms_offset, self.term_table_offset, self.postings_offset,
+         self.cue_table_offset, self.doc_table_offset, self.docs_offset,
+         self.text_offset) = HEADER.unpack_from(self.data)
+
+    def close(self):
+        self.data.close()
+
+    def _entry(self, index):
+        offset, length, postings, count = TERM.unpack_from(
+            self.data, self.term_table_offset + index * TERM.size)
+        start = self.terms_offset + offset
+        return self.data[start:start + length], postings, count
+
+    def _lower_bound(self, term):
+        low, high = 0, self.term_count
+        while low < high:
+            middle = (low + high) // 2
+            if self._entry(middle)[0] < term:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _postings(self, offset, count):
+        values = struct.unpack_from('<{}I'.format(count * 2), self.data,
+                                    self.postings_offset + offset)
+        return zip(values[::2], values[1::2])
+
+    def _posting(self, offset, index):
+        return POSTING.unpack_from(self.data, self.postings_offset + offset +
+                                   index * POSTING.size)
+
+    def _postings_in(self, offset, count, cue_ids):
+        """Returns the postings of the ``cue_ids`` sorted ids in a run of
+        ``count`` postings, binary searching the run when there are few
+        ids.
+        """
+        if len(cue_ids) * max(1, count.bit_length()) >= count:
+            wanted = set(cue_ids)
+            return [posting for posting in self._postings(offset, count)
+                    if posting[0] in wanted]
+        result = []
+        low = 0
+        for cue_id in cue_ids:
+            high = count
+            while low < high:
+                middle = (low + high) // 2
+                if self._posting(offset, middle)[0] < cue_id:
+                    low = middle + 1
+                else:
+                    high = middle
+            while low < count:
+                posting = self._posting(offset, low)
+                if posting[0] != cue_id:
+                    break
+                result.append(posting)
+                low += 1
+        return result
+
+    def runs(self, term, prefix=False):
+        """Returns the ``(offset, count)`` posting runs of ``term``, or of
+        every term starting with it when ``prefix`` is true.
+        """
+        result = []
+        index = self._lower_bound(term)
+        while index < self.term_count:
+            entry, offset, count = self._entry(index)
+            if entry != term and not (prefix and entry.startswith(term)):
+                break
+            result.append((offset, count))
+            index += 1
+        return result
+
+    def postings(self, term, prefix=False):
+        """Returns the ``(cue_id, position)`` postings of ``term``, or of
+        every term starting with it when ``prefix`` is true.
+        """
+        result = []
+        for offset, count in self.runs(term, prefix):
+            result.extend(self._postings(offset, count))
+        return result
+
+    def timing(self, cue_id):
+        """Returns the document id, start and end of a cue.
+        """
+        return CUE.unpack_from(self.data, self.cue_table_offset +
+                               cue_id * CUE.size)[:3]
+
+    def cue(self, cue_id):
+        doc_id, start, end, offset, length = CUE.unpack_from(
+            self.data, self.cue_table_offset + cue_id * CUE.size)
+        offset += self.text_offset
+        return (doc_id, start, end,
+                self.data[offset:offset + length].decode('utf-8'))
+
+    def doc(self, doc_id):
+        offset, length, _ = DOC.unpack_from(
+            self.data, self.doc_table_offset + doc_id * DOC.size)
+        offset += self.docs_offset
+        return json.loads(self.data[offset:offset + length])
+
+    def rank(self, doc_id):
+        """Returns the position of the ``doc_key`` of a document among the
+        ones of the segment.
+        """
+        return DOC.unpack_from(self.data, self.doc_table_offset +
+                               doc_id * DOC.size)[2]
+
+    def search(self, tokens, prefix=False):
+        """Returns the ids of the cues containing ``tokens`` as a phrase.
+
+        Tokens are intersected from the one with the fewest postings, and
+        the postings of the others are only read for the remaining cues.
+        """
+        terms = []
+        for index, token in enumerate(tokens):
+            runs = self.runs(token, prefix and index == len(tokens) - 1)
+            terms.append((sum(count for _, count in runs), index, runs))
+        matches = None
+        for _, index, runs in sorted(terms):
+            positions = {}
+            for offset, count in runs:
+                if matches is None:
+                    postings = self._postings(offset, count)
+                else:
+                    postings = self._postings_in(offset, count,
+                                                 sorted(matches))
+                for cue_id, position in postings:
+                    positions.setdefault(cue_id, set()).add(position - index)
+            if matches is None:
+                matches = positions
+            else:
+                matches = dict((cue_id, starts & positions[cue_id])
+                               for cue_id, starts in matches.items()
+                               if cue_id in positions)
+                matches = dict(pair for pair in matches.items() if pair[1])
+            if not matches:
+                return []
+        return sorted(matches or [])
+
+
+class TranslationIndex(object):
+    """Inverted index of the cue text of generated caption trees.
+
+    The index directory holds immutable segment files, which include the
+    metadata of their documents, and a small manifest with the segment
+    names and the documents deleted since each one was written. Rebuilding
+    only parses new and modified captions, and searching only reads the
+    documents of the hits.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        path = os.path.join(directory, MANIFEST)
+        self.manifest = None
+        if os.path.exists(path):
+            with open(path) as fd:
+                self.manifest = json.load(fd)
+            if self.manifest.get('version') != MANIFEST_VERSION:
+                logging.warning('Index %s has an old format and will be '
+                                'rebuilt', directory)
+                self.manifest = None
+        if self.manifest is None:
+            self.manifest = {'version': MANIFEST_VERSION, 'next_segment': 1,
+                             'segments': []}
+
+    def save(self):
+        _write_atomic(os.path.join(self.directory, MANIFEST),
+                      json.dumps(self.manifest, indent=1, sort_keys=True))
+        names = set(segment['name'] for segment in self.manifest['segments'])
+        for name in os.listdir(self.directory):
+            if name.endswith('.seg') and name[:-4] not in names:
+                os.remove(os.path.join(self.directory, name))
+
+    def scan(self, directories):
+        """Yields the metadata of each generated caption file, using the
+        directory name as the course.
+        """
+        for directory in directories:
+            course = os.path.basename(os.path.normpath(directory))
+            for name in sorted(os.listdir(directory)):
+                codec = compression.detect(name)
+                parts = parse_filename(
+                    name[:-len(compression.SUFFIXES[codec])] if codec
+                    else name)
+                path = os.path.abspath(os.path.join(directory, name))
+                if parts is None or not os.path.isfile(path):
+                    continue
+                stat = os.stat(path)
+                yield {'path': path, 'mtime': stat.st_mtime,
+                       'size': stat.st_size, 'course': course,
+                       'number': parts['number'],
+                       'concept': parts['flat_concept'],
+                       'file_type': parts['file_type']}
+
+    def update(self, directories):
+        """Indexes new and modified captions under ``directories`` and
+        forgets the removed ones. Returns the number of parsed files.
+        """
+        live = {}
+        for entry in self.manifest['segments']:
+            deleted = set(entry['deleted'])
+            segment = Segment(self._segment_path(entry['name']))
+            try:
+                for doc_id in xrange(segment.doc_count):
+                    if doc_id not in deleted:
+                        doc = segment.doc(doc_id)
+                        live[doc['path']] = (entry, doc_id, doc['mtime'],
+                                             doc['size'])
+            finally:
+                segment.close()
+        writer = SegmentWriter()
+        parsed = 0
+        for doc in self.scan(directories):
+            entry, doc_id, mtime, size = live.pop(doc['path'],
+                                                  (None, None, None, None))
+            if entry is not None:
+                if (mtime, size) == (doc['mtime'], doc['size']):
+                    continue
+                entry['deleted'].append(doc_id)
+            if self._add_file(writer, doc):
+                parsed += 1
+            if len(writer.cues) >= SEGMENT_CUES:
+                self._flush(writer)
+                writer = SegmentWriter()
+        for entry, doc_id, _, _ in live.values():
+            entry['deleted'].append(doc_id)
+        self._flush(writer)
+        self.manifest['segments'] = [
+            entry for entry in self.manifest['segments']
+            if len(set(entry['deleted'])) < entry['doc_count']]
+        if len([entry for entry in self.manifest['segments']
+                if not self._is_full(entry)]) > MAX_SEGMENTS:
+            self.compact()
+        self.save()
+        return parsed
+
+    def _add_file(self, writer, doc):
+        doc_id = writer.add_document(doc)
+        try:
+            with compression.open_file(doc['path']) as fd:
+                cues = list(iter_cues(fd))
+        except (IOError, CaptionError) as e:
+            logging.error('Could not index %s: %s', doc['path'], e)
+            writer.docs.pop()
+            return False
+        for cue in cues:
+            writer.add_cue(doc_id, cue.start, cue.end, cue.text)
+        return True
+
+    def _flush(self, writer):
+        if not writer.docs:
+            return
+        name = 'seg-{:06d}'.format(self.manifest['next_segment'])
+        self.manifest['next_segment'] += 1
+        writer.write(self._segment_path(name))
+        self.manifest['segments'].append({'name': name,
+                                          'doc_count': len(writer.docs),
+                                          'cue_count': len(writer.cues),
+                                          'deleted': []})
+
+    def _segment_path(self, name):
+        return os.path.join(self.directory, name + '.seg')
+
+    def _is_full(self, entry):
+        """Returns whether a segment is left out of compactions: it has
+        ``SEGMENT_CUES`` cues and at most half its documents are deleted.
+        """
+        return (entry['cue_count'] >= SEGMENT_CUES and
+                2 * len(set(entry['deleted'])) <= entry['doc_count'])
+
+    def compact(self):
+        """Merges the segments that are not full into segments of about
+        ``SEGMENT_CUES`` cues, dropping deleted documents. Full segments are
+        kept, so compacting holds at most one segment in memory.
+        """
+        merged = [entry for entry in self.manifest['segments']
+                  if not self._is_full(entry)]
+        self.manifest['segments'] = [entry for entry in
+                                     self.manifest['segments']
+                                     if self._is_full(entry)]
+        writer = SegmentWriter()
+        for entry in merged:
+            segment = Segment(self._segment_path(entry['name']))
+            deleted = set(entry['deleted'])
+            doc_ids = {}
+            try:
+                for cue_id in xrange(segment.cue_count):
+                    doc_id, start, end, text = segment.cue(cue_id)
+                    if doc_id in deleted:
+                        continue
+                    if doc_id not in doc_ids:
+                        if len(writer.cues) >= SEGMENT_CUES:
+                            self._flush(writer)
+                            writer = SegmentWriter()
+                            doc_ids = {}
+                        doc_ids[doc_id] = writer.add_document(
+                            segment.doc(doc_id))
+                    writer.add_cue(doc_ids[doc_id], start, end, text)
+            finally:
+                segment.close()
+        self._flush(writer)
+
+    def search(self, query, prefix=False, limit=None):
+        """Returns the cues containing ``query`` as a phrase, as dictionaries
+        with the document metadata and the cue timing and text, sorted by
+        ``doc_key`` and start.
+
+        The hits of each segment are sorted by the document ranks, and the
+        segments are merged lazily, so only the documents of the first
+        ``limit`` hits and of the next hit of each segment are decoded.
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        segments = []
+        streams = []
+        try:
+            for entry in self.manifest['segments']:
+                segment = Segment(self._segment_path(entry['name']))
+                segments.append(segment)
+                deleted = set(entry['deleted'])
+                hits = []
+                for cue_id in segment.search(tokens, prefix):
+                    doc_id, start, _ = segment.timing(cue_id)
+                    if doc_id not in deleted:
+                        hits.append((segment.rank(doc_id), start, cue_id,
+                                     doc_id))
+                hits.sort()
+                streams.append(self._iter_hits(len(streams), segment, hits))
+            result = []
+            for _, _, _, doc, segment, cue_id in heapq.merge(*streams):
+                _, start, end, text = segment.cue(cue_id)
+                result.append(dict(doc, start=start, end=end, text=text))
+                if limit and len(result) >= limit:
+                    break
+            return result
+        finally:
+            for segment in segments:
+                segment.close()
+
+    def _iter_hits(self, index, segment, hits):
+        """Yields the sorted hits of a segment with their sort key, decoding
+        each document once.
+        """
+        docs = {}
+        for position, (_, start, cue_id, doc_id) in enumerate(hits):
+            if doc_id not in docs:
+                docs[doc_id] = segment.doc(doc_id)
+            doc = docs[doc_id]
+            yield (doc_key(doc) + (start,), index, position, doc, segment,
+                   cue_id)
+
+
+class BuildMode(ProcessMode):
+
+    SUBCOMMAND = 'build'
+    HELPTEXT = 'Index new and modified captions'
+    DESCRIPTION = 'Build mode'
+
+    def set_arguments(self, subparser):
+        subparser.add_argument('directories', type=str, nargs='+',
+                               help='Generated captions directories, one '
+                               'per course')
+
+
+class SearchMode(ProcessMode):
+
+    SUBCOMMAND = 'search'
+    HELPTEXT = 'Search a phrase in the indexed captions'
+    DESCRIPTION = 'Search mode'
+
+    def set_arguments(self, subparser):
+        subparser.add_argument('query', type=str, help='Phrase to search, '
+                               'ending with * to match a prefix')
+        subparser.add_argument('-n', '--limit', type=int, default=20,
+                               help='Maximum number of results')
+        subparser.add_argument('--json', dest='json', action='store_true',
+                               default=False, help='Print JSON lines')
+
+
+class Indexer(Process):
+
+    NAME = 'subte-index'
+    MODES = [BuildMode, SearchMode]
+
+    def set_arguments(self, parser):
+        parser.add_argument('-i', '--index', type=str, required=True,
+                            help='Index directory')
+
+    def prepare(self):
+        if not os.path.exists(self.arguments.index):
+            os.makedirs(self.arguments.index)
+        self.index = TranslationIndex(self.arguments.index)
+
+    def handle(self):
+        if self.arguments.subparser_name == 'build':
+            parsed = self.index.update(self.arguments.directories)
+            logging.info('Indexed %d new or modified files', parsed)
+        else:
+            query = self.arguments.query.decode(sys.stdin.encoding or
+                                                'utf-8')
+            prefix = query.endswith('*')
+            for hit in self.index.search(query.rstrip('*'), prefix,
+                                         self.arguments.limit):
+                self.print_hit(hit)
+
+    def print_hit(self, hit):
+        if self.arguments.json:
+            line = json.dumps(hit, sort_keys=True)
+        else:
+            line = u'{}/{} [{}] {}'.format(
+                hit['course'], os.path.basename(hit['path']),
+                format_timestamp(hit['start']),
+                hit['text'].replace(u'\n', u' ')).encode('utf-8')
+        sys.stdout.write(line + '\n')
+
+
+def main():
+    indexer = Indexer()
+    indexer.run()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+import multiprocessing
+import sys
+
+from subte.captions import CaptionError, iter_captions, iter_cues
+from subte.compression import open_file
+from subte.process import Process
+
+
+def lint_file(path):
+    """Returns ``(path, issues)`` for a caption file. Each issue is a
+    dictionary with a ``code``, a ``message`` and the 1-based ``cue`` or
+    ``line`` it refers to.
+
+    The file is streamed through the cue parser, so a parse error ends the
+    checks of the file. Compressed files are decompressed on the fly.
+    """
+    issues = []
+    previous = None
+    position = 0
+    try:
+        with open_file(path) as fd:
+            for position, cue in enumerate(iter_cues(fd), 1):
+                if cue.end <= cue.start:
+                    issues.append({'cue': position, 'code': 'duration',
+                                   'message': 'cue ends before it starts'})
+                if not cue.text.strip():
+                    issues.append({'cue': position, 'code': 'empty-text',
+                                   'message': 'cue has no text'})
+                if previous is not None:
+                    if cue.start < previous.start:
+                        issues.append({'cue': position, 'code': 'order',
+                                       'message': 'cue starts before the '
+                                       'previous one'})
+                    elif cue.start < previous.end:
+                        issues.append({'cue': position, 'code': 'overlap',
+                                       'message': 'cue overlaps the '
+                                       'previous one'})
+                previous = cue
+    except CaptionError as e:
+        issues.append({'line': e.line, 'code': e.code, 'message': str(e)})
+    except IOError as e:
+        issues.append({'code': 'io', 'message': str(e)})
+    else:
+        if not position:
+            issues.append({'code': 'empty', 'message': 'file has no cues'})
+    return path, issues
+
+
+class LintResults(object):
+    """Collects ``lint_file`` results and logs the files with issues.
+    """
+
+    def __init__(self):
+        self.files = 0
+        self.issues = {}
+
+    def add(self, path, issues):
+        self.files += 1
+        if not issues:
+            return
+        self.issues[path] = issues
+        for issue in issues:
+            logging.warning('%s: %s', path, issue['message'], extra={
+                'operation': 'lint', 'destination': path,
+                'error': issue['code']})
+
+    def get_report(self):
+        return {'files': self.files, 'invalid': len(self.issues),
+                'issues': self.issues}
+
+
+class Linter(Process):
+
+    NAME = 'subte-lint'
+
+    def set_arguments(self, parser):
+        parser.add_argument('paths', type=str, nargs='+',
+                            help='Caption files or directories')
+        parser.add_argument('--report', type=str, default=None,
+                            help='Write the issues found as JSON')
+        parser.set_defaults(jobs=multiprocessing.cpu_count())
+
+    def prepare(self):
+        self.results = LintResults()
+
+    def handle(self):
+        pool = multiprocessing.Pool(max(1, self.arguments.jobs))
+        try:
+            for path, issues in pool.imap_unordered(
+                    lint_file, iter_captions(self.arguments.paths), 64):
+                self.results.add(path, issues)
+        finally:
+            pool.close()
+            pool.join()
+        logging.info('Linted %d files, %d with issues', self.results.files,
+                     len(self.results.issues))
+
+    def finish(self):
+        if self.arguments.report:
+            with open(self.arguments.report, 'w') as fd:
+                json.dump(self.results.get_report(), fd, indent=2,
+                          sort_keys=True)
+
+
+def main():
+    linter = Linter()
+    linter.run()
+    results = getattr(linter, 'results', None)
+    sys.exit(0 if results is not None and not results.issues else 1)
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
+import json
 import logging
 import sys
+import threading
 import time
 
 try:
@@ -65,10 +67,119 @@ class LogFormatter(logging.Formatter):
         return formatted.replace("\n", "\n    ")
 
 
-def setup(level):
+class JSONFormatter(logging.Formatter):
+    """Formats each record as one compact JSON object.
+
+    Structured fields passed through ``extra`` are copied to the output
+    object only when present in the record.
+    """
+
+    FIELDS = ('operation', 'source', 'destination', 'bytes', 'duration',
+              'error')
+
+    def format(self, record):
+        try:
+            message = record.getMessage()
+        except Exception as e:
+            message = "Bad message (%r): %r" % (e, record.__dict__)
+        event = {
+            'time': record.created,
+            'level': record.levelname,
+            'module': record.module,
+            'message': message,
+        }
+        for field in self.FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                event[field] = value
+        if record.exc_info:
+            event['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(event, separators=(',', ':'), default=repr)
+
+
+class BatchHandler(logging.Handler):
+    """Formats records into a buffer and writes it to ``stream`` with one
+    ``write`` and one ``flush`` per batch.
+
+    The buffer is written when it holds ``capacity`` records, when a
+    record of ``flush_level`` or higher arrives, every ``interval``
+    seconds from a daemon thread, and when the handler is closed.
+    """
+
+    def __init__(self, stream=None, capacity=1024, flush_level=logging.ERROR,
+                 interval=1.0):
+        logging.Handler.__init__(self)
+        self.stream = stream or sys.stderr
+        self.capacity = capacity
+        self.flush_level = flush_level
+        self.interval = interval
+        self.buffer = []
+        self._stop = threading.Event()
+        self._flusher = None
+        if interval:
+            self._flusher = threading.Thread(target=self._flush_periodically,
+                                             name='log-flusher')
+            self._flusher.daemon = True
+            self._flusher.start()
+
+    def emit(self, record):
+        try:
+            line = self.format(record)
+            if isinstance(line, unicode):
+                line = line.encode('utf-8')
+        except Exception:
+            self.handleError(record)
+            return
+        self.buffer.append(line)
+        if (len(self.buffer) >= self.capacity or
+           record.levelno >= self.flush_level):
+            self.flush()
+
+    def flush(self):
+        self.acquire()
+        try:
+            if self.buffer:
+                self.stream.write('\n'.join(self.buffer) + '\n')
+                self.stream.flush()
+                self.buffer = []
+        finally:
+            self.release()
+
+    def _flush_periodically(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.flush()
+            except Exception:
+                pass
+
+    def close(self):
+        self._stop.set()
+        if self._flusher is not None:
+            self._flusher.join()
+            self._flusher = None
+        try:
+            self.flush()
+        finally:
+            logging.Handler.close(self)
+
+
+LOG_FORMATS = ['text', 'json']
+
+BATCH_CAPACITY = 1024
+"""Number of JSON records buffered before they are written."""
+BATCH_INTERVAL = 1.0
+"""Seconds after which buffered JSON records are written anyway."""
+
+
+def setup(level, log_format='text'):
     root_logger = logging.getLogger()
     root_logger.setLevel(level)
 
-    channel = logging.StreamHandler()
-    channel.setFormatter(LogFormatter())
+    if log_format == 'json':
+        channel = BatchHandler(capacity=BATCH_CAPACITY,
+                               interval=BATCH_INTERVAL)
+        channel.setFormatter(JSONFormatter())
+    else:
+        channel = logging.StreamHandler()
+        channel.setFormatter(LogFormatter())
     root_logger.addHandler(channel)
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+import collections
+import gc
+import json
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+
+try:
+    import tracemalloc
+except ImportError:  # pragma: no cover
+    tracemalloc = None  # pragma: no cover
+
+TRACEBACK_FRAMES = 10
+
+
+def current_rss():
+    """Returns the resident set size of the process in bytes, or ``None``
+    when ``/proc`` is not available.
+    """
+    try:
+        with open('/proc/self/statm') as fd:
+            return int(fd.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError, ValueError, IndexError):
+        return None
+
+
+def peak_rss():
+    """Returns the peak resident set size of the process in bytes.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class MemoryProfiler(object):
+    """Takes memory snapshots at the end of each process phase.
+
+    Snapshots list the top allocation sites and their difference with the
+    previous snapshot when ``tracemalloc`` is available. Otherwise they
+    fall back to counting the live objects tracked by the garbage
+    collector by type. Every snapshot records the current and peak RSS.
+    """
+
+    def __init__(self, top=10, interval=None):
+        self.top = top
+        self.interval = interval
+        self.backend = 'tracemalloc' if tracemalloc is not None else 'gc'
+        self.phases = []
+        self.samples = []
+        self._previous = None
+        self._stop = threading.Event()
+        self._sampler = None
+
+    def start(self):
+        if tracemalloc is not None and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEBACK_FRAMES)
+
+    def stop(self):
+        self.stop_sampler()
+        if tracemalloc is not None and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def snapshot(self, phase):
+        """Records the snapshot of ``phase`` and returns it.
+        """
+        if tracemalloc is not None:
+            current = tracemalloc.take_snapshot()
+            top = [{'site': str(stat.traceback), 'size': stat.size,
+                    'count': stat.count}
+                   for stat in current.statistics('lineno')[:self.top]]
+            diff = []
+            if self._previous is not None:
+                diff = [{'site': str(stat.traceback),
+                         'size': stat.size_diff, 'count': stat.count_diff}
+                        for stat in current.compare_to(
+                            self._previous, 'lineno')[:self.top]]
+        else:
+            current = collections.Counter(type(value).__name__
+                                          for value in gc.get_objects())
+            top = [{'site': site, 'count': count}
+                   for site, count in current.most_common(self.top)]
+            diff = []
+            if self._previous is not None:
+                changes = current.copy()
+                changes.subtract(self._previous)
+                changes = sorted((change for change in changes.items()
+                                  if change[1]),
+                                 key=lambda change: -abs(change[1]))
+                diff = [{'site': change[0], 'count': change[1]}
+                        for change in changes[:self.top]]
+        self._previous = current
+        snapshot = {'phase': phase, 'rss': current_rss(),
+                    'peak_rss': peak_rss(), 'top': top, 'diff': diff}
+        self.phases.append(snapshot)
+        logging.info('Memory after %s: %s bytes RSS, %d bytes peak', phase,
+                     snapshot['rss'], snapshot['peak_rss'])
+        for entry in diff:
+            logging.debug('  %+d %s', entry.get('size', entry['count']),
+                          entry['site'])
+        return snapshot
+
+    def start_sampler(self):
+        """Samples the RSS every ``interval`` seconds in a daemon thread.
+        """
+        if not self.interval:
+            return
+        self._stop.clear()
+        self._sampler = threading.Thread(target=self._sample,
+                                         name='memory-sampler')
+        self._sampler.daemon = True
+        self._sampler.start()
+
+    def stop_sampler(self):
+        if self._sampler is not None:
+            self._stop.set()
+            self._sampler.join()
+            self._sampler = None
+
+    def _sample(self):
+        start = time.time()
+        while True:
+            sample = {'time': time.time() - start, 'rss': current_rss()}
+            if tracemalloc is not None:
+                traced, traced_peak = tracemalloc.get_traced_memory()
+                sample.update(traced=traced, traced_peak=traced_peak)
+            self.samples.append(sample)
+            if self._stop.wait(self.interval):
+                return
+
+    def get_report(self):
+        return {'backend': self.backend, 'peak_rss': peak_rss(),
+                'phases': self.phases, 'samples': self.samples}
+
+    def write(self, path):
+        with open(path, 'w') as fd:
+            json.dump(self.get_report(), fd, indent=2, sort_keys=True)
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+import multiprocessing
+import os
+import os.path
+
+from subte import compression
+from subte.captions import CaptionError, CueStore, is_vtt
+from subte.generator import parse_filename
+from subte.process import Process
+
+
+class IntervalIndex(object):
+    """Static interval tree over the cues of a ``CueStore``.
+
+    Cues are sorted by start and laid out as an implicit balanced binary
+    tree, where each node keeps the latest end of its subtree. Building
+    takes O(n log n) time and each query O(log n + k) for k overlaps.
+    """
+
+    def __init__(self, store):
+        self.order = sorted(xrange(len(store)),
+                            key=lambda position: store.starts[position])
+        self.starts = [store.starts[position] for position in self.order]
+        self.ends = [store.ends[position] for position in self.order]
+        self.max_ends = list(self.ends)
+        self._build(0, len(self.order))
+
+    def _build(self, low, high):
+        if low >= high:
+            return None
+        middle = (low + high) // 2
+        for child in (self._build(low, middle),
+                      self._build(middle + 1, high)):
+            if child is not None:
+                self.max_ends[middle] = max(self.max_ends[middle],
+                                            self.max_ends[child])
+        return middle
+
+    def overlaps(self, start, end):
+        """Returns the store positions of the cues overlapping ``[start,
+        end)``, sorted by start.
+        """
+        result = []
+        self._search(0, len(self.order), start, end, result)
+        return result
+
+    def _search(self, low, high, start, end, result):
+        while low < high:
+            middle = (low + high) // 2
+            if self.max_ends[middle] <= start:
+                return
+            self._search(low, middle, start, end, result)
+            if self.starts[middle] >= end:
+                return
+            if self.ends[middle] > start:
+                result.append(self.order[middle])
+            low = middle + 1
+
+
+def merge_stores(primary, secondary, separator=u'\n'):
+    """Returns a ``CueStore`` with the timing of each ``primary`` cue and
+    its text followed by the text of the overlapping ``secondary`` cues.
+    Secondary cues overlapping no primary cue are kept as they are.
+    """
+    index = IntervalIndex(secondary)
+    used = set()
+    cues = []
+    for cue in primary:
+        overlapping = index.overlaps(cue.start, cue.end)
+        used.update(overlapping)
+        cues.append((cue.start, cue.end, separator.join(
+            [cue.text] + [secondary.text_of(position)
+                          for position in overlapping]), cue.index))
+    cues.extend((secondary.starts[position], secondary.ends[position],
+                 secondary.text_of(position), None)
+                for position in xrange(len(secondary))
+                if position not in used)
+    cues.sort(key=lambda cue: cue[:2])
+    merged = CueStore()
+    for start, end, text, cue_index in cues:
+        merged.append(start, end, text, cue_index)
+    return merged
+
+
+def read_store(path):
+    with compression.open_file(path) as fd:
+        data = fd.read()
+    store = CueStore()
+    store.parse(data)
+    return store
+
+
+def merge_file(job):
+    """Merges the ``name`` caption of two directories into a third one.
+    Returns ``(name, cue count, error)``.
+    """
+    name, primary_dir, secondary_dir, output_dir, separator = job
+    try:
+        merged = merge_stores(read_store(os.path.join(primary_dir, name)),
+                              read_store(os.path.join(secondary_dir, name)),
+                              separator)
+        codec = compression.detect(name)
+        vtt = is_vtt(name[:-len(compression.SUFFIXES[codec])] if codec
+                     else name)
+        with open(os.path.join(output_dir, name), 'wb') as fd:
+            target = fd if codec is None else compression.writer(fd, codec)
+            merged.write(target, vtt)
+            if codec is not None:
+                target.close()
+    except (IOError, OSError, CaptionError) as e:
+        return name, 0, str(e)
+    return name, len(merged), None
+
+
+class Merger(Process):
+    """Merges the captions two ``subte-gen`` runs generated with the same
+    names, such as the original and translated captions of a course, into
+    dual-language captions.
+    """
+
+    NAME = 'subte-merge'
+
+    def set_arguments(self, parser):
+        parser.add_argument('primary_dir', type=str,
+                            help='Generated captions directory whose '
+                            'timings are kept')
+        parser.add_argument('secondary_dir', type=str,
+                            help='Generated captions directory whose text '
+                            'is added')
+        parser.add_argument('-o', '--output_dir', type=str, required=True,
+                            help='Merged captions directory')
+        parser.add_argument('--separator', type=str, default='\n',
+                            help='Text between the merged cue texts')
+        parser.add_argument('--report', type=str, default=None,
+                            help='Write the merge stats and errors as JSON')
+        parser.set_defaults(jobs=multiprocessing.cpu_count())
+
+    def prepare(self):
+        self.stats = {'merged': 0, 'cues': 0, 'errors': 0, 'unmatched': 0}
+        self.errors = []
+        if not os.path.exists(self.arguments.output_dir):
+            os.makedirs(self.arguments.output_dir)
+
+    def get_names(self):
+        """Returns the generated caption names found in both directories and
+        counts the ones found in only one of them.
+        """
+        names = []
+        for directory in (self.arguments.primary_dir,
+                          self.arguments.secondary_dir):
+            names.append(set(name for name in os.listdir(directory)
+                             if self.is_caption(name)))
+        primary, secondary = names
+        for name in sorted(primary ^ secondary):
+            self.stats['unmatched'] += 1
+            logging.warning('%s has no counterpart', name, extra={
+                'operation': 'merge', 'source': name})
+        return sorted(primary & secondary)
+
+    def is_caption(self, name):
+        codec = compression.detect(name)
+        if codec is not None:
+            name = name[:-len(compression.SUFFIXES[codec])]
+        return parse_filename(name) is not None
+
+    def handle(self):
+        separator = self.arguments.separator.decode('utf-8')
+        jobs = [(name, self.arguments.primary_dir,
+                 self.arguments.secondary_dir, self.arguments.output_dir,
+                 separator) for name in self.get_names()]
+        pool = multiprocessing.Pool(max(1, self.arguments.jobs))
+        try:
+            for name, cues, error in pool.imap_unordered(merge_file, jobs,
+                                                         16):
+                if error is not None:
+                    self.stats['errors'] += 1
+                    self.errors.append({'source': name, 'error': error})
+                    logging.error('%s', error, extra={
+                        'operation': 'merge', 'source': name,
+                        'error': error})
+                    continue
+                self.stats['merged'] += 1
+                self.stats['cues'] += cues
+        finally:
+            pool.close()
+            pool.join()
+        logging.info('Merged %d files into %d cues, %d errors',
+                     self.stats['merged'], self.stats['cues'],
+                     self.stats['errors'])
+
+    def finish(self):
+        if self.arguments.report:
+            with open(self.arguments.report, 'w') as fd:
+                json.dump({'stats': self.stats, 'errors': self.errors}, fd,
+                          indent=2, sort_keys=True)
+
+
+def main():
+    merger = Merger()
+    merger.run()
+
+if __name__ == '__main__':
+    main()
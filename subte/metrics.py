@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+import os
+import tempfile
+import threading
+
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    pairs = []
+    for key in sorted(labels):
+        value = unicode(labels[key]).replace('\\', r'\\')
+        value = value.replace('\n', r'\n').replace('"', r'\"')
+        pairs.append(u'{}="{}"'.format(key, value))
+    return u'{' + u','.join(pairs) + u'}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, (int, long)):
+        return str(value)
+    return repr(float(value))
+
+
+class Metric(object):
+
+    TYPE = None
+
+    def __init__(self, name, helptext, labels=None):
+        self.name = name
+        self.helptext = helptext
+        self.labels = labels or {}
+        self._lock = threading.Lock()
+
+    def samples(self):
+        """Returns a list of ``(suffix, labels, value)`` tuples.
+        """
+        raise NotImplementedError
+
+
+class Counter(Metric):
+
+    TYPE = 'counter'
+
+    def __init__(self, *args, **kwargs):
+        super(Counter, self).__init__(*args, **kwargs)
+        self.value = 0
+
+    def inc(self, amount=1):
+        if amount < 0:
+            raise ValueError('Counters can only be incremented.')
+        with self._lock:
+            self.value += amount
+
+    def samples(self):
+        return [('', self.labels, self.value)]
+
+
+class Gauge(Metric):
+
+    TYPE = 'gauge'
+
+    def __init__(self, *args, **kwargs):
+        super(Gauge, self).__init__(*args, **kwargs)
+        self.value = 0
+
+    def set(self, value):
+        with self._lock:
+            self.value = value
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def samples(self):
+        return [('', self.labels, self.value)]
+
+
+class Histogram(Metric):
+
+    TYPE = 'histogram'
+    DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60)
+
+    def __init__(self, name, helptext, labels=None, buckets=None):
+        super(Histogram, self).__init__(name, helptext, labels)
+        self.buckets = tuple(sorted(float(bound) for bound in
+                                    buckets or self.DEFAULT_BUCKETS))
+        self.buckets += (float('inf'),)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        with self._lock:
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[index] += 1
+                    break
+            self.sum += value
+            self.count += 1
+
+    def samples(self):
+        result = []
+        with self._lock:
+            cumulative = 0
+            for bound, count in zip(self.buckets, self.counts):
+                cumulative += count
+                labels = dict(self.labels, le=_format_value(bound))
+                result.append(('_bucket', labels, cumulative))
+            result.append(('_sum', self.labels, self.sum))
+            result.append(('_count', self.labels, self.count))
+        return result
+
+
+class Registry(object):
+    """Collection of metrics rendered in the Prometheus text format.
+
+    ``const_labels`` are added to every sample when rendering.
+    """
+
+    def __init__(self, const_labels=None):
+        self.const_labels = const_labels or {}
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, metric_class, name, helptext, labels=None,
+                       **kwargs):
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            metric = self._metrics.get(key)
+            if metric is None:
+                metric = metric_class(name, helptext, labels, **kwargs)
+                self._metrics[key] = metric
+            elif not isinstance(metric, metric_class):
+                raise ValueError('"{}" is already registered as a {}.'.format(
+                    name, metric.TYPE))
+        return metric
+
+    def counter(self, name, helptext, labels=None):
+        return self._get_or_create(Counter, name, helptext, labels)
+
+    def gauge(self, name, helptext, labels=None):
+        return self._get_or_create(Gauge, name, helptext, labels)
+
+    def histogram(self, name, helptext, labels=None, buckets=None):
+        return self._get_or_create(Histogram, name, helptext, labels,
+                                   buckets=buckets)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            metrics = sorted(self._metrics.items())
+        described = set()
+        for (name, _), metric in metrics:
+            if name not in described:
+                described.add(name)
+                lines.append(u'# HELP {} {}'.format(name, metric.helptext))
+                lines.append(u'# TYPE {} {}'.format(name, metric.TYPE))
+            for suffix, labels, value in metric.samples():
+                labels = dict(self.const_labels, **labels)
+                lines.append(u'{}{}{} {}'.format(name, suffix,
+                                                 _format_labels(labels),
+                                                 _format_value(value)))
+        return u'\n'.join(lines) + u'\n'
+
+    def write_textfile(self, path):
+        """Atomically writes the metrics to ``path``, as expected by the
+        node exporter textfile collector.
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as tmp:
+                tmp.write(self.render().encode('utf-8'))
+            os.chmod(tmp_path, 0644)
+            os.rename(tmp_path, path)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+
+    def serve(self, port, address='127.0.0.1'):
+        """Serves the metrics over HTTP from a daemon thread and returns the
+        server instance.
+        """
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = HTTPServer((address, port), MetricsHandler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return server
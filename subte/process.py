@@ -1,14 +1,36 @@
 # -*- coding: utf-8 -*-
+import Queue
 import argparse
 import logging
 import sys
+import threading
+import multiprocessing
+import time
+
+from multiprocessing.pool import ThreadPool
 
 from subte import log
+from subte.memory import MemoryProfiler
+from subte.metrics import Registry
+from subte.tracing import NullTracer, Tracer
 
 LOGGING_LEVELS = [
     'CRITICAL', 'ERROR', 'WARNING', 'INFO', 'DEBUG', 'NOTSET'
 ]
 
+_DONE = object()
+JOIN_INTERVAL = 0.2
+"""Seconds the main thread blocks at a time, so it still handles SIGINT."""
+
+
+def join_threads(threads, interval=JOIN_INTERVAL):
+    """Waits for ``threads`` in ``interval`` second slices. An untimed join
+    would not let Python 2 deliver signals such as SIGINT meanwhile.
+    """
+    for thread in threads:
+        while thread.is_alive():
+            thread.join(interval)
+
 
 class ProcessMode(object):
 
@@ -39,6 +61,294 @@ class ProcessMode(object):
         pass
 
 
+class AsyncProcessMode(ProcessMode):
+    """Mode that loads its items from a background thread, so the process
+    can consume them while they are still being loaded.
+    """
+
+    QUEUE_SIZE = 1000
+
+    def initialize(self, arguments):
+        self.arguments = arguments
+        self.items = Queue.Queue(self.QUEUE_SIZE)
+        self.error = None
+        self._stop = threading.Event()
+        self.loader = threading.Thread(target=self._load, args=(arguments,))
+        self.loader.daemon = True
+        self.loader.start()
+
+    def load(self, arguments):
+        """Useful to yield the mode items. Runs in the loader thread.
+        """
+        raise NotImplementedError
+
+    def _load(self, arguments):
+        try:
+            for item in self.load(arguments):
+                if self._stop.is_set():
+                    break
+                self.items.put(item)
+        except Exception:
+            self.error = sys.exc_info()
+        finally:
+            self.items.put(_DONE)
+
+    def iter_items(self):
+        """Yields the loaded items as they arrive and re-raises any error
+        raised while loading them. On ``KeyboardInterrupt`` the loader is
+        stopped.
+        """
+        try:
+            while True:
+                try:
+                    item = self.items.get(True, JOIN_INTERVAL)
+                except Queue.Empty:
+                    continue
+                if item is _DONE:
+                    break
+                yield item
+        except KeyboardInterrupt:
+            self.stop()
+            raise
+        if self.error is not None:
+            raise self.error[0], self.error[1], self.error[2]
+
+    def stop(self):
+        """Makes the loader stop after its current item and discards the
+        items not consumed yet.
+        """
+        self._stop.set()
+        try:
+            while True:
+                self.items.get_nowait()
+        except Queue.Empty:
+            pass
+
+
+class StageStats(object):
+
+    def __init__(self, name):
+        self.name = name
+        self.items_in = 0
+        self.items_out = 0
+        self.busy = 0.0
+        self.elapsed = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, items_in, items_out, busy):
+        with self._lock:
+            self.items_in += items_in
+            self.items_out += items_out
+            self.busy += busy
+
+    @property
+    def throughput(self):
+        """Items consumed (or produced, for sources) per second.
+        """
+        if not self.elapsed:
+            return 0.0
+        return max(self.items_in, self.items_out) / self.elapsed
+
+
+class Stage(object):
+    """Pipeline step. ``process`` receives an item from the previous stage
+    and returns an iterable of items for the next one.
+
+    ``WORKERS`` threads run ``process`` concurrently, or processes when
+    ``KIND`` is ``'process'``; process stages must be picklable.
+    """
+
+    NAME = None
+    WORKERS = 1
+    KIND = 'thread'
+
+    def __init__(self, workers=None):
+        self.name = self.NAME or self.__class__.__name__
+        self.workers = max(1, workers or self.WORKERS)
+
+    def process(self, item):
+        raise NotImplementedError
+
+    def __call__(self, item):
+        return list(self.process(item) or [])
+
+
+class Source(Stage):
+    """First pipeline step. ``produce`` yields the pipeline items.
+    """
+
+    def produce(self):
+        raise NotImplementedError
+
+
+class Sink(Stage):
+    """Last pipeline step. ``process`` consumes items and returns nothing.
+    """
+
+
+class Pipeline(object):
+    """Runs stages connected by bounded queues, so a slow stage makes the
+    previous ones block instead of buffering without limit.
+
+    When a stage fails the source stops producing and every stage drains
+    its queue without processing, then the first error is re-raised. A
+    ``KeyboardInterrupt`` aborts the stages the same way.
+    """
+
+    PROCESS_BATCH = 16
+
+    def __init__(self, stages, queue_size=1000, metrics=None):
+        if not stages or not isinstance(stages[0], Source):
+            raise ValueError('The first pipeline stage must be a Source.')
+        self.stages = stages
+        self.queue_size = queue_size
+        self.metrics = metrics
+        self.stats = [StageStats(stage.name) for stage in stages]
+
+    def run(self):
+        self._abort = threading.Event()
+        self._errors = []
+        queues = [Queue.Queue(self.queue_size) for _ in self.stages[1:]]
+        threads = []
+        for index, stage in enumerate(self.stages):
+            source = queues[index - 1] if index else None
+            target = queues[index] if index < len(queues) else None
+            if index == 0:
+                targets = [self._produce]
+            elif stage.KIND == 'process':
+                targets = [self._consume_processes]
+            else:
+                targets = [self._consume] * stage.workers
+            remaining = [len(targets)]
+            start = time.time()
+            for function in targets:
+                thread = threading.Thread(target=self._run_worker, args=(
+                    function, index, source, target, remaining, start))
+                thread.daemon = True
+                thread.start()
+                threads.append(thread)
+        try:
+            join_threads(threads)
+        except KeyboardInterrupt:
+            self._abort.set()
+            join_threads(threads)
+            self._report()
+            raise
+        self._report()
+        if self._errors:
+            error = self._errors[0]
+            raise error[0], error[1], error[2]
+
+    def _fail(self):
+        self._errors.append(sys.exc_info())
+        self._abort.set()
+
+    def _run_worker(self, function, index, source, target, remaining, start):
+        try:
+            function(index, source, target)
+        except Exception:
+            self._fail()
+            if source is not None:
+                for _ in self._iter_queue(source):
+                    pass
+        finally:
+            with self.stats[index]._lock:
+                remaining[0] -= 1
+                last = not remaining[0]
+            if last:
+                self.stats[index].elapsed = time.time() - start
+                if target is not None:
+                    stage = self.stages[index + 1]
+                    consumers = 1 if stage.KIND == 'process' else stage.workers
+                    for _ in xrange(consumers):
+                        target.put(_DONE)
+
+    def _produce(self, index, source, target):
+        stats = self.stats[index]
+        for item in self.stages[index].produce():
+            if self._abort.is_set():
+                break
+            target.put(item)
+            stats.add(0, 1, 0)
+
+    def _consume(self, index, source, target):
+        stage = self.stages[index]
+        stats = self.stats[index]
+        for item in self._iter_queue(source):
+            if self._abort.is_set():
+                continue
+            start = time.time()
+            try:
+                outputs = stage(item)
+            except Exception:
+                self._fail()
+                continue
+            stats.add(1, len(outputs), time.time() - start)
+            if target is not None:
+                for output in outputs:
+                    target.put(output)
+
+    def _consume_processes(self, index, source, target):
+        stage = self.stages[index]
+        pool = multiprocessing.Pool(stage.workers)
+        try:
+            batch = []
+            for item in self._iter_queue(source):
+                if self._abort.is_set():
+                    continue
+                batch.append(item)
+                if len(batch) >= stage.workers * self.PROCESS_BATCH:
+                    self._map_batch(pool, index, batch, target)
+                    batch = []
+            if not self._abort.is_set():
+                self._map_batch(pool, index, batch, target)
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def _map_batch(self, pool, index, batch, target):
+        if not batch:
+            return
+        start = time.time()
+        try:
+            results = pool.map(self.stages[index], batch)
+        except Exception:
+            self._fail()
+            return
+        self.stats[index].add(len(batch), sum(len(outputs)
+                                              for outputs in results),
+                              time.time() - start)
+        if target is not None:
+            for outputs in results:
+                for output in outputs:
+                    target.put(output)
+
+    def _iter_queue(self, queue):
+        while True:
+            item = queue.get()
+            if item is _DONE:
+                return
+            yield item
+
+    def _report(self):
+        for stats in self.stats:
+            logging.debug('Stage %s: %d in, %d out, %.3fs busy, %.1f items/s',
+                          stats.name, stats.items_in, stats.items_out,
+                          stats.busy, stats.throughput)
+            if self.metrics is None:
+                continue
+            labels = {'stage': stats.name}
+            self.metrics.counter('subte_stage_items_in_total',
+                                 'Items consumed by a pipeline stage',
+                                 labels).inc(stats.items_in)
+            self.metrics.counter('subte_stage_items_out_total',
+                                 'Items produced by a pipeline stage',
+                                 labels).inc(stats.items_out)
+            self.metrics.counter('subte_stage_busy_seconds_total',
+                                 'Time a pipeline stage spent processing',
+                                 labels).inc(stats.busy)
+
+
 class Process(object):
 
     NAME = None
@@ -57,6 +367,27 @@ class Process(object):
         self.parser = argparse.ArgumentParser(name)
         self.parser.add_argument('-l', '--logging', type=str, default='INFO',
                                  choices=LOGGING_LEVELS, help='Logging level')
+        self.parser.add_argument('--log-format', type=str, default='text',
+                                 choices=log.LOG_FORMATS, help='Log format')
+        self.parser.add_argument('-j', '--jobs', type=int, default=1,
+                                 help='Number of worker threads')
+        self.parser.add_argument('--metrics-file', type=str, default=None,
+                                 help='Write metrics to this node exporter '
+                                 'textfile at the end of the run')
+        self.parser.add_argument('--metrics-port', type=int, default=None,
+                                 help='Serve metrics over HTTP on this local '
+                                 'port while running')
+        self.parser.add_argument('--trace', type=str, default=None,
+                                 metavar='PATH',
+                                 help='Write a Chrome trace of the run')
+        self.parser.add_argument('--memory-profile', type=str, default=None,
+                                 metavar='PATH',
+                                 help='Write memory snapshots of each phase '
+                                 'as JSON')
+        self.parser.add_argument('--memory-interval', type=float,
+                                 default=None, metavar='SECONDS',
+                                 help='Also sample the memory usage at this '
+                                 'interval while handling')
         self.set_arguments(self.parser)
         if self.MODES:
             subparsers = self.parser.add_subparsers(title='Modes',
@@ -69,10 +400,24 @@ class Process(object):
                           mode_instance.__class__.__name__.lower())
                 self.__modes[subcmd] = mode_instance
 
-        self.arguments = self.parser.parse_args(args)
-        log.setup(self.arguments.logging)
+        self.argv = list(sys.argv[1:] if args is None else args)
+        self.arguments = self.parser.parse_args(self.argv)
+        log.setup(self.arguments.logging, self.arguments.log_format)
+        self.metrics = Registry()
+        self.tracer = Tracer() if self.arguments.trace else NullTracer()
+        self.profiler = None
+        if self.arguments.memory_profile:
+            self.profiler = MemoryProfiler(
+                interval=self.arguments.memory_interval)
+            self.profiler.start()
         if self.current_mode:
-            self.current_mode.initialize(self.arguments)
+            start = time.time()
+            with self.tracer.span('initialize'):
+                self.current_mode.initialize(self.arguments)
+            self.metrics.gauge('subte_mode_initialize_seconds',
+                               'Time spent initializing the mode').set(
+                time.time() - start)
+            self.snapshot('initialize')
 
     def set_arguments(self, parser):
         """Useful to set process-specific arguments.
@@ -88,6 +433,10 @@ class Process(object):
     def finish(self):
         pass
 
+    def snapshot(self, phase):
+        if self.profiler is not None:
+            self.profiler.snapshot(phase)
+
     def log_exception(self, typ, value, tb):
         logging.error('Uncaught exception', exc_info=(typ, value, tb))
 
@@ -95,10 +444,114 @@ class Process(object):
         pass
 
     def run(self):
+        server = None
+        if self.arguments.metrics_port is not None:
+            server = self.metrics.serve(self.arguments.metrics_port)
+        start = time.time()
         try:
-            self.prepare()
-            self.handle()
-            self.finish()
+            with self.tracer.span('prepare'):
+                self.prepare()
+            self.snapshot('prepare')
+            if self.profiler is not None:
+                self.profiler.start_sampler()
+            with self.tracer.span('handle'):
+                self.handle()
+            if self.profiler is not None:
+                self.profiler.stop_sampler()
+            self.snapshot('handle')
+            with self.tracer.span('finish'):
+                self.finish()
+            self.snapshot('finish')
+            self.metrics.gauge('subte_last_success_timestamp_seconds',
+                               'Time of the last successful run').set(
+                time.time())
         except Exception as e:
+            self.metrics.counter('subte_run_failures_total',
+                                 'Runs ended by an uncaught exception').inc()
             self.handle_exception(e)
             self.log_exception(*sys.exc_info())
+        finally:
+            self.metrics.gauge('subte_run_duration_seconds',
+                               'Duration of the last run').set(
+                time.time() - start)
+            if self.arguments.metrics_file:
+                self.metrics.write_textfile(self.arguments.metrics_file)
+            if self.arguments.trace:
+                self.tracer.write(self.arguments.trace)
+            if self.profiler is not None:
+                self.profiler.stop()
+                self.metrics.gauge('subte_peak_rss_bytes',
+                                   'Peak resident set size').set(
+                    self.profiler.get_report()['peak_rss'])
+                self.profiler.write(self.arguments.memory_profile)
+            if server is not None:
+                server.shutdown()
+                server.server_close()
+
+
+class AsyncProcess(Process):
+    """Process with a thread pool to offload blocking operations to.
+
+    ``submit`` bounds the number of pending operations, so producers block
+    instead of queueing unbounded work. ``join`` waits for them and
+    re-raises the first error.
+    """
+
+    def set_arguments(self, parser):
+        super(AsyncProcess, self).set_arguments(parser)
+        parser.set_defaults(jobs=8)
+        parser.add_argument('--max-pending', type=int, default=64,
+                            help='Maximum number of queued operations')
+
+    def run(self):
+        self.executor = ThreadPool(max(1, self.arguments.jobs))
+        self._slots = threading.BoundedSemaphore(
+            max(1, self.arguments.max_pending))
+        self._pending = []
+        try:
+            super(AsyncProcess, self).run()
+        except KeyboardInterrupt:
+            self.executor.terminate()
+            raise
+        finally:
+            self.executor.close()
+            self.executor.join()
+
+    def run_in_executor(self, func, *args):
+        """Runs ``func`` in the pool and returns its ``AsyncResult``.
+        """
+        return self.executor.apply_async(func, args)
+
+    def submit(self, func, *args):
+        """Runs ``func`` in the pool, blocking while too many operations are
+        pending.
+        """
+        self._slots.acquire()
+        try:
+            result = self.executor.apply_async(self._call, (func, args))
+        except Exception:
+            self._slots.release()
+            raise
+        self._pending.append(result)
+        self._reap()
+        return result
+
+    def join(self):
+        self._reap(wait=True)
+
+    def _call(self, func, args):
+        try:
+            return func(*args)
+        finally:
+            self._slots.release()
+
+    def _reap(self, wait=False):
+        pending = []
+        for result in self._pending:
+            if wait or result.ready():
+                while not result.ready():
+                    result.wait(JOIN_INTERVAL)
+                result.get()
+            else:
+                pending.append(result)
+        self._pending = pending
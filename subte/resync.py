@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+import argparse
+import bisect
+import logging
+import multiprocessing
+import os
+import os.path
+import re
+import tempfile
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None  # pragma: no cover
+
+from subte.captions import (CaptionError, TIMING_REGEX, format_timestamp,
+                            iter_captions, parse_timestamp)
+from subte.process import Process
+
+TIMESTAMP_SPAN_REGEX = re.compile(r'(?:\d+:)?\d{1,2}:\d{2}[,.]\d{3}')
+
+
+def anchor_type(value):
+    """Parses an ``OLD=NEW`` pair of timestamps into milliseconds.
+    """
+    try:
+        old, new = value.split('=')
+        return parse_timestamp(old), parse_timestamp(new)
+    except (ValueError, CaptionError):
+        raise argparse.ArgumentTypeError(
+            'invalid anchor {!r}, expected OLD=NEW timestamps'.format(value))
+
+
+def _extend(anchors):
+    """Returns the anchor abscissas and ordinates, extended with two far
+    points so the first and last segments extrapolate linearly.
+    """
+    anchors = sorted(anchors)
+    if len(set(anchor[0] for anchor in anchors)) != len(anchors):
+        raise ValueError('Anchors must have distinct old timestamps.')
+    if len(anchors) == 1:
+        (old, new), = anchors
+        anchors = [(old - 1, new - 1), (old, new)]
+    (x0, y0), (x1, y1) = anchors[0], anchors[1]
+    (xn1, yn1), (xn, yn) = anchors[-2], anchors[-1]
+    far = 1 << 40
+    first_slope = float(y1 - y0) / (x1 - x0)
+    last_slope = float(yn - yn1) / (xn - xn1)
+    xs = [x0 - far] + [anchor[0] for anchor in anchors] + [xn + far]
+    ys = ([y0 - far * first_slope] + [anchor[1] for anchor in anchors] +
+          [yn + far * last_slope])
+    return xs, ys
+
+
+def correct(times, offset=0, scale=1.0, anchors=None):
+    """Returns the corrected millisecond ``times``: ``time * scale +
+    offset``, or the piecewise linear interpolation of ``(old, new)``
+    anchors. Uses vectorized NumPy operations when available.
+    """
+    if anchors:
+        xs, ys = _extend(anchors)
+    if numpy is not None:
+        values = numpy.asarray(times, dtype=numpy.float64)
+        if anchors:
+            values = numpy.interp(values, xs, ys)
+        else:
+            values = values * scale + offset
+        return numpy.maximum(numpy.rint(values), 0).astype(numpy.int64)
+    result = []
+    for value in times:
+        if anchors:
+            index = min(max(bisect.bisect_right(xs, value), 1), len(xs) - 1)
+            x0, x1, y0, y1 = xs[index - 1], xs[index], ys[index - 1], ys[index]
+            value = y0 + (value - x0) * float(y1 - y0) / (x1 - x0)
+        else:
+            value = value * scale + offset
+        result.append(max(int(round(value)), 0))
+    return result
+
+
+def resync_file(job):
+    """Rewrites the timings of a caption file, leaving every other byte
+    untouched. Returns ``(path, cue count, error)``.
+    """
+    path, offset, scale, anchors = job
+    try:
+        times = []
+        with open(path, 'rb') as fd:
+            for line in fd:
+                match = TIMING_REGEX.match(line)
+                if match is not None:
+                    times.append(parse_timestamp(match.group(1)))
+                    times.append(parse_timestamp(match.group(2)))
+        if not times:
+            return path, 0, None
+        corrected = iter(correct(times, offset, scale, anchors))
+
+        def replace(match):
+            separator = '.' if '.' in match.group(0) else ','
+            return format_timestamp(next(corrected), separator)
+
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with open(path, 'rb') as source:
+                with os.fdopen(fd, 'wb') as target:
+                    for line in source:
+                        if TIMING_REGEX.match(line) is not None:
+                            arrow = line.index('-->')
+                            line = (TIMESTAMP_SPAN_REGEX.sub(
+                                replace, line[:arrow], 1) + '-->' +
+                                TIMESTAMP_SPAN_REGEX.sub(
+                                replace, line[arrow + 3:], 1))
+                        target.write(line)
+            os.chmod(tmp_path, os.stat(path).st_mode & 0777)
+            os.rename(tmp_path, path)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+    except (IOError, OSError, CaptionError) as e:
+        return path, 0, str(e)
+    return path, len(times) // 2, None
+
+
+class Resyncer(Process):
+
+    NAME = 'subte-resync'
+
+    def set_arguments(self, parser):
+        parser.add_argument('paths', type=str, nargs='+',
+                            help='Caption files or directories')
+        parser.add_argument('--offset', type=float, default=0.0,
+                            help='Seconds added to every timestamp')
+        parser.add_argument('--scale', type=float, default=1.0,
+                            help='Factor applied to every timestamp before '
+                            'the offset, to correct a linear drift')
+        parser.add_argument('-a', '--anchor', dest='anchors',
+                            type=anchor_type, action='append', default=None,
+                            metavar='OLD=NEW',
+                            help='Timestamp correspondence; several anchors '
+                            'apply a piecewise linear correction')
+        parser.set_defaults(jobs=multiprocessing.cpu_count())
+
+    def handle(self):
+        offset = int(round(self.arguments.offset * 1000))
+        jobs = ((path, offset, self.arguments.scale, self.arguments.anchors)
+                for path in iter_captions(self.arguments.paths))
+        pool = multiprocessing.Pool(max(1, self.arguments.jobs))
+        files = cues = 0
+        try:
+            for path, count, error in pool.imap_unordered(resync_file, jobs,
+                                                          16):
+                if error is not None:
+                    logging.error('%s', error, extra={
+                        'operation': 'resync', 'destination': path,
+                        'error': error})
+                    continue
+                files += 1
+                cues += count
+        finally:
+            pool.close()
+            pool.join()
+        logging.info('Resynchronized %d cues in %d files', cues, files)
+
+
+def main():
+    resyncer = Resyncer()
+    resyncer.run()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,361 @@
+# -*- coding: utf-8 -*-
+import collections
+import ctypes
+import ctypes.util
+import errno
+import json
+import logging
+import os
+import os.path
+import shutil
+import threading
+import urllib
+import urlparse
+
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+
+from subte import compression, storage
+from subte.captions import is_vtt
+from subte.generator import Generator
+
+CONTENT_TYPES = {
+    False: 'application/x-subrip; charset=utf-8',
+    True: 'text/vtt; charset=utf-8',
+}
+
+
+def _load_sendfile():
+    sendfile = getattr(os, 'sendfile', None)
+    if sendfile is not None:
+        return lambda out_fd, in_fd, count: sendfile(out_fd, in_fd, None,
+                                                     count)
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        function = libc.sendfile
+    except (OSError, AttributeError, TypeError):
+        return None
+    function.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_void_p,
+                         ctypes.c_size_t]
+    function.restype = ctypes.c_ssize_t
+
+    def sendfile(out_fd, in_fd, count):
+        sent = function(out_fd, in_fd, None, count)
+        if sent < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        return sent
+    return sendfile
+
+_sendfile = _load_sendfile()
+
+
+def send_file(sock, fd, size):
+    """Sends ``size`` bytes of the ``fd`` file from its current position to
+    ``sock``, with the sendfile system call when available.
+    """
+    if _sendfile is None:
+        shutil.copyfileobj(fd, sock.makefile('wb', 0))
+        return
+    remaining = size
+    while remaining > 0:
+        try:
+            sent = _sendfile(sock.fileno(), fd.fileno(), remaining)
+        except OSError as e:
+            if e.errno in (errno.EINTR, errno.EAGAIN):
+                continue
+            raise
+        if not sent:
+            break
+        remaining -= sent
+
+
+class LRUCache(object):
+    """Caption contents cache bounded by their total size in bytes.
+
+    A key is only admitted on its second request, so captions requested
+    once do not evict the hot ones. Entries carry a signature of the file
+    they were read from and are dropped when it no longer matches.
+    """
+
+    def __init__(self, capacity, seen_capacity=65536):
+        self.capacity = capacity
+        self.seen_capacity = seen_capacity
+        self.size = 0
+        self._entries = collections.OrderedDict()
+        self._seen = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, signature):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+            if entry[0] != signature:
+                self.size -= len(entry[1])
+                return None
+            self._entries[key] = entry
+            return entry[1]
+
+    def admit(self, key):
+        """Returns whether ``key`` was requested before.
+        """
+        with self._lock:
+            if self._seen.pop(key, None) is not None:
+                return True
+            self._seen[key] = True
+            if len(self._seen) > self.seen_capacity:
+                self._seen.popitem(last=False)
+            return False
+
+    def put(self, key, signature, data):
+        if len(data) > self.capacity:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous[1])
+            while self._entries and self.size + len(data) > self.capacity:
+                self.size -= len(self._entries.popitem(last=False)[1][1])
+            self._entries[key] = (signature, data)
+            self.size += len(data)
+
+    def discard(self, keys):
+        with self._lock:
+            for key in keys:
+                entry = self._entries.pop(key, None)
+                if entry is not None:
+                    self.size -= len(entry[1])
+                self._seen.pop(key, None)
+
+
+class CaptionIndex(object):
+    """Maps ``(course, filename)`` to the ``(source_dir, origin)`` of each
+    generated caption.
+    """
+
+    def __init__(self):
+        self.entries = {}
+
+    def get(self, course, filename):
+        return self.entries.get((course, filename))
+
+    def update(self, entries):
+        """Replaces the entries and returns the added, removed and changed
+        keys.
+        """
+        previous = self.entries
+        self.entries = entries
+        added = [key for key in entries if key not in previous]
+        removed = [key for key in previous if key not in entries]
+        changed = [key for key, value in entries.items()
+                   if key in previous and previous[key] != value]
+        return added, removed, changed
+
+
+class CaptionHTTPServer(ThreadingMixIn, HTTPServer):
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class CaptionHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        self.server.service.respond(self)
+
+    def do_HEAD(self):
+        self.server.service.respond(self)
+
+    def do_POST(self):
+        self.server.service.respond_reload(self)
+
+    def log_message(self, message, *args):
+        logging.debug(message, *args)
+
+
+class Server(Generator):
+    """Serves the generated captions of the mapping over HTTP without
+    writing them. ``/COURSE/FILENAME`` resolves to the origin of
+    ``FILENAME`` in the source directory paired with the ``COURSE`` target
+    directory name.
+    """
+
+    NAME = 'subte-serve'
+
+    def set_arguments(self, parser):
+        super(Server, self).set_arguments(parser)
+        parser.add_argument('--address', type=str, default='127.0.0.1',
+                            help='Address to listen on')
+        parser.add_argument('--port', type=int, default=8000,
+                            help='Port to listen on')
+        parser.add_argument('--cache-size', type=int, default=64,
+                            metavar='MB', help='Memory cache size')
+        parser.add_argument('--reload-interval', type=float, default=None,
+                            metavar='SECONDS',
+                            help='Reload the mapping at this interval')
+
+    def prepare(self):
+        self.languages = [(self.arguments.source_dir,
+                           self.arguments.target_dir)]
+        for pair in self.arguments.pairs or []:
+            self.languages.append(tuple(pair))
+        self.courses = [(source_dir, os.path.basename(os.path.normpath(
+            target_dir))) for source_dir, target_dir in self.languages]
+        self.sources = dict((source_dir, storage.get_source(source_dir,
+                                                            self.arguments))
+                            for source_dir, _ in self.languages)
+        self.cache = LRUCache(self.arguments.cache_size * 1024 * 1024)
+        self.index = CaptionIndex()
+        self._plans = {}
+        self._reload_lock = threading.Lock()
+        self._stop = threading.Event()
+        self.mapping = self.get_mapping()
+        self.update_index()
+        self.httpd = CaptionHTTPServer((self.arguments.address,
+                                        self.arguments.port), CaptionHandler)
+        self.httpd.service = self
+
+    def handle(self):
+        if self.arguments.reload_interval:
+            thread = threading.Thread(target=self._reload_periodically,
+                                      name='mapping-reloader')
+            thread.daemon = True
+            thread.start()
+        logging.info('Serving on http://%s:%d/', *self.httpd.server_address)
+        try:
+            self.httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+    def finish(self):
+        self._stop.set()
+        self.httpd.server_close()
+        for source in self.sources.values():
+            source.close()
+
+    def shutdown(self):
+        self.httpd.shutdown()
+
+    def reload(self):
+        """Reloads the mapping from the current mode and updates the index.
+        """
+        with self._reload_lock:
+            self.current_mode.initialize(self.arguments)
+            self.mapping = self.get_mapping()
+            return self.update_index()
+
+    def update_index(self):
+        """Rebuilds the index from the mapping. Items are only planned when
+        they are new or changed since the previous update.
+        """
+        plans = {}
+        entries = {}
+        for number, item in self.get_items():
+            key = (number, item.get('concept'), item.get('lecture'),
+                   item.get('answer'))
+            pairs = self._plans.get(key)
+            if pairs is None:
+                pairs = self.plan_item(number, item)
+            plans[key] = pairs
+            for source, filename in pairs:
+                origin, destination = self.orient(source, filename)
+                for source_dir, course in self.courses:
+                    entries[(course, destination)] = (source_dir, origin)
+        self._plans = plans
+        added, removed, changed = self.index.update(entries)
+        self.cache.discard(removed + changed)
+        logging.info('Indexed %d captions: %d added, %d removed, %d changed',
+                     len(entries), len(added), len(removed), len(changed))
+        return {'captions': len(entries), 'added': len(added),
+                'removed': len(removed), 'changed': len(changed)}
+
+    def _reload_periodically(self):
+        while not self._stop.wait(self.arguments.reload_interval):
+            try:
+                self.reload()
+            except Exception:
+                logging.exception('Mapping reload failed')
+
+    def respond(self, handler):
+        path = urllib.unquote(urlparse.urlparse(handler.path).path)
+        parts = path.strip('/').split('/')
+        entry = self.index.get(*parts) if len(parts) == 2 else None
+        if entry is None:
+            return self.send_error(handler, 404)
+        source_dir, origin = entry
+        key = tuple(parts)
+        content_type = CONTENT_TYPES[is_vtt(parts[1])]
+        try:
+            if storage.is_remote(source_dir):
+                stream = self.sources[source_dir].open(origin)
+                try:
+                    data = stream.read()
+                finally:
+                    stream.close()
+                return self.send_data(handler, content_type, data)
+            path, codec = compression.resolve(os.path.join(source_dir,
+                                                           origin))
+            stat = os.stat(path)
+            signature = (path, stat.st_mtime, stat.st_size)
+            data = self.cache.get(key, signature)
+            if data is not None:
+                self.count_request('hit')
+                return self.send_data(handler, content_type, data)
+            if codec is not None or self.cache.admit(key):
+                with compression.open_file(path) as fd:
+                    data = fd.read()
+                self.cache.put(key, signature, data)
+                self.count_request('miss')
+                return self.send_data(handler, content_type, data)
+            with open(path, 'rb') as fd:
+                self.count_request('sendfile')
+                self.send_headers(handler, content_type, stat.st_size)
+                if handler.command != 'HEAD':
+                    send_file(handler.connection, fd, stat.st_size)
+        except (IOError, OSError) as e:
+            logging.error('%s', e, extra={'operation': 'serve',
+                                          'source': origin,
+                                          'destination': parts[1],
+                                          'error': str(e)})
+            self.send_error(handler, 404)
+
+    def respond_reload(self, handler):
+        if handler.path != '/-/reload':
+            return self.send_error(handler, 404)
+        try:
+            result = self.reload()
+        except Exception as e:
+            logging.exception('Mapping reload failed')
+            return self.send_error(handler, 500, str(e))
+        self.send_data(handler, 'application/json', json.dumps(result))
+
+    def count_request(self, outcome):
+        self.metrics.counter('subte_serve_requests_total',
+                             'Served caption requests',
+                             {'cache': outcome}).inc()
+
+    def send_headers(self, handler, content_type, length):
+        handler.send_response(200)
+        handler.send_header('Content-Type', content_type)
+        handler.send_header('Content-Length', str(length))
+        handler.end_headers()
+
+    def send_data(self, handler, content_type, data):
+        self.send_headers(handler, content_type, len(data))
+        if handler.command != 'HEAD':
+            handler.wfile.write(data)
+
+    def send_error(self, handler, status, message=None):
+        self.metrics.counter('subte_serve_errors_total',
+                             'Caption requests answered with an error',
+                             {'status': str(status)}).inc()
+        handler.send_error(status, message)
+
+
+def main():
+    server = Server()
+    server.run()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,420 @@
+# -*- coding: utf-8 -*-
+import Queue
+import datetime
+import errno
+import hashlib
+import hmac
+import httplib
+import logging
+import mmap
+import os
+import os.path
+import shutil
+import tempfile
+import threading
+import urllib
+import urlparse
+
+from multiprocessing.pool import ThreadPool
+from xml.etree import ElementTree
+
+from subte import compression
+
+try:
+    import gridfs
+    from pymongo import MongoClient
+except ImportError:  # pragma: no cover
+    gridfs = None  # pragma: no cover
+
+MB = 1024 * 1024
+DIGEST_CHUNK_SIZE = 1 << 20
+"""Bytes hashed per digest update when reading a memory-mapped file."""
+
+
+def file_digest(path, algorithm='sha1', chunk_size=DIGEST_CHUNK_SIZE):
+    """Returns the hex digest of a file, hashing a memory map of it in
+    ``chunk_size`` slices.
+    """
+    digest = hashlib.new(algorithm)
+    with open(path, 'rb') as fd:
+        size = os.fstat(fd.fileno()).st_size
+        if size:
+            mapped = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                for offset in xrange(0, size, chunk_size):
+                    digest.update(mapped[offset:offset + chunk_size])
+            finally:
+                mapped.close()
+    return digest.hexdigest()
+
+
+def stream_digest(fd, algorithm='sha1', chunk_size=DIGEST_CHUNK_SIZE):
+    """Returns the hex digest of the rest of a file object.
+    """
+    digest = hashlib.new(algorithm)
+    for chunk in iter(lambda: fd.read(chunk_size), ''):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def content_digest(path, algorithm='sha1'):
+    """Returns the hex digest of the content of ``path``, decompressed
+    according to its suffix.
+    """
+    if compression.detect(path) is None:
+        return file_digest(path, algorithm)
+    with compression.open_file(path) as fd:
+        return stream_digest(fd, algorithm)
+
+
+def is_remote(target):
+    return '://' in target
+
+
+def get_backend(target, arguments=None):
+    """Returns the output backend for a target directory or URL.
+    """
+    scheme = urlparse.urlparse(target).scheme if is_remote(target) else ''
+    if scheme not in BACKENDS:
+        raise ValueError('Unsupported output {!r}.'.format(target))
+    return BACKENDS[scheme].from_arguments(target, arguments)
+
+
+def get_source(source, arguments=None):
+    """Returns the reader of a source directory or URI.
+    """
+    scheme = urlparse.urlparse(source).scheme if is_remote(source) else ''
+    if scheme not in SOURCES:
+        raise ValueError('Unsupported source {!r}.'.format(source))
+    return SOURCES[scheme].from_arguments(source, arguments)
+
+
+class LocalSource(object):
+    """Reads the captions from a local directory.
+    """
+
+    def __init__(self, source_dir):
+        self.source_dir = source_dir
+
+    @classmethod
+    def from_arguments(cls, source, arguments):
+        return cls(source)
+
+    def path(self, origin):
+        return os.path.join(self.source_dir, origin)
+
+    def open(self, origin):
+        return open(self.path(origin), 'rb')
+
+    def close(self):
+        pass
+
+
+class GridFSSource(object):
+    """Reads the captions from a GridFS bucket of the URI database, by
+    filename. The client and its connection pool are shared by every
+    thread, and files are streamed chunk by chunk.
+    """
+
+    def __init__(self, uri, bucket='fs', pool_size=100):
+        if gridfs is None:
+            raise ValueError('GridFS sources require pymongo 3.1 or later.')
+        self.client = MongoClient(uri, maxPoolSize=pool_size)
+        self.bucket = gridfs.GridFSBucket(self.client.get_default_database(),
+                                          bucket)
+
+    @classmethod
+    def from_arguments(cls, source, arguments):
+        return cls(source, getattr(arguments, 'gridfs_bucket', None) or 'fs',
+                   max(getattr(arguments, 'jobs', 1), 1) + 1)
+
+    def open(self, origin):
+        try:
+            return self.bucket.open_download_stream_by_name(origin)
+        except gridfs.errors.NoFile:
+            raise IOError(errno.ENOENT,
+                          'No such GridFS file: {!r}'.format(origin))
+
+    def close(self):
+        self.client.close()
+
+
+class LocalBackend(object):
+    """Writes the outputs into a local directory.
+    """
+
+    def __init__(self, target_dir):
+        self.target_dir = target_dir
+
+    @classmethod
+    def from_arguments(cls, target, arguments):
+        return cls(target)
+
+    def path(self, destination):
+        return os.path.join(self.target_dir, destination)
+
+    def copy(self, source, destination):
+        """Copies the ``source`` file to ``destination`` and returns
+        ``(bytes, written)``.
+        """
+        shutil.copy(source, self.path(destination))
+        return os.path.getsize(source), True
+
+    def write(self, stream, destination, compress=None, level=None,
+              threads=0):
+        """Writes the content of the ``stream`` file object to
+        ``destination``, compressed with ``compress`` if given, and returns
+        ``(bytes, written)``.
+        """
+        path = self.path(destination)
+        with open(path, 'wb') as fd:
+            _write_stream(stream, fd, compress, level, threads)
+        return os.path.getsize(path), True
+
+    def close(self):
+        pass
+
+
+class S3Error(IOError):
+    pass
+
+
+class S3Backend(object):
+    """Uploads the outputs to an S3-compatible bucket, using path-style
+    requests signed with AWS Signature Version 4.
+
+    Connections are pooled and shared by every thread. Files larger than
+    ``multipart_threshold`` are uploaded in ``part_size`` parts by
+    ``part_workers`` threads. Objects whose ETag already matches the local
+    file are not uploaded again.
+    """
+
+    SERVICE = 's3'
+
+    def __init__(self, url, endpoint, access_key, secret_key,
+                 region='us-east-1', pool_size=8, part_size=8 * MB,
+                 multipart_threshold=16 * MB, part_workers=4):
+        parsed = urlparse.urlparse(url)
+        self.bucket = parsed.netloc
+        self.prefix = parsed.path.strip('/')
+        endpoint = urlparse.urlparse(endpoint)
+        self.secure = endpoint.scheme == 'https'
+        self.host = endpoint.netloc
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self.part_size = part_size
+        self.multipart_threshold = max(multipart_threshold, part_size)
+        self._connections = Queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(pool_size)
+        self._part_pool = ThreadPool(part_workers)
+
+    @classmethod
+    def from_arguments(cls, target, arguments):
+        return cls(target,
+                   getattr(arguments, 's3_endpoint', None) or
+                   os.environ.get('S3_ENDPOINT', 'https://s3.amazonaws.com'),
+                   os.environ.get('AWS_ACCESS_KEY_ID', ''),
+                   os.environ.get('AWS_SECRET_ACCESS_KEY', ''),
+                   getattr(arguments, 's3_region', None) or 'us-east-1',
+                   part_size=(getattr(arguments, 's3_part_size', None) or
+                              8) * MB)
+
+    def close(self):
+        self._part_pool.close()
+        self._part_pool.join()
+        while not self._connections.empty():
+            self._connections.get().close()
+
+    def key(self, destination):
+        return '/'.join(part for part in (self.prefix, destination) if part)
+
+    def copy(self, source, destination):
+        key = self.key(destination)
+        size = os.path.getsize(source)
+        multipart = size > self.multipart_threshold
+        etag = self.local_etag(source, size, multipart)
+        if self.remote_etag(key) == etag:
+            return size, False
+        if multipart:
+            self.upload_multipart(source, key, size)
+        else:
+            with open(source, 'rb') as fd:
+                self.request('PUT', key, body=fd.read())
+        return size, True
+
+    def write(self, stream, destination, compress=None, level=None,
+              threads=0):
+        """Spools the content of the ``stream`` file object, compressed
+        with ``compress`` if given, to a temporary file and uploads it.
+        """
+        with tempfile.NamedTemporaryFile(prefix='subte-') as spool:
+            _write_stream(stream, spool, compress, level, threads)
+            spool.flush()
+            return self.copy(spool.name, destination)
+
+    def local_etag(self, source, size, multipart):
+        """Returns the ETag S3 computes for ``source``: the MD5 of the
+        content, or the MD5 of the part MD5s followed by the part count.
+        """
+        if not multipart:
+            digest = hashlib.md5()
+            with open(source, 'rb') as fd:
+                for chunk in iter(lambda: fd.read(MB), ''):
+                    digest.update(chunk)
+            return digest.hexdigest()
+        digests = []
+        with open(source, 'rb') as fd:
+            for chunk in iter(lambda: fd.read(self.part_size), ''):
+                digests.append(hashlib.md5(chunk).digest())
+        return '{}-{}'.format(hashlib.md5(''.join(digests)).hexdigest(),
+                              len(digests))
+
+    def remote_etag(self, key):
+        try:
+            response = self.request('HEAD', key)
+        except S3Error as e:
+            if e.errno == 404:
+                return None
+            raise
+        return response.getheader('etag', '').strip('"') or None
+
+    def upload_multipart(self, source, key, size):
+        response = self.request('POST', key, {'uploads': ''})
+        upload_id = _find_text(response.body, 'UploadId')
+        parts = range(1, (size + self.part_size - 1) // self.part_size + 1)
+        try:
+            etags = self._part_pool.map(
+                lambda number: self.upload_part(source, key, upload_id,
+                                                number), parts)
+            body = ''.join(
+                '<Part><PartNumber>{}</PartNumber><ETag>{}</ETag></Part>'
+                .format(number, etag) for number, etag in zip(parts, etags))
+            self.request('POST', key, {'uploadId': upload_id},
+                         body='<CompleteMultipartUpload>{}'
+                         '</CompleteMultipartUpload>'.format(body))
+        except Exception:
+            try:
+                self.request('DELETE', key, {'uploadId': upload_id})
+            except (S3Error, httplib.HTTPException, IOError) as e:
+                logging.warning('Could not abort upload of %s: %s', key, e)
+            raise
+
+    def upload_part(self, source, key, upload_id, number):
+        with open(source, 'rb') as fd:
+            fd.seek((number - 1) * self.part_size)
+            data = fd.read(self.part_size)
+        response = self.request('PUT', key, {'partNumber': str(number),
+                                             'uploadId': upload_id},
+                                body=data)
+        return response.getheader('etag')
+
+    def request(self, method, key, query=None, body=''):
+        """Sends a signed request and returns the response, with its content
+        in ``body``. A pooled connection that fails is replaced by a new one
+        once. Raises ``S3Error`` on error statuses and HTTP errors.
+        """
+        path = '/{}/{}'.format(self.bucket, urllib.quote(key, safe='/~'))
+        query_string = '&'.join(
+            '{}={}'.format(urllib.quote(name, safe='~'),
+                           urllib.quote(value, safe='~'))
+            for name, value in sorted((query or {}).items()))
+        headers = self.sign(method, path, query_string, body)
+        url = path + ('?' + query_string if query_string else '')
+        self._slots.acquire()
+        connection = None
+        try:
+            try:
+                connection = self._connections.get_nowait()
+                reused = True
+            except Queue.Empty:
+                connection = self.connect()
+                reused = False
+            while True:
+                try:
+                    connection.request(method, url, body, headers)
+                    response = connection.getresponse()
+                    response.body = response.read()
+                    break
+                except (httplib.HTTPException, IOError) as e:
+                    connection.close()
+                    connection = None
+                    if reused:
+                        # The server may have closed an idle connection.
+                        connection = self.connect()
+                        reused = False
+                        continue
+                    if isinstance(e, httplib.HTTPException):
+                        raise S3Error(None, '{} {} failed: {}: {}'.format(
+                            method, key, e.__class__.__name__, e))
+                    raise
+            if response.status >= 300:
+                raise S3Error(response.status, '{} {} failed: {} {}'.format(
+                    method, key, response.status, response.reason))
+            return response
+        finally:
+            if connection is not None:
+                self._connections.put(connection)
+            self._slots.release()
+
+    def connect(self):
+        connection_class = (httplib.HTTPSConnection if self.secure
+                            else httplib.HTTPConnection)
+        return connection_class(self.host, timeout=60)
+
+    def sign(self, method, path, query_string, body):
+        now = datetime.datetime.utcnow()
+        timestamp = now.strftime('%Y%m%dT%H%M%SZ')
+        date = now.strftime('%Y%m%d')
+        payload_hash = hashlib.sha256(body).hexdigest()
+        headers = {'host': self.host, 'x-amz-date': timestamp,
+                   'x-amz-content-sha256': payload_hash}
+        signed_headers = ';'.join(sorted(headers))
+        canonical_request = '\n'.join([
+            method, path, query_string,
+            ''.join('{}:{}\n'.format(name, headers[name])
+                    for name in sorted(headers)),
+            signed_headers, payload_hash])
+        scope = '/'.join([date, self.region, self.SERVICE, 'aws4_request'])
+        string_to_sign = '\n'.join([
+            'AWS4-HMAC-SHA256', timestamp, scope,
+            hashlib.sha256(canonical_request).hexdigest()])
+        key = ('AWS4' + self.secret_key).encode('utf-8')
+        for part in (date, self.region, self.SERVICE, 'aws4_request'):
+            key = hmac.new(key, part, hashlib.sha256).digest()
+        signature = hmac.new(key, string_to_sign, hashlib.sha256).hexdigest()
+        headers['Authorization'] = (
+            'AWS4-HMAC-SHA256 Credential={}/{}, SignedHeaders={}, '
+            'Signature={}'.format(self.access_key, scope, signed_headers,
+                                  signature))
+        return headers
+
+
+def _write_stream(stream, fd, compress, level, threads):
+    if compress is None:
+        compression.copy_stream(stream, fd)
+        return
+    target = compression.writer(fd, compress, level, threads)
+    try:
+        compression.copy_stream(stream, target)
+    finally:
+        target.close()
+
+
+def _find_text(document, name):
+    for element in ElementTree.fromstring(document).iter():
+        if element.tag.split('}')[-1] == name:
+            return element.text
+    raise S3Error(None, 'No {} in response.'.format(name))
+
+
+BACKENDS = {
+    '': LocalBackend,
+    's3': S3Backend,
+}
+
+SOURCES = {
+    '': LocalSource,
+    'mongodb': GridFSSource,
+    'mongodb+srv': GridFSSource,
+}
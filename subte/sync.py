@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+import collections
+import errno
+import logging
+import os
+import os.path
+
+
+def temporary_name(name):
+    """Returns the hidden name a file is moved to while breaking a rename
+    cycle.
+    """
+    return '.{}.subte-tmp'.format(name)
+
+
+def plan_moves(desired, existing, key, existing_key=None):
+    """Matches ``existing`` names to ``desired`` ones. Names already in
+    place are kept when their ``existing_key``, which defaults to ``key``,
+    is their ``key``; otherwise desired names take, in order, the existing
+    names with the same key. Names whose key is ``None`` never match.
+
+    Returns the ``(old, new)`` renames, the desired names with no match,
+    which must be copied, and the existing names left over, which must be
+    deleted.
+    """
+    existing_key = existing_key or key
+    present = set(existing)
+    kept = set(name for name in desired if name in present and
+               key(name) is not None and key(name) == existing_key(name))
+    available = collections.defaultdict(collections.deque)
+    for name in existing:
+        if name not in kept:
+            available[existing_key(name)].append(name)
+    renames = []
+    missing = []
+    for name in desired:
+        if name in kept:
+            continue
+        candidates = None
+        if key(name) is not None:
+            candidates = available.get(key(name))
+        if candidates:
+            renames.append((candidates.popleft(), name))
+        else:
+            missing.append(name)
+    stale = [name for names in available.values() for name in names]
+    return renames, missing, stale
+
+
+def order_moves(renames, temporary=temporary_name):
+    """Orders ``(old, new)`` renames so that no name is overwritten before
+    its file has been moved away. Cycles are broken by moving one of their
+    files to a ``temporary`` name first. Runs in linear time.
+    """
+    pending = dict(renames)
+    by_target = dict((new, old) for old, new in renames)
+    ready = collections.deque(sorted(old for old, new in renames
+                                     if new not in pending))
+    operations = []
+    while pending:
+        if ready:
+            old = ready.popleft()
+            operations.append((old, pending.pop(old)))
+        else:
+            old = min(pending)
+            new = pending.pop(old)
+            moved = temporary(old)
+            operations.append((old, moved))
+            pending[moved] = new
+            by_target[new] = moved
+        blocked = by_target.get(old)
+        if blocked in pending:
+            ready.append(blocked)
+    return operations
+
+
+def apply_moves(directory, operations):
+    """Renames the files of ``directory`` in order. Either every rename is
+    applied or, on the first error, the applied ones are undone and the
+    error is raised.
+    """
+    applied = []
+    try:
+        for old, new in operations:
+            target = os.path.join(directory, new)
+            if os.path.lexists(target):
+                raise OSError(errno.EEXIST, 'Rename target exists', target)
+            os.rename(os.path.join(directory, old), target)
+            applied.append((old, new))
+    except OSError:
+        for old, new in reversed(applied):
+            try:
+                os.rename(os.path.join(directory, new),
+                          os.path.join(directory, old))
+            except OSError as e:
+                logging.error('Could not undo rename of %s to %s: %s', old,
+                              new, e)
+        raise
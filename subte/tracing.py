@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+import contextlib
+import json
+import os
+import threading
+import time
+
+
+class Tracer(object):
+    """Records spans as Chrome trace events, viewable in chrome://tracing or
+    Perfetto.
+
+    Events are appended to an in-memory list, which needs no lock, and are
+    only serialized by ``write`` at the end of the run.
+    """
+
+    def __init__(self):
+        self.events = []
+        self.threads = {}
+        self.pid = os.getpid()
+        self.origin = time.time()
+
+    @contextlib.contextmanager
+    def span(self, name, category='subte', **args):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add(name, start, time.time(), category, args)
+
+    def add(self, name, start, end, category='subte', args=None):
+        """Records a complete event from ``start`` to ``end`` on the calling
+        thread.
+        """
+        thread = threading.current_thread()
+        self.threads[thread.ident] = thread.name
+        event = {'name': name, 'cat': category, 'ph': 'X',
+                 'ts': (start - self.origin) * 1e6,
+                 'dur': (end - start) * 1e6,
+                 'pid': self.pid, 'tid': thread.ident}
+        if args:
+            event['args'] = args
+        self.events.append(event)
+
+    def get_trace(self):
+        metadata = [{'name': 'thread_name', 'ph': 'M', 'pid': self.pid,
+                     'tid': ident, 'args': {'name': name}}
+                    for ident, name in sorted(self.threads.items())]
+        return {'traceEvents': metadata + self.events,
+                'displayTimeUnit': 'ms'}
+
+    def write(self, path):
+        with open(path, 'w') as fd:
+            json.dump(self.get_trace(), fd, separators=(',', ':'))
+
+
+class NullTracer(object):
+    """Tracer used when tracing is disabled.
+    """
+
+    @contextlib.contextmanager
+    def span(self, name, category='subte', **args):
+        yield
+
+    def add(self, name, start, end, category='subte', args=None):
+        pass
+
+    def write(self, path):
+        pass
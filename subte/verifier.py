@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import logging
+import multiprocessing
+import os
+import os.path
+import sys
+
+from multiprocessing.pool import ThreadPool
+
+from subte import compression
+from subte.generator import Generator
+from subte.storage import content_digest
+
+
+class Verifier(Generator):
+
+    NAME = 'subte-verify'
+
+    def set_arguments(self, parser):
+        super(Verifier, self).set_arguments(parser)
+        parser.set_defaults(jobs=multiprocessing.cpu_count())
+        parser.add_argument('--algorithm', type=str, default='sha1',
+                            choices=sorted(hashlib.algorithms),
+                            help='Hash algorithm')
+
+    def prepare(self):
+        super(Verifier, self).prepare()
+        self.results = None
+        self.valid = False
+        self.report = None
+
+    def handle(self):
+        expected = self.plan_outputs()
+        missing = []
+        extra = []
+        pairs = []
+        for source_dir, target_dir in self.languages:
+            present = self.list_outputs(target_dir)
+            missing.extend(self.label(target_dir, name)
+                           for name in expected if name not in present)
+            extra.extend(self.label(target_dir, name)
+                         for name in present if name not in expected)
+            pairs.extend((source_dir, target_dir, origin, name)
+                         for name, origin in expected.items()
+                         if name in present)
+        missing.sort()
+        extra.sort()
+        pool = ThreadPool(max(1, self.arguments.jobs))
+        try:
+            results = pool.imap_unordered(self.compare, pairs)
+            mismatched = sorted(name for name, equal in results if not equal)
+        finally:
+            pool.close()
+            pool.join()
+        for name in missing:
+            logging.warning('Missing %s', name, extra={
+                'operation': 'verify', 'destination': name,
+                'error': 'missing'})
+        for name in extra:
+            logging.warning('Unexpected %s', name, extra={
+                'operation': 'verify', 'destination': name,
+                'error': 'extra'})
+        for name in mismatched:
+            logging.warning('Mismatched %s', name, extra={
+                'operation': 'verify', 'destination': name,
+                'error': 'mismatch'})
+        self.report = {
+            'checked': len(pairs),
+            'missing': missing,
+            'extra': extra,
+            'mismatched': mismatched,
+        }
+        self.valid = not (missing or extra or mismatched)
+        logging.info('Verified %d files: %d missing, %d extra, %d mismatched',
+                     len(pairs), len(missing), len(extra), len(mismatched))
+
+    def get_report(self):
+        return self.report
+
+    def plan_outputs(self):
+        """Returns a dictionary mapping each expected file of a target
+        directory to its origin in the paired source directory.
+        """
+        suffix = compression.SUFFIXES.get(self.arguments.compress, '')
+        expected = {}
+        for index, item in enumerate(self.mapping):
+            for source, filename in self.plan_item(index + 1, item):
+                origin, destination = self.orient(source, filename)
+                expected[destination + suffix] = origin
+        return expected
+
+    def list_outputs(self, target_dir):
+        if not os.path.isdir(target_dir):
+            return set()
+        return set(name for name in os.listdir(target_dir)
+                   if os.path.isfile(os.path.join(target_dir, name)))
+
+    def compare(self, pair):
+        """Returns ``(label, equal)`` for a ``(source_dir, target_dir,
+        origin, destination)`` tuple. Compressed files are compared by
+        their decompressed content; the hashes of uncompressed files are
+        skipped when their sizes differ.
+        """
+        source_dir, target_dir, origin, destination = pair
+        label = self.label(target_dir, destination)
+        origin_path, origin_codec = compression.resolve(
+            os.path.join(source_dir, origin))
+        destination_path = os.path.join(target_dir, destination)
+        destination_codec = compression.detect(destination)
+        try:
+            if (origin_codec is None and destination_codec is None and
+               os.path.getsize(origin_path) !=
+               os.path.getsize(destination_path)):
+                return label, False
+            algorithm = self.arguments.algorithm
+            return label, (content_digest(origin_path, algorithm) ==
+                           content_digest(destination_path, algorithm))
+        except (IOError, OSError) as e:
+            logging.error('%s', e, extra={
+                'operation': 'verify', 'source': origin,
+                'destination': label, 'error': str(e)})
+            return label, False
+
+
+def main():
+    verifier = Verifier()
+    verifier.run()
+    sys.exit(0 if getattr(verifier, 'valid', False) else 1)
+
+if __name__ == '__main__':
+    main()
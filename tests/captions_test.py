@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+import os
+import shutil
+import tempfile
+
+from StringIO import StringIO
+
+from subte import captions
+from subte.captions import (CaptionError, Cue, CueStore, format_timestamp,
+                            iter_cues, parse_timestamp, write_cues)
+
+SRT = '''\xef\xbb\xbf1
+00:00:01,000 --> 00:00:02,500
+Hola mundo
+
+2
+00:00:03,000 --> 00:01:04,250
+Dos l\xc3\xadneas
+de texto
+'''
+
+VTT = '''WEBVTT
+
+NOTE a comment
+
+intro
+00:01.000 --> 00:02.500 align:start
+Hola mundo
+
+01:00:03.000 --> 01:00:04.000
+Adi\xc3\xb3s
+'''
+
+
+class CaptionsTest(unittest.TestCase):
+
+    def test_timestamps(self):
+        self.assertEquals(parse_timestamp('01:02:03,004'), 3723004)
+        self.assertEquals(parse_timestamp('02:03.004'), 123004)
+        self.assertEquals(format_timestamp(3723004), '01:02:03,004')
+        self.assertEquals(format_timestamp(123004, '.'), '00:02:03.004')
+        for value in ('1:2:3', '00:61:00,000', 'x'):
+            self.assertRaises(CaptionError, parse_timestamp, value)
+
+    def test_srt(self):
+        cues = list(iter_cues(StringIO(SRT)))
+        self.assertEquals(cues, [
+            Cue(u'1', 1000, 2500, u'Hola mundo'),
+            Cue(u'2', 3000, 64250, u'Dos l\xedneas\nde texto'),
+        ])
+
+    def test_vtt(self):
+        cues = list(iter_cues(StringIO(VTT)))
+        self.assertEquals(cues, [
+            Cue(u'intro', 1000, 2500, u'Hola mundo'),
+            Cue(None, 3603000, 3604000, u'Adi\xf3s'),
+        ])
+
+    def test_errors(self):
+        with self.assertRaises(CaptionError) as cm:
+            list(iter_cues(StringIO('1\n00:00:01 --> 00:00:02\nx\n')))
+        self.assertEquals(cm.exception.line, 2)
+        with self.assertRaises(CaptionError) as cm:
+            list(iter_cues(StringIO('1\n00:00:01,000 --> 00:00:02,000\n'
+                                    '\xff\n')))
+        self.assertEquals(cm.exception.line, 3)
+
+    def test_write_cues(self):
+        cues = list(iter_cues(StringIO(SRT)))
+        output = StringIO()
+        write_cues(output, cues)
+        self.assertEquals(list(iter_cues(StringIO(output.getvalue()))), cues)
+        output = StringIO()
+        write_cues(output, list(iter_cues(StringIO(VTT))), vtt=True)
+        self.assertTrue(output.getvalue().startswith('WEBVTT\n\nintro\n'
+                                                     '00:00:01.000 --> '))
+
+
+class CueStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_parse(self):
+        for data in (SRT, VTT, SRT.replace('\n', '\r\n')):
+            store = CueStore()
+            self.assertEquals(store.parse(data), 2)
+            self.assertEquals(list(store), list(iter_cues(StringIO(data))))
+        self.assertEquals(store[-1], Cue(u'2', 3000, 64250,
+                                         u'Dos l\xedneas\nde texto'))
+        self.assertEquals(list(store.starts), [1000, 3000])
+        self.assertRaises(IndexError, store.__getitem__, 2)
+
+    def test_errors(self):
+        store = CueStore()
+        store.parse(SRT)
+        with self.assertRaises(CaptionError) as cm:
+            store.parse('1\n00:00:01,000 --> 00:00:02,000\nx\n\n'
+                        '2\n00:00:01 --> 00:00:02\nx\n')
+        self.assertEquals((cm.exception.line, cm.exception.code),
+                          (6, 'timing'))
+        self.assertEquals(list(store), list(iter_cues(StringIO(SRT))))
+        self.assertEquals(len(store.text), store.text_offsets[-1])
+        with self.assertRaises(CaptionError) as cm:
+            CueStore().parse('1\n00:00:01,000 --> 00:00:02,000\n\xff\n')
+        self.assertEquals((cm.exception.line, cm.exception.code),
+                          (3, 'encoding'))
+
+    def test_write(self):
+        store = CueStore()
+        store.parse(VTT)
+        output = StringIO()
+        store.write(output, vtt=True)
+        expected = StringIO()
+        write_cues(expected, list(iter_cues(StringIO(VTT))), vtt=True)
+        self.assertEquals(output.getvalue(), expected.getvalue())
+        output = StringIO()
+        store.write(output)
+        self.assertEquals(list(iter_cues(StringIO(output.getvalue()))),
+                          [Cue(u'1', 1000, 2500, u'Hola mundo'),
+                           Cue(u'2', 3603000, 3604000, u'Adi\xf3s')])
+
+    def test_save_and_open(self):
+        store = CueStore.from_cues(list(iter_cues(StringIO(VTT))))
+        path = os.path.join(self.directory, 'cues.store')
+        store.save(path)
+        for module in (captions.numpy, None):
+            numpy = captions.numpy
+            captions.numpy = module
+            try:
+                mapped = CueStore.open(path)
+            finally:
+                captions.numpy = numpy
+            try:
+                self.assertEquals(list(mapped), list(store))
+                self.assertRaises(ValueError, mapped.append, 0, 1, u'x')
+                copy = os.path.join(self.directory, 'copy.store')
+                mapped.save(copy)
+                with open(path, 'rb') as expected:
+                    with open(copy, 'rb') as actual:
+                        self.assertEquals(actual.read(), expected.read())
+            finally:
+                mapped.close()
+        with open(path, 'wb') as fd:
+            fd.write('x' * 64)
+        self.assertRaises(ValueError, CueStore.open, path)
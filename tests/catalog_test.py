@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import sys
+
+from StringIO import StringIO
+
+from subte.catalog import Catalog, CatalogQuery
+from subte.generator import Generator
+from subte.storage import file_digest
+
+from tests.utils import MappingTestCase
+
+
+class CatalogTest(MappingTestCase):
+
+    SOURCES = {'a.srt': 'a', 'b.srt': 'b', 'c.srt': 'c'}
+    MAPPING = [{'concept': u'Intro to the shell', 'lecture': 'a',
+                'answer': 'b'},
+               {'concept': u'Pipes', 'lecture': 'c'},
+               {'concept': u'Missing', 'lecture': 'd'}]
+    TARGET = 'm101'
+
+    def setUp(self):
+        super(CatalogTest, self).setUp()
+        self.catalog_file = os.path.join(self.directory, 'catalog.db')
+
+    def generate(self, *args):
+        self.run_command(Generator, '-f', '--catalog', self.catalog_file,
+                         *args)
+
+    def test_generate(self):
+        self.generate()
+        self.generate()
+        catalog = Catalog(self.catalog_file)
+        try:
+            rows = catalog.find_concept(u'%shell%')
+            self.assertEquals([row['filename'] for row in rows],
+                              ['01-intro_to_the_shell-answer.srt',
+                               '01-intro_to_the_shell-lecture.srt'])
+            self.assertEquals(rows[0]['status'], 'ok')
+            outputs = catalog.find_source('c.srt')
+            self.assertEquals(len(outputs), 1)
+            self.assertEquals(outputs[0]['filename'], '02-pipes-lecture.srt')
+            self.assertEquals(outputs[0]['number'], 2)
+            self.assertEquals(outputs[0]['size'], 1)
+            self.assertEquals(outputs[0]['digest'], file_digest(
+                os.path.join(self.target_dir, '02-pipes-lecture.srt')))
+            statuses = catalog.query('SELECT number, status FROM items '
+                                     'ORDER BY number')
+            self.assertEquals([tuple(row.values()) for row in statuses],
+                              [(1, 'ok'), (2, 'ok'), (3, 'error')])
+        finally:
+            catalog.close()
+
+    def test_batches(self):
+        catalog = Catalog(self.catalog_file, batch_size=2)
+        try:
+            catalog.add_item('m101', 1, u'Intro', u'intro', 'ok')
+            self.assertEquals(catalog.query('SELECT * FROM items'), [])
+            catalog.add_output('m101', '01-intro-lecture.srt', 'm101', 1,
+                               'lecture', 'source', 'a.srt', 1, None)
+            self.assertEquals(len(catalog.query('SELECT * FROM items')), 1)
+        finally:
+            catalog.close()
+
+    def test_query_command(self):
+        self.generate()
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            CatalogQuery([self.catalog_file, '--json', '-l', 'CRITICAL',
+                          'source', 'a.srt']).run()
+            output = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+        rows = [json.loads(line) for line in output.splitlines()]
+        self.assertEquals([row['filename'] for row in rows],
+                          ['01-intro_to_the_shell-lecture.srt'])
+
+    def test_pairs(self):
+        other_dir = os.path.join(self.directory, 'm101-es')
+        self.generate('-p', self.source_dir, other_dir)
+        catalog = Catalog(self.catalog_file)
+        try:
+            outputs = catalog.query('SELECT course, target_dir FROM outputs '
+                                    'WHERE source = ? ORDER BY course',
+                                    ('c.srt',))
+            self.assertEquals([tuple(row.values()) for row in outputs],
+                              [('m101', self.target_dir),
+                               ('m101-es', other_dir)])
+            items = catalog.query('SELECT course, number FROM items '
+                                  'ORDER BY course, number')
+            self.assertEquals([tuple(row.values()) for row in items],
+                              [('m101', 1), ('m101', 2), ('m101', 3),
+                               ('m101-es', 1), ('m101-es', 2),
+                               ('m101-es', 3)])
+        finally:
+            catalog.close()
+
+    def test_prune(self):
+        self.generate()
+        self.write_mapping([{'concept': u'Pipes', 'lecture': 'c'}])
+        self.generate()
+        catalog = Catalog(self.catalog_file)
+        try:
+            items = catalog.query('SELECT number, concept FROM items')
+            self.assertEquals([tuple(row.values()) for row in items],
+                              [(1, u'Pipes')])
+            outputs = catalog.query('SELECT filename, source FROM outputs')
+            self.assertEquals([tuple(row.values()) for row in outputs],
+                              [('01-pipes-lecture.srt', 'c.srt')])
+        finally:
+            catalog.close()
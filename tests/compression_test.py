@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+import gzip
+import os
+import shutil
+import tempfile
+
+from subte import compression
+from subte.generator import Generator
+from subte.linter import lint_file
+
+from tests.utils import MappingTestCase
+
+CAPTION = '1\n00:00:01,000 --> 00:00:02,000\nHello\n\n'
+
+
+class CompressionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def compress(self, name, content, codec='gzip'):
+        path = os.path.join(self.directory, name)
+        with open(path, 'wb') as fd:
+            target = compression.writer(fd, codec)
+            target.write(content)
+            target.close()
+        with open(path, 'rb') as fd:
+            return fd.read()
+
+    def test_gzip_is_deterministic(self):
+        first = self.compress('a.srt.gz', CAPTION)
+        self.assertEquals(self.compress('b.srt.gz', CAPTION), first)
+        with compression.open_file(os.path.join(self.directory,
+                                                'a.srt.gz')) as fd:
+            self.assertEquals(fd.read(), CAPTION)
+
+    @unittest.skipIf(compression.zstandard is None, 'zstandard missing')
+    def test_zstd(self):
+        self.compress('a.srt.zst', CAPTION, 'zstd')
+        with compression.open_file(os.path.join(self.directory,
+                                                'a.srt.zst')) as fd:
+            self.assertEquals(fd.read(), CAPTION)
+
+    def test_resolve(self):
+        path = os.path.join(self.directory, 'a.srt')
+        self.assertEquals(compression.resolve(path), (path, None))
+        self.compress('a.srt.gz', CAPTION)
+        self.assertEquals(compression.resolve(path), (path + '.gz', 'gzip'))
+        self.assertRaises(ValueError, compression.check, 'lzma')
+
+    def test_lint_compressed(self):
+        self.compress('a.srt.gz', CAPTION)
+        path = os.path.join(self.directory, 'a.srt.gz')
+        self.assertEquals(lint_file(path), (path, []))
+
+
+class GeneratorCompressionTest(MappingTestCase):
+
+    SOURCES = {'a.srt': CAPTION, 'b.srt.gz': CAPTION}
+    MAPPING = [{'concept': 'Intro', 'lecture': 'a', 'answer': 'b'}]
+
+    def test_compress_and_reverse(self):
+        generator = self.run_command(Generator, '-f', '-z', 'gzip',
+                                     '--lint')
+        self.assertEquals(sorted(os.listdir(self.target_dir)),
+                          ['01-intro-answer.srt.gz',
+                           '01-intro-lecture.srt.gz'])
+        self.assertEquals(generator.stats['errors'], 0)
+        self.assertEquals(generator.lint.issues, {})
+        for name in os.listdir(self.target_dir):
+            with gzip.open(os.path.join(self.target_dir, name)) as fd:
+                self.assertEquals(fd.read(), CAPTION)
+        restored_dir = os.path.join(self.directory, 'restored')
+        self.run_command(Generator, '-f', '-r', '-s', self.target_dir, '-t',
+                         restored_dir)
+        self.assertEquals(sorted(os.listdir(restored_dir)),
+                          ['a.srt', 'b.srt'])
+        with open(os.path.join(restored_dir, 'b.srt')) as fd:
+            self.assertEquals(fd.read(), CAPTION)
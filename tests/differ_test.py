@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+import gzip
+import os
+
+from subte.captions import Cue, write_cues
+from subte.differ import Change, Differ, align, summarize
+
+from tests.utils import MappingTestCase
+
+
+def cues(*specs):
+    return [Cue(None, start, start + 1000, text) for start, text in specs]
+
+
+class AlignTest(unittest.TestCase):
+
+    def test_equal(self):
+        old = cues((0, u'a'), (1000, u'b'))
+        self.assertEquals(align(old, old), [Change(0, 0, False, False),
+                                            Change(1, 1, False, False)])
+
+    def test_timing_shift(self):
+        old = cues((0, u'a'), (1000, u'b'), (2000, u'c'))
+        new = cues((500, u'a'), (1500, u'b'), (2500, u'c'))
+        changes = align(old, new)
+        self.assertEquals(summarize(changes), {
+            'unchanged': 0, 'text': 0, 'timing': 3, 'inserted': 0,
+            'deleted': 0})
+
+    def test_text_changes(self):
+        old = cues((0, u'a'), (1000, u'b'), (2000, u'c'), (3000, u'd'))
+        new = cues((0, u'a'), (1000, u'B'), (2000, u'c'), (2500, u'new'),
+                   (3000, u'd'), (4000, u'e'))
+        self.assertEquals(align(old, new), [
+            Change(0, 0, False, False),
+            Change(1, 1, True, False),
+            Change(2, 2, False, False),
+            Change(None, 3, True, True),
+            Change(3, 4, False, False),
+            Change(None, 5, True, True),
+        ])
+        self.assertEquals(summarize(align(new, old))['deleted'], 2)
+
+    def test_repeated_text(self):
+        old = cues((0, u'x'), (1000, u'same'), (2000, u'same'), (3000, u'y'))
+        new = cues((0, u'x'), (1000, u'same'), (2000, u'same'),
+                   (3000, u'same'), (4000, u'y'))
+        self.assertEquals(summarize(align(old, new)), {
+            'unchanged': 3, 'text': 0, 'timing': 1, 'inserted': 1,
+            'deleted': 0})
+
+
+class DifferTest(MappingTestCase):
+
+    MAPPING = [{'concept': 'Intro', 'lecture': 'a', 'answer': 'b'}]
+
+    def setUp(self):
+        super(DifferTest, self).setUp()
+        os.makedirs(self.target_dir)
+        self.write(self.target_dir, '01-intro-lecture.srt',
+                   cues((0, u'a'), (1000, u'b')))
+        self.write(self.source_dir, 'a.srt', cues((0, u'a'), (1000, u'c')))
+
+    def write(self, directory, name, cues):
+        with open(os.path.join(directory, name), 'w') as fd:
+            write_cues(fd, cues)
+
+    def test_run(self):
+        differ = self.run_command(Differ, '-j', '2')
+        report = differ.get_report()
+        self.assertEquals(sorted(report), ['01-intro-answer.srt',
+                                           '01-intro-lecture.srt'])
+        self.assertIn('error', report['01-intro-answer.srt'])
+        self.assertEquals(report['01-intro-lecture.srt']['changes'], [
+            {'old': 1, 'new': 1, 'text': True, 'timing': False}])
+        self.assertEquals(report['01-intro-lecture.srt']['summary']['text'],
+                          1)
+
+    def test_pairs(self):
+        source_es = os.path.join(self.directory, 'source_es')
+        target_es = os.path.join(self.directory, 'target_es')
+        os.makedirs(source_es)
+        os.makedirs(target_es)
+        self.write(source_es, 'a.srt', cues((0, u'x')))
+        self.write(target_es, '01-intro-lecture.srt', cues((0, u'x')))
+        differ = self.run_command(Differ, '-p', source_es, target_es, '-j',
+                                  '2')
+        report = differ.get_report()
+        self.assertEquals(sorted(report), [
+            'target/01-intro-answer.srt', 'target/01-intro-lecture.srt',
+            'target_es/01-intro-answer.srt',
+            'target_es/01-intro-lecture.srt'])
+        self.assertEquals(
+            report['target_es/01-intro-lecture.srt']['changes'], [])
+
+    def test_compressed(self):
+        path = os.path.join(self.target_dir, '01-intro-lecture.srt')
+        with open(path) as fd:
+            data = fd.read()
+        os.remove(path)
+        with gzip.open(path + '.gz', 'wb') as fd:
+            fd.write(data)
+        differ = self.run_command(Differ, '-z', 'gzip', '-j', '1')
+        self.assertEquals(
+            differ.get_report()['01-intro-lecture.srt']['summary']['text'],
+            1)
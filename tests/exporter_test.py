@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+import collections
+import gzip
+import json
+import os
+
+from subte.exporter import Exporter, read_rows
+
+from tests.utils import MappingTestCase
+
+CAPTION = '1\n00:00:01,000 --> 00:00:02,500\nHola\n\n' \
+          '2\n00:00:03,000 --> 00:00:04,000\nMundo\nentero\n\n'
+
+
+class ExporterTest(MappingTestCase):
+
+    SOURCES = {'a.srt': CAPTION, 'broken.srt': '1\nnot a timing\ntext\n',
+               'b.srt.gz': CAPTION}
+    MAPPING = [{'concept': u'Introducción', 'lecture': 'a', 'answer': 'b'},
+               {'concept': 'Broken', 'lecture': 'broken'},
+               {'concept': 'Missing', 'answer': 'missing'}]
+    TARGET = 'm101'
+
+    def setUp(self):
+        super(ExporterTest, self).setUp()
+        self.output = os.path.join(self.directory, 'cues.jsonl')
+
+    def export(self, *args):
+        return self.run_command(Exporter, '-O', self.output, *args)
+
+    def read_output(self):
+        with open(self.output) as fd:
+            return [json.loads(line, object_pairs_hook=collections.OrderedDict)
+                    for line in fd]
+
+    def test_read_rows(self):
+        path, rows, error = read_rows((os.path.join(self.source_dir,
+                                                    'b.srt'), ('x',)))
+        self.assertTrue(path.endswith('b.srt.gz'))
+        self.assertEquals(rows, [('x', u'1', 1000, 2500, u'Hola'),
+                                 ('x', u'2', 3000, 4000, u'Mundo\nentero')])
+        self.assertEquals(error, None)
+        self.assertEquals(read_rows((os.path.join(self.source_dir,
+                                                  'broken.srt'), ()))[1],
+                          None)
+
+    def test_export(self):
+        exporter = self.export('-j', '2', '--batch-size', '3')
+        rows = self.read_output()
+        self.assertEquals(rows[0].keys(), [
+            'course', 'number', 'concept', 'file_type', 'index', 'start',
+            'end', 'text'])
+        self.assertEquals(rows[0].values(), [
+            'm101', 1, u'Introducción', 'lecture', '1', 1000, 2500, 'Hola'])
+        self.assertEquals([(row['file_type'], row['text']) for row in rows], [
+            ('lecture', 'Hola'), ('lecture', 'Mundo\nentero'),
+            ('answer', 'Hola'), ('answer', 'Mundo\nentero')])
+        self.assertEquals(exporter.stats, {'files': 2, 'cues': 4,
+                                           'errors': 2})
+
+    def test_compressed_output(self):
+        self.output += '.gz'
+        self.export('-j', '1')
+        with gzip.open(self.output) as fd:
+            self.assertEquals(len(fd.read().splitlines()), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
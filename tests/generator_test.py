@@ -1,14 +1,20 @@
 # -*- coding: utf-8 -*-
+import argparse
 import json
+import os
+import shutil
 try:
     import unittest2 as unittest
 except ImportError:
     import unittest
 
+from subte import generator as generator_module
 from subte.process import Process
-from subte.generator import JSONMode
+from subte.generator import (AsyncGenerator, Generator, JSONMode,
+                             MongoDBMode, parse_filename, shard_type,
+                             strip_options)
 
-from tests.utils import capture_sys_output
+from tests.utils import MappingTestCase, capture_sys_output
 
 
 class JSONModeTest(unittest.TestCase):
@@ -47,3 +53,273 @@ class JSONModeTest(unittest.TestCase):
         with open(file_path) as fd:
             self.assertEquals(proc.current_mode.mapping,
                               json.loads(fd.read()))
+
+
+class GeneratorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.generator = Generator(['-s', 'source', '-t', 'target', 'json',
+                                    'tests/mapping.json'])
+
+    def test_plan_item(self):
+        item = {'concept': u'Introducción: ¿Qué es?', 'lecture': 'a',
+                'answer': 'b'}
+        self.assertEquals(self.generator.plan_item(3, item), [
+            ('a.srt', '03-introduccion_que_es-lecture.srt'),
+            ('b.srt', '03-introduccion_que_es-answer.srt'),
+        ])
+        item = {'concept': u'Shell', 'answer': 'b'}
+        self.assertEquals(self.generator.plan_item(12, item),
+                          [('b.srt', '12-shell-answer.srt')])
+        self.assertEquals(self.generator.plan_item(1, {'concept': u'x'}), [])
+
+    def test_parse_filename(self):
+        filename = self.generator.get_filename(7, u'que_es', 'answer')
+        self.assertEquals(parse_filename(filename), {
+            'number': 7, 'flat_concept': u'que_es', 'file_type': 'answer',
+            'extension': 'srt'})
+        self.assertEquals(parse_filename('07-que-es-answer.srt'), None)
+        self.assertEquals(parse_filename('notes.txt'), None)
+
+    def test_orient(self):
+        self.assertEquals(self.generator.orient('a', 'b'), ('a', 'b'))
+        self.generator.arguments.reverse = True
+        self.assertEquals(self.generator.orient('a', 'b'), ('b', 'a'))
+
+
+class FakeCollection(object):
+
+    def __init__(self, documents=()):
+        self.documents = list(documents)
+        self.batches = []
+
+    def find(self):
+        return iter(self.documents)
+
+    def bulk_write(self, requests, ordered=True):
+        self.batches.append((requests, ordered))
+
+        class Result(object):
+            modified_count = len(requests)
+        return Result()
+
+
+class FakeMongoClient(object):
+
+    collection = None
+    connections = []
+
+    def __init__(self, uri):
+        self.closed = False
+        self.connections.append(self)
+
+    def get_default_database(self):
+        return {'mapping': self.collection}
+
+    def close(self):
+        self.closed = True
+
+
+class MongoDBModeTest(unittest.TestCase):
+
+    def test_write_results(self):
+        parser = argparse.ArgumentParser()
+        mode = MongoDBMode(parser.add_subparsers())
+        mode.arguments = mode.subparser.parse_args(
+            ['mongodb://localhost/test', 'mapping', '-w', 'subte', '-b', '2'])
+        collection = FakeCollection()
+        mode.write_results(collection, [
+            (1, ['01-intro-lecture.srt'], 'ok'),
+            (2, [], 'error'),
+            (3, [], 'skipped'),
+        ])
+        self.assertEquals([len(requests) for requests, _ in
+                           collection.batches], [2, 1])
+        self.assertFalse(any(ordered for _, ordered in collection.batches))
+        request = collection.batches[0][0][0]
+        self.assertEquals(request._filter, {'_id': 1})
+        self.assertEquals(request._doc, {'$set': {'subte': {
+            'filenames': ['01-intro-lecture.srt'], 'status': 'ok'}}})
+
+
+class GeneratorResultsTest(MappingTestCase):
+
+    SOURCES = {'a.srt': 'a'}
+
+    def setUp(self):
+        super(GeneratorResultsTest, self).setUp()
+        self.generator = Generator(['-s', self.source_dir, '-t',
+                                    self.target_dir, '-f', 'json',
+                                    self.mapping_file])
+        self.generator.prepare()
+        self.generator.results = []
+
+    def test_process_item(self):
+        self.generator.process_item(1, {'_id': 1, 'concept': u'A',
+                                        'lecture': 'a'})
+        self.generator.process_item(2, {'_id': 2, 'concept': u'B',
+                                        'lecture': 'a', 'answer': 'b'})
+        self.generator.process_item(3, {'_id': 3, 'concept': u'C'})
+        self.assertEquals(self.generator.results, [
+            (1, ['01-a-lecture.srt'], 'ok'),
+            (2, ['02-b-lecture.srt'], 'error'),
+            (3, [], 'skipped'),
+        ])
+
+
+class ConceptsTestCase(MappingTestCase):
+
+    SOURCES = dict(('{}.srt'.format(index), str(index))
+                   for index in range(5))
+    MAPPING = ([{'concept': 'Concept {}'.format(index),
+                 'lecture': str(index)} for index in range(5)] +
+               [{'concept': 'Missing', 'answer': 'missing'}])
+
+
+class WriteBackTest(ConceptsTestCase):
+
+    def setUp(self):
+        super(WriteBackTest, self).setUp()
+        with open(self.mapping_file) as fd:
+            documents = json.load(fd)
+        for index, document in enumerate(documents):
+            document['_id'] = index
+        FakeMongoClient.collection = FakeCollection(documents)
+        FakeMongoClient.connections = []
+        self.client = generator_module.MongoClient
+        generator_module.MongoClient = FakeMongoClient
+
+    def tearDown(self):
+        generator_module.MongoClient = self.client
+        super(WriteBackTest, self).tearDown()
+
+    def test_run(self):
+        generator = Generator(['-s', self.source_dir, '-t', self.target_dir,
+                               '-f', '-l', 'CRITICAL', 'db',
+                               'mongodb://localhost/test', 'mapping', '-w',
+                               'subte'])
+        generator.run()
+        self.assertEquals(generator.stats['copied'], 5)
+        batches = FakeMongoClient.collection.batches
+        self.assertEquals(len(batches), 1)
+        updates = dict((request._filter['_id'], request._doc['$set'][
+            'subte']['status']) for request in batches[0][0])
+        self.assertEquals(updates, {0: 'ok', 1: 'ok', 2: 'ok', 3: 'ok',
+                                    4: 'ok', 5: 'error'})
+        self.assertEquals(len(FakeMongoClient.connections), 2)
+        self.assertTrue(all(connection.closed
+                            for connection in FakeMongoClient.connections))
+
+
+class ShardTest(ConceptsTestCase):
+
+    def generator(self, *args):
+        return Generator(list(args) + ['-s', self.source_dir, '-t',
+                                       self.target_dir, '-f', 'json',
+                                       self.mapping_file])
+
+    def test_shard_type(self):
+        self.assertEquals(shard_type('2/3'), (2, 3))
+        for value in ('0/3', '4/3', '1', 'a/b'):
+            self.assertRaises(argparse.ArgumentTypeError, shard_type, value)
+
+    def test_get_items(self):
+        numbers = []
+        for index in range(1, 4):
+            generator = self.generator('--shard', '{}/3'.format(index))
+            generator.prepare()
+            shard = [number for number, _ in generator.get_items()]
+            self.assertEquals(shard, range(index, 7, 3))
+            numbers.extend(shard)
+        self.assertEquals(sorted(numbers), range(1, 7))
+
+    def test_coordinate(self):
+        report_file = os.path.join(self.directory, 'report.json')
+        generator = self.generator('--shards', '2', '--report', report_file,
+                                   '-l', 'CRITICAL')
+        generator.run()
+        self.assertEquals(sorted(os.listdir(self.target_dir)), [
+            '0{}-concept_{}-lecture.srt'.format(index + 1, index)
+            for index in range(5)])
+        with open(report_file) as fd:
+            report = json.load(fd)
+        self.assertEquals(report['stats'], {'copied': 5, 'bytes': 5,
+                                            'errors': 1, 'skipped': 0,
+                                            'unchanged': 0})
+        self.assertEquals(report['errors'][0]['destination'],
+                          '06-missing-answer.srt')
+
+    def test_failed_shards(self):
+        metrics_file = os.path.join(self.directory, 'metrics.prom')
+        generator = self.generator('--shards', '2', '--metrics-file',
+                                   metrics_file, '-l', 'CRITICAL')
+        command = generator_module.SHARD_COMMAND
+        generator_module.SHARD_COMMAND = 'import sys; sys.exit(3)'
+        try:
+            generator.run()
+        finally:
+            generator_module.SHARD_COMMAND = command
+        self.assertEquals(generator.stats['errors'], 2)
+        self.assertEquals([error['shard'] for error in generator.errors],
+                          [1, 2])
+        with open(metrics_file) as fd:
+            metrics = fd.read()
+        self.assertIn('subte_copy_errors_total{course="target"} 2', metrics)
+        self.assertIn('subte_shard_failures_total{course="target"} 2',
+                      metrics)
+
+    def test_strip_options(self):
+        self.assertEquals(strip_options(
+            ['--report', 'a', '-j', '2', '--trace=t', '--reporting', 'x',
+             'json', 'm'], ('--report', '--trace')),
+            ['-j', '2', '--reporting', 'x', 'json', 'm'])
+
+
+class LanguagesTest(ConceptsTestCase):
+
+    def test_pairs(self):
+        source_es = os.path.join(self.directory, 'source_es')
+        target_es = os.path.join(self.directory, 'target_es')
+        os.makedirs(source_es)
+        for index in range(4):
+            with open(os.path.join(source_es, '{}.srt'.format(index)),
+                      'w') as fd:
+                fd.write('es')
+        expected = ['0{}-concept_{}-lecture.srt'.format(index + 1, index)
+                    for index in range(5)]
+        for order in ('mapping', 'inode'):
+            generator = Generator(['-s', self.source_dir, '-t',
+                                   self.target_dir, '-p', source_es,
+                                   target_es, '-f', '-o', order, '-l',
+                                   'CRITICAL', 'json', self.mapping_file])
+            generator.prepare()
+            generator.handle()
+            self.assertEquals(sorted(os.listdir(self.target_dir)), expected)
+            self.assertEquals(sorted(os.listdir(target_es)), expected[:4])
+            self.assertEquals(generator.stats['copied'], 9)
+            self.assertEquals(generator.stats['errors'], 3)
+            shutil.rmtree(target_es)
+
+
+class AsyncGeneratorTest(ConceptsTestCase):
+
+    def test_async_shards(self):
+        generator = AsyncGenerator(['--shards', '2', '--max-pending', '4',
+                                    '-s', self.source_dir, '-t',
+                                    self.target_dir, '-f', '-l', 'CRITICAL',
+                                    'json', self.mapping_file])
+        generator.run()
+        self.assertEquals(generator.stats['copied'], 5)
+        self.assertEquals(len(os.listdir(self.target_dir)), 5)
+
+    def test_async(self):
+        generator = AsyncGenerator(['-j', '3', '-s', self.source_dir, '-t',
+                                    self.target_dir, '-f', '-l', 'CRITICAL',
+                                    'json', self.mapping_file])
+        generator.run()
+        self.assertEquals(sorted(os.listdir(self.target_dir)), [
+            '0{}-concept_{}-lecture.srt'.format(index + 1, index)
+            for index in range(5)])
+        self.assertEquals(generator.stats, {'copied': 5, 'bytes': 5,
+                                            'errors': 1, 'skipped': 0,
+                                            'unchanged': 0})
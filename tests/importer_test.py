@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+
+from pymongo.errors import BulkWriteError
+
+from subte.generator import Generator
+from subte.importer import Importer, MongoDBMode, scan_captions
+
+
+class FakeCollection(object):
+
+    def __init__(self, fail=None):
+        self.batches = []
+        self.fail = fail
+
+    def insert_many(self, documents, ordered=True):
+        self.batches.append((documents, ordered))
+        if self.fail in documents:
+            raise BulkWriteError({
+                'nInserted': len(documents) - 1,
+                'writeErrors': [{'op': self.fail, 'errmsg': 'duplicate'}]})
+
+
+class ImporterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.captions_dir = os.path.join(self.directory, 'captions')
+        os.makedirs(self.captions_dir)
+        for filename in ('01-intro-lecture.srt', '01-intro-answer.srt',
+                         '02-shell_basics-lecture.srt', 'notes.txt',
+                         '03-pipes-answer.vtt'):
+            with open(os.path.join(self.captions_dir, filename), 'w') as fd:
+                fd.write(filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_scan_captions(self):
+        items, unparsed = scan_captions(self.captions_dir)
+        self.assertEquals(items, [
+            {'number': 1, 'concept': 'intro', 'lecture': '01-intro-lecture',
+             'answer': '01-intro-answer'},
+            {'number': 2, 'concept': 'shell basics',
+             'lecture': '02-shell_basics-lecture'}])
+        self.assertEquals(unparsed, ['03-pipes-answer.vtt', 'notes.txt'])
+
+    def test_jsonl_round_trip(self):
+        mapping_file = os.path.join(self.directory, 'mapping.jsonl')
+        Importer([self.captions_dir, '-l', 'CRITICAL', 'jsonl', '-o',
+                  mapping_file]).run()
+        with open(mapping_file) as fd:
+            items = [json.loads(line) for line in fd]
+        self.assertEquals(len(items), 2)
+        json_file = os.path.join(self.directory, 'mapping.json')
+        with open(json_file, 'w') as fd:
+            json.dump(items, fd)
+        target_dir = os.path.join(self.directory, 'target')
+        Generator(['-s', self.captions_dir, '-t', target_dir, '-f', '-l',
+                   'CRITICAL', 'json', json_file]).run()
+        self.assertEquals(sorted(os.listdir(target_dir)), [
+            '01-intro-answer.srt', '01-intro-lecture.srt',
+            '02-shell_basics-lecture.srt'])
+
+    def test_insert_items(self):
+        parser = argparse.ArgumentParser()
+        mode = MongoDBMode(parser.add_subparsers())
+        mode.arguments = mode.subparser.parse_args(
+            ['mongodb://localhost/test', 'mapping', '-b', '2'])
+        items = [{'number': number} for number in range(1, 6)]
+        collection = FakeCollection(fail=items[3])
+        self.assertEquals(mode.insert_items(collection, items), 4)
+        self.assertEquals([len(documents) for documents, _ in
+                           collection.batches], [2, 2, 1])
+        self.assertFalse(any(ordered for _, ordered in collection.batches))
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+import gzip
+import json
+import os
+import shutil
+import tempfile
+
+from subte import indexer
+from subte.indexer import TranslationIndex
+
+CUE = '{}\n00:00:0{},000 --> 00:00:0{},500\n{}\n\n'
+
+
+class TranslationIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.index_dir = os.path.join(self.directory, 'index')
+        self.course_dir = os.path.join(self.directory, 'm101')
+        os.makedirs(self.index_dir)
+        os.makedirs(self.course_dir)
+        self.write('01-intro-lecture.srt', [u'Bienvenidos al curso',
+                                            u'El shell de MongoDB'])
+        self.write('02-shell-answer.srt', [u'Usa el shell interactivo'])
+        self.write('notes.txt', [u'el shell'])
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, texts):
+        with open(os.path.join(self.course_dir, name), 'w') as fd:
+            for index, text in enumerate(texts):
+                fd.write(CUE.format(index + 1, index, index,
+                                    text.encode('utf-8')))
+
+    def search(self, query, prefix=False):
+        index = TranslationIndex(self.index_dir)
+        return [(hit['number'], hit['file_type'], hit['text'])
+                for hit in index.search(query, prefix)]
+
+    def test_search(self):
+        self.assertEquals(TranslationIndex(self.index_dir).update(
+            [self.course_dir]), 2)
+        self.assertEquals(self.search(u'EL SHELL'), [
+            (1, 'lecture', u'El shell de MongoDB'),
+            (2, 'answer', u'Usa el shell interactivo'),
+        ])
+        self.assertEquals(self.search(u'shell el'), [])
+        self.assertEquals(self.search(u'shell inter', prefix=True),
+                          [(2, 'answer', u'Usa el shell interactivo')])
+        self.assertEquals(self.search(u'bienvenido', prefix=True),
+                          [(1, 'lecture', u'Bienvenidos al curso')])
+        self.assertEquals(self.search(u'bienvenido'), [])
+        hit = TranslationIndex(self.index_dir).search(u'curso')[0]
+        self.assertEquals((hit['course'], hit['concept'], hit['start'],
+                           hit['end']), ('m101', 'intro', 0, 500))
+
+    def test_compressed(self):
+        with gzip.open(os.path.join(self.course_dir,
+                                    '03-crud-lecture.srt.gz'), 'wb') as fd:
+            fd.write(CUE.format(1, 0, 0, 'Inserta con la consola'))
+        self.assertEquals(TranslationIndex(self.index_dir).update(
+            [self.course_dir]), 3)
+        self.assertEquals(self.search(u'la consola'),
+                          [(3, 'lecture', u'Inserta con la consola')])
+
+    def test_incremental_update(self):
+        index = TranslationIndex(self.index_dir)
+        index.update([self.course_dir])
+        self.assertEquals(TranslationIndex(self.index_dir).update(
+            [self.course_dir]), 0)
+        self.write('02-shell-answer.srt', [u'Usa la consola'])
+        os.utime(os.path.join(self.course_dir, '02-shell-answer.srt'),
+                 (1, 1))
+        self.write('03-crud-lecture.srt', [u'Inserta con la consola'])
+        self.assertEquals(TranslationIndex(self.index_dir).update(
+            [self.course_dir]), 2)
+        self.assertEquals([hit[0] for hit in self.search(u'la consola')],
+                          [2, 3])
+        self.assertEquals([hit[0] for hit in self.search(u'el shell')], [1])
+        os.remove(os.path.join(self.course_dir, '01-intro-lecture.srt'))
+        TranslationIndex(self.index_dir).update([self.course_dir])
+        self.assertEquals(self.search(u'el shell'), [])
+
+    def test_compact(self):
+        max_segments = indexer.MAX_SEGMENTS
+        indexer.MAX_SEGMENTS = 1
+        try:
+            TranslationIndex(self.index_dir).update([self.course_dir])
+            self.write('03-crud-lecture.srt', [u'Inserta con el shell'])
+            TranslationIndex(self.index_dir).update([self.course_dir])
+        finally:
+            indexer.MAX_SEGMENTS = max_segments
+        index = TranslationIndex(self.index_dir)
+        self.assertEquals(len(index.manifest['segments']), 1)
+        self.assertEquals([name for name in os.listdir(self.index_dir)
+                           if name.endswith('.seg')],
+                          [index.manifest['segments'][0]['name'] + '.seg'])
+        self.assertEquals([hit[0] for hit in self.search(u'el shell')],
+                          [1, 2, 3])
+
+    def test_compact_size(self):
+        limits = indexer.MAX_SEGMENTS, indexer.SEGMENT_CUES
+        indexer.MAX_SEGMENTS, indexer.SEGMENT_CUES = 1, 2
+        try:
+            for number in range(3, 7):
+                self.write('0{}-extra-lecture.srt'.format(number),
+                           [u'Otra consola'])
+                TranslationIndex(self.index_dir).update([self.course_dir])
+            index = TranslationIndex(self.index_dir)
+            counts = [entry['cue_count']
+                      for entry in index.manifest['segments']]
+        finally:
+            indexer.MAX_SEGMENTS, indexer.SEGMENT_CUES = limits
+        self.assertTrue(max(counts) <= 3)
+        self.assertEquals(sum(counts), 7)
+        self.assertEquals([hit[0] for hit in self.search(u'otra consola')],
+                          [3, 4, 5, 6])
+
+    def test_search_limit(self):
+        for number in range(3, 10):
+            self.write('0{}-extra-lecture.srt'.format(number),
+                       [u'El shell otra vez'])
+        TranslationIndex(self.index_dir).update([self.course_dir])
+        decoded = []
+        doc = indexer.Segment.doc
+
+        def counting_doc(segment, doc_id):
+            decoded.append(doc_id)
+            return doc(segment, doc_id)
+
+        indexer.Segment.doc = counting_doc
+        try:
+            hits = TranslationIndex(self.index_dir).search(u'el shell',
+                                                           limit=2)
+        finally:
+            indexer.Segment.doc = doc
+        self.assertEquals([hit['number'] for hit in hits], [1, 2])
+        self.assertTrue(len(decoded) <= 3)
+
+    def test_manifest(self):
+        TranslationIndex(self.index_dir).update([self.course_dir])
+        with open(os.path.join(self.index_dir, indexer.MANIFEST)) as fd:
+            manifest = json.load(fd)
+        self.assertEquals(manifest['version'], indexer.MANIFEST_VERSION)
+        self.assertEquals([sorted(entry) for entry in manifest['segments']],
+                          [['cue_count', 'deleted', 'doc_count', 'name']])
+        self.assertEquals(self.search(u'mongodb shell'), [])
+        self.assertEquals(self.search(u'el shell de mongodb'),
+                          [(1, 'lecture', u'El shell de MongoDB')])
+        manifest.pop('version')
+        with open(os.path.join(self.index_dir, indexer.MANIFEST), 'w') as fd:
+            json.dump(manifest, fd)
+        self.assertEquals(TranslationIndex(self.index_dir).update(
+            [self.course_dir]), 2)
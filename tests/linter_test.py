@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+import json
+import os
+import shutil
+import tempfile
+
+from subte.generator import Generator
+from subte.linter import Linter, lint_file
+
+VALID = '''1
+00:00:01,000 --> 00:00:02,000
+Hola
+'''
+
+INVALID = '''1
+00:00:01,000 --> 00:00:03,000
+Hola
+
+2
+00:00:02,000 --> 00:00:02,000
+\t
+
+3
+00:00:01,500 --> 00:00:04,000
+Mundo
+'''
+
+
+class LinterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as fd:
+            fd.write(content)
+        return path
+
+    def codes(self, content):
+        return [issue['code'] for issue in
+                lint_file(self.write('a.srt', content))[1]]
+
+    def test_lint_file(self):
+        self.assertEquals(self.codes(VALID), [])
+        self.assertEquals(self.codes(INVALID), ['duration', 'empty-text',
+                                                'overlap', 'order'])
+        self.assertEquals(self.codes(''), ['empty'])
+        self.assertEquals(self.codes(VALID.replace('Hola', '\xe9')),
+                          ['encoding'])
+        self.assertEquals(self.codes(VALID.replace('02,000', '2')),
+                          ['timing'])
+        self.assertEquals(self.codes(VALID.replace('00:00:02', '00:00:75')),
+                          ['timestamp'])
+        issues = lint_file(os.path.join(self.directory, 'missing.srt'))[1]
+        self.assertEquals(issues[0]['code'], 'io')
+
+    def test_linter(self):
+        self.write('a.srt', VALID)
+        self.write('b.srt', INVALID)
+        self.write('c.txt', INVALID)
+        report_file = os.path.join(self.directory, 'report.json')
+        linter = Linter([self.directory, '-j', '2', '--report', report_file,
+                         '-l', 'CRITICAL'])
+        linter.run()
+        with open(report_file) as fd:
+            report = json.load(fd)
+        self.assertEquals(report['files'], 2)
+        self.assertEquals(report['invalid'], 1)
+        self.assertEquals(report['issues'].keys(),
+                          [os.path.join(self.directory, 'b.srt')])
+
+    def test_generator_lint(self):
+        source_dir = os.path.join(self.directory, 'source')
+        os.makedirs(source_dir)
+        for name, content in (('a.srt', VALID), ('b.srt', INVALID)):
+            with open(os.path.join(source_dir, name), 'w') as fd:
+                fd.write(content)
+        mapping_file = self.write('mapping.json', json.dumps([
+            {'concept': 'A', 'lecture': 'a', 'answer': 'b'}]))
+        generator = Generator(['-s', source_dir, '-t',
+                               os.path.join(self.directory, 'target'), '-f',
+                               '--lint', '-l', 'CRITICAL', 'json',
+                               mapping_file])
+        generator.run()
+        report = generator.get_report()
+        self.assertEquals(generator.lint.files, 2)
+        self.assertEquals([os.path.basename(path) for path in report['lint']],
+                          ['01-a-answer.srt'])
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+import os
+
+from subte import locality
+from subte.generator import Generator
+
+from tests.utils import MappingTestCase
+
+
+class LocalityTest(MappingTestCase):
+
+    NAMES = ['c', 'a', 'd', 'b']
+    SOURCES = dict((name + '.srt', name * 4096) for name in NAMES)
+    MAPPING = ([{'concept': name, 'lecture': name} for name in NAMES] +
+               [{'concept': 'e', 'answer': 'e'}])
+
+    def test_physical_offset(self):
+        offset = locality.physical_offset(os.path.join(self.source_dir,
+                                                       'a.srt'))
+        self.assertTrue(offset is None or offset >= 0)
+        self.assertEquals(locality.physical_offset(
+            os.path.join(self.source_dir, 'missing.srt')), None)
+
+    def test_locality_key(self):
+        paths = [os.path.join(self.source_dir, name + '.srt')
+                 for name in self.NAMES]
+        for order in ('inode', 'extent'):
+            keys = sorted(locality.locality_key(path, order)
+                          for path in paths)
+            self.assertEquals(len(set(keys)), len(paths))
+        missing = os.path.join(self.source_dir, 'missing.srt')
+        self.assertEquals(locality.locality_key(missing, 'inode')[0], 0)
+
+    def test_advise_willneed(self):
+        locality.advise_willneed(os.path.join(self.source_dir, 'a.srt'))
+        locality.advise_willneed(os.path.join(self.source_dir, 'missing'))
+
+    def test_generator_order(self):
+        for order in ('mapping', 'inode', 'extent'):
+            target_dir = os.path.join(self.target_dir, order)
+            generator = self.run_command(Generator, '-t', target_dir, '-f',
+                                         '-o', order)
+            self.assertEquals(sorted(os.listdir(target_dir)), [
+                '01-c-lecture.srt', '02-a-lecture.srt', '03-d-lecture.srt',
+                '04-b-lecture.srt'])
+            self.assertEquals(generator.stats['errors'], 1)
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+import json
+import logging
+import threading
+
+from subte.log import BatchHandler, JSONFormatter
+
+
+class CountingStream(object):
+
+    def __init__(self):
+        self.writes = []
+        self.flushes = 0
+        self.flushed = threading.Event()
+
+    def write(self, data):
+        self.writes.append(data)
+
+    def flush(self):
+        self.flushes += 1
+        self.flushed.set()
+
+
+class JSONFormatterTest(unittest.TestCase):
+
+    def make_record(self, msg, args, level=logging.INFO, extra=None):
+        record = logging.LogRecord('subte', level, __file__, 1, msg, args,
+                                   None)
+        for key, value in (extra or {}).items():
+            setattr(record, key, value)
+        return record
+
+    def test_compact_line(self):
+        record = self.make_record('Copied %s to %s', ('a.srt', 'b.srt'))
+        line = JSONFormatter().format(record)
+        self.assertNotIn('\n', line)
+        self.assertNotIn(', ', line)
+        event = json.loads(line)
+        self.assertEquals(event['level'], 'INFO')
+        self.assertEquals(event['message'], 'Copied a.srt to b.srt')
+        self.assertNotIn('source', event)
+
+    def test_structured_fields(self):
+        extra = {'operation': 'copy', 'source': 'a.srt',
+                 'destination': 'b.srt', 'bytes': 10, 'duration': 0.5,
+                 'unknown': True}
+        record = self.make_record('Copied %s to %s', ('a.srt', 'b.srt'),
+                                  extra=extra)
+        event = json.loads(JSONFormatter().format(record))
+        for field in JSONFormatter.FIELDS:
+            if field in extra:
+                self.assertEquals(event[field], extra[field])
+        self.assertNotIn('error', event)
+        self.assertNotIn('unknown', event)
+
+
+class BatchHandlerTest(unittest.TestCase):
+
+    def make_record(self, msg, level=logging.INFO):
+        return logging.LogRecord('subte', level, __file__, 1, msg, (), None)
+
+    def test_batches(self):
+        stream = CountingStream()
+        handler = BatchHandler(stream, capacity=3, interval=None)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        for index in range(7):
+            handler.handle(self.make_record(str(index)))
+        self.assertEquals(stream.writes, ['0\n1\n2\n', '3\n4\n5\n'])
+        self.assertEquals(stream.flushes, 2)
+        handler.handle(self.make_record(u'fall\xf3', logging.ERROR))
+        self.assertEquals(stream.writes[-1], '6\nfall\xc3\xb3\n')
+        handler.handle(self.make_record('7'))
+        handler.close()
+        self.assertEquals(stream.writes[-1], '7\n')
+        self.assertEquals((len(stream.writes), stream.flushes), (4, 4))
+
+    def test_interval(self):
+        stream = CountingStream()
+        handler = BatchHandler(stream, capacity=100, interval=0.01)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        try:
+            handler.handle(self.make_record('idle'))
+            self.assertTrue(stream.flushed.wait(5))
+            self.assertEquals(stream.writes, ['idle\n'])
+        finally:
+            handler.close()
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from subte.generator import Generator
+from subte.memory import MemoryProfiler
+
+
+class Retained(object):
+    pass
+
+
+class MemoryProfilerTest(unittest.TestCase):
+
+    def test_snapshots(self):
+        profiler = MemoryProfiler(top=5)
+        profiler.start()
+        try:
+            profiler.snapshot('before')
+            retained = [Retained() for _ in xrange(10000)]
+            snapshot = profiler.snapshot('after')
+        finally:
+            profiler.stop()
+        self.assertEquals(len(retained), 10000)
+        self.assertEquals(len(snapshot['top']), 5)
+        self.assertTrue(snapshot['diff'])
+        if profiler.backend == 'gc':
+            counts = dict((entry['site'], entry['count'])
+                          for entry in snapshot['diff'])
+            self.assertEquals(counts['Retained'], 10000)
+        self.assertTrue(snapshot['rss'] > 0)
+        self.assertTrue(snapshot['peak_rss'] > 0)
+
+    def test_sampler(self):
+        profiler = MemoryProfiler(interval=0.01)
+        profiler.start_sampler()
+        time.sleep(0.05)
+        profiler.stop()
+        self.assertTrue(len(profiler.samples) >= 2)
+        self.assertTrue(all(sample['rss'] for sample in profiler.samples))
+
+
+class ProcessMemoryProfileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_memory_profile(self):
+        source_dir = os.path.join(self.directory, 'source')
+        os.makedirs(source_dir)
+        mapping_file = os.path.join(self.directory, 'mapping.json')
+        with open(mapping_file, 'w') as fd:
+            json.dump([], fd)
+        profile = os.path.join(self.directory, 'memory.json')
+        generator = Generator(['--memory-profile', profile,
+                               '--memory-interval', '0.01', '-s', source_dir,
+                               '-t', os.path.join(self.directory, 'target'),
+                               '-f', '-l', 'CRITICAL', 'json', mapping_file])
+        generator.run()
+        with open(profile) as fd:
+            report = json.load(fd)
+        self.assertEquals([phase['phase'] for phase in report['phases']],
+                          ['initialize', 'prepare', 'handle', 'finish'])
+        self.assertTrue(report['samples'])
+        self.assertTrue(report['peak_rss'] > 0)
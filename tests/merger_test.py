@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+import gzip
+import json
+import os
+import random
+import shutil
+import tempfile
+
+from subte.captions import Cue, CueStore, read_cues
+from subte.merger import IntervalIndex, Merger, merge_stores
+
+
+def make_store(cues):
+    store = CueStore()
+    for start, end, text in cues:
+        store.append(start, end, text)
+    return store
+
+
+class IntervalIndexTest(unittest.TestCase):
+
+    def test_overlaps(self):
+        random.seed(7)
+        cues = []
+        for _ in range(300):
+            start = random.randint(0, 10000)
+            cues.append((start, start + random.randint(0, 800), u'x'))
+        store = make_store(cues)
+        index = IntervalIndex(store)
+        for _ in range(200):
+            start = random.randint(-100, 10500)
+            end = start + random.randint(1, 1000)
+            expected = sorted((position for position, cue in enumerate(cues)
+                               if cue[0] < end and cue[1] > start),
+                              key=lambda position: cues[position][0])
+            self.assertEquals(
+                sorted(index.overlaps(start, end)), sorted(expected))
+            self.assertEquals([cues[position][0] for position in
+                               index.overlaps(start, end)],
+                              [cues[position][0] for position in expected])
+        self.assertEquals(IntervalIndex(CueStore()).overlaps(0, 10), [])
+
+
+class MergeTest(unittest.TestCase):
+
+    def test_merge_stores(self):
+        primary = make_store([(0, 1000, u'Hello'), (1000, 2000, u'World'),
+                              (5000, 6000, u'Bye')])
+        secondary = make_store([(0, 900, u'Hola'), (900, 2100, u'Mundo'),
+                                (3000, 4000, u'Extra')])
+        self.assertEquals([(cue.start, cue.end, cue.text)
+                           for cue in merge_stores(primary, secondary)], [
+            (0, 1000, u'Hello\nHola\nMundo'),
+            (1000, 2000, u'World\nMundo'),
+            (3000, 4000, u'Extra'),
+            (5000, 6000, u'Bye'),
+        ])
+
+
+class MergerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.dirs = [os.path.join(self.directory, name)
+                     for name in ('en', 'es', 'merged')]
+        for directory in self.dirs[:2]:
+            os.makedirs(directory)
+        self.write(0, '01-intro-lecture.srt',
+                   '1\n00:00:01,000 --> 00:00:02,000\nHello\n')
+        self.write(1, '01-intro-lecture.srt',
+                   '1\n00:00:01,100 --> 00:00:02,100\nHola\n')
+        self.write(0, '02-shell-answer.vtt.gz',
+                   'WEBVTT\n\n00:01.000 --> 00:02.000\nShell\n', True)
+        self.write(1, '02-shell-answer.vtt.gz',
+                   'WEBVTT\n\n00:01.000 --> 00:02.000\nConsola\n', True)
+        self.write(0, '03-broken-lecture.srt', '1\nbroken\ntext\n')
+        self.write(1, '03-broken-lecture.srt', '1\nbroken\ntext\n')
+        self.write(0, '04-only-lecture.srt', '')
+        self.write(1, 'notes.txt', '')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, side, name, data, compressed=False):
+        path = os.path.join(self.dirs[side], name)
+        with (gzip.open if compressed else open)(path, 'wb') as fd:
+            fd.write(data)
+
+    def test_run(self):
+        report = os.path.join(self.directory, 'report.json')
+        merger = Merger(self.dirs[:2] + ['-o', self.dirs[2], '-j', '2',
+                                         '--report', report, '-l',
+                                         'CRITICAL'])
+        merger.run()
+        self.assertEquals(read_cues(os.path.join(
+            self.dirs[2], '01-intro-lecture.srt')),
+            [Cue(u'1', 1000, 2000, u'Hello\nHola')])
+        with gzip.open(os.path.join(self.dirs[2],
+                                    '02-shell-answer.vtt.gz')) as fd:
+            self.assertEquals(fd.read(), 'WEBVTT\n\n00:00:01.000 --> '
+                              '00:00:02.000\nShell\nConsola\n\n')
+        with open(report) as fd:
+            self.assertEquals(json.load(fd)['stats'], {
+                'merged': 2, 'cues': 2, 'errors': 1, 'unmatched': 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
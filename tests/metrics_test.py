@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+import os
+import shutil
+import tempfile
+import urllib2
+
+from subte.metrics import Registry
+
+
+class RegistryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = Registry({'course': 'm101'})
+
+    def test_counter_and_gauge(self):
+        counter = self.registry.counter('files_total', 'Files')
+        counter.inc()
+        counter.inc(2)
+        self.assertIs(self.registry.counter('files_total', 'Files'), counter)
+        self.assertRaises(ValueError, counter.inc, -1)
+        self.registry.gauge('items', 'Items').set(7)
+        self.assertRaises(ValueError, self.registry.gauge, 'files_total',
+                          'Files')
+        output = self.registry.render()
+        self.assertIn('# TYPE files_total counter\n', output)
+        self.assertIn('files_total{course="m101"} 3\n', output)
+        self.assertIn('items{course="m101"} 7\n', output)
+
+    def test_histogram(self):
+        histogram = self.registry.histogram('latency', 'Latency',
+                                            buckets=[1, 0.1])
+        for value in (0.05, 0.5, 2):
+            histogram.observe(value)
+        output = self.registry.render()
+        self.assertIn('latency_bucket{course="m101",le="0.1"} 1\n', output)
+        self.assertIn('latency_bucket{course="m101",le="1.0"} 2\n', output)
+        self.assertIn('latency_bucket{course="m101",le="+Inf"} 3\n', output)
+        self.assertIn('latency_count{course="m101"} 3\n', output)
+
+    def test_write_textfile(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'subte.prom')
+            self.registry.counter('files_total', 'Files').inc()
+            self.registry.write_textfile(path)
+            with open(path) as fd:
+                self.assertEquals(fd.read(), self.registry.render())
+            self.assertEquals(os.listdir(directory), ['subte.prom'])
+        finally:
+            shutil.rmtree(directory)
+
+    def test_serve(self):
+        self.registry.counter('files_total', 'Files').inc()
+        server = self.registry.serve(0)
+        try:
+            url = 'http://127.0.0.1:{}/metrics'.format(server.server_port)
+            self.assertEquals(urllib2.urlopen(url).read(),
+                              self.registry.render())
+        finally:
+            server.shutdown()
+            server.server_close()
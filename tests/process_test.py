@@ -5,12 +5,55 @@ except ImportError:
     import unittest
 
 import argparse
+import os
+import signal
+import threading
+import time
 
-from subte.process import Process, ProcessMode
+from subte.process import (AsyncProcess, AsyncProcessMode, Pipeline, Process,
+                           ProcessMode, Sink, Source, Stage)
 
 from tests.utils import capture_sys_output
 
 
+class RangeSource(Source):
+
+    def __init__(self, count):
+        super(RangeSource, self).__init__()
+        self.count = count
+
+    def produce(self):
+        return iter(range(self.count))
+
+
+class Square(Stage):
+
+    KIND = 'process'
+
+    def process(self, item):
+        if item < 0:
+            raise ValueError(item)
+        return [item * item]
+
+
+class Collect(Sink):
+
+    def __init__(self, workers=None):
+        super(Collect, self).__init__(workers)
+        self.items = []
+
+    def process(self, item):
+        self.items.append(item)
+
+
+def interrupt_after(seconds):
+    """Sends SIGINT to this process after ``seconds`` from a timer thread.
+    """
+    timer = threading.Timer(seconds, os.kill, (os.getpid(), signal.SIGINT))
+    timer.start()
+    return timer
+
+
 class ProcessTest(unittest.TestCase):
 
     def setUp(self):
@@ -195,3 +238,177 @@ class ProcessModeTest(unittest.TestCase):
         self.assertFalse(self.initialize_was_called)
         mode.initialize(None)
         self.assertTrue(self.initialize_was_called)
+
+
+class AsyncProcessModeTest(unittest.TestCase):
+
+    def make_mode(self, load):
+        class Mode(AsyncProcessMode):
+
+            def set_arguments(self, subparser):
+                pass
+
+            def load(self, arguments):
+                return load(arguments)
+
+        parser = argparse.ArgumentParser()
+        return Mode(parser.add_subparsers())
+
+    def test_iter_items(self):
+        mode = self.make_mode(lambda arguments: iter(range(arguments)))
+        mode.QUEUE_SIZE = 2
+        mode.initialize(5)
+        self.assertEquals(list(mode.iter_items()), range(5))
+
+    def test_interrupt(self):
+        def load(arguments):
+            yield 1
+            time.sleep(1)
+            yield 2
+
+        mode = self.make_mode(load)
+        mode.initialize(None)
+        items = mode.iter_items()
+        self.assertEquals(next(items), 1)
+        start = time.time()
+        timer = interrupt_after(0.2)
+        self.assertRaises(KeyboardInterrupt, next, items)
+        timer.join()
+        self.assertTrue(time.time() - start < 0.8)
+        self.assertTrue(mode._stop.is_set())
+
+    def test_load_error(self):
+        def load(arguments):
+            yield 1
+            raise KeyError('broken')
+
+        mode = self.make_mode(load)
+        mode.initialize(None)
+        items = mode.iter_items()
+        self.assertEquals(next(items), 1)
+        self.assertRaises(KeyError, next, items)
+
+
+class AsyncProcessTest(unittest.TestCase):
+
+    def test_submit(self):
+        class MyProcess(AsyncProcess):
+
+            def handle(self):
+                self.active = 0
+                self.max_active = 0
+                self.done = []
+                lock = threading.Lock()
+                event = threading.Event()
+
+                def work(number):
+                    with lock:
+                        self.active += 1
+                        self.max_active = max(self.max_active, self.active)
+                    event.wait(0.01)
+                    with lock:
+                        self.active -= 1
+                        self.done.append(number)
+
+                for number in range(20):
+                    self.submit(work, number)
+                self.join()
+                self.offloaded = self.run_in_executor(sum, [1, 2]).get()
+
+        proc = MyProcess(['-j', '4', '--max-pending', '3'])
+        proc.run()
+        self.assertEquals(sorted(proc.done), range(20))
+        self.assertTrue(1 <= proc.max_active <= 3)
+        self.assertEquals(proc.offloaded, 3)
+
+    def test_interrupt(self):
+        class MyProcess(AsyncProcess):
+
+            def handle(self):
+                for _ in range(4):
+                    self.submit(time.sleep, 0.5)
+                self.join()
+
+        proc = MyProcess(['-j', '1', '-l', 'CRITICAL'])
+        start = time.time()
+        timer = interrupt_after(0.2)
+        self.assertRaises(KeyboardInterrupt, proc.run)
+        timer.join()
+        self.assertTrue(time.time() - start < 1.5)
+
+    def test_submit_error(self):
+        self.handled = None
+
+        class MyProcess(AsyncProcess):
+
+            def handle(self):
+                self.submit(int, 'x')
+                self.join()
+
+            def handle_exception(process_self, e):
+                self.handled = e
+
+        MyProcess(['-l', 'CRITICAL']).run()
+        self.assertTrue(isinstance(self.handled, ValueError))
+
+
+class PipelineTest(unittest.TestCase):
+
+    def test_run(self):
+        class Split(Stage):
+
+            WORKERS = 3
+
+            def process(self, item):
+                return [item, -item]
+
+        sink = Collect(workers=2)
+        pipeline = Pipeline([RangeSource(50), Split(), sink], queue_size=1)
+        pipeline.run()
+        self.assertEquals(sorted(sink.items),
+                          sorted(range(50) + [-item for item in range(50)]))
+        stats = dict((stats.name, stats) for stats in pipeline.stats)
+        self.assertEquals(stats['RangeSource'].items_out, 50)
+        self.assertEquals(stats['Split'].items_in, 50)
+        self.assertEquals(stats['Split'].items_out, 100)
+        self.assertEquals(stats['Collect'].items_in, 100)
+        self.assertTrue(stats['Collect'].throughput > 0)
+
+    def test_process_stage(self):
+        sink = Collect()
+        Pipeline([RangeSource(40), Square(workers=2), sink]).run()
+        self.assertEquals(sorted(sink.items), [item * item
+                                               for item in range(40)])
+
+    def test_error(self):
+        class Fail(Stage):
+
+            def process(self, item):
+                if item == 10:
+                    raise KeyError(item)
+                return [item]
+
+        sink = Collect()
+        pipeline = Pipeline([RangeSource(1000), Fail(), sink], queue_size=2)
+        self.assertRaises(KeyError, pipeline.run)
+        self.assertRaises(ValueError, Pipeline, [Fail(), sink])
+
+    def test_interrupt(self):
+        class Slow(Sink):
+
+            def __init__(self):
+                super(Slow, self).__init__()
+                self.items = []
+
+            def process(self, item):
+                time.sleep(0.1)
+                self.items.append(item)
+
+        sink = Slow()
+        pipeline = Pipeline([RangeSource(100), sink], queue_size=1)
+        start = time.time()
+        timer = interrupt_after(0.3)
+        self.assertRaises(KeyboardInterrupt, pipeline.run)
+        timer.join()
+        self.assertTrue(time.time() - start < 2)
+        self.assertTrue(len(sink.items) < 100)
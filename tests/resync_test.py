@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+import argparse
+import os
+import shutil
+import tempfile
+
+from subte import resync
+from subte.resync import Resyncer, anchor_type, correct
+
+SRT = '''1
+00:00:01,000 --> 00:00:02,000
+Hola 00:00:01,000
+
+2
+00:01:00,000 --> 00:01:02,500 X1:10
+Mundo
+'''
+
+VTT = '''WEBVTT
+
+00:01.000 --> 00:02.000
+Hola
+'''
+
+
+class CorrectTest(unittest.TestCase):
+
+    def check(self, *args, **kwargs):
+        result = [int(value) for value in correct(*args, **kwargs)]
+        numpy = resync.numpy
+        resync.numpy = None
+        try:
+            self.assertEquals(list(correct(*args, **kwargs)), result)
+        finally:
+            resync.numpy = numpy
+        return result
+
+    def test_offset_and_scale(self):
+        self.assertEquals(self.check([0, 1000, 2000], 500), [500, 1500, 2500])
+        self.assertEquals(self.check([0, 1000], -700), [0, 300])
+        self.assertEquals(self.check([1000, 3000], 0, 1.5), [1500, 4500])
+
+    def test_anchors(self):
+        anchors = [(1000, 2000), (11000, 12000), (21000, 42000)]
+        self.assertEquals(self.check([0, 1000, 6000, 16000, 31000],
+                                     anchors=anchors),
+                          [1000, 2000, 7000, 27000, 72000])
+        self.assertEquals(self.check([0, 5000], anchors=[(1000, 1500)]),
+                          [500, 5500])
+        self.assertRaises(ValueError, correct, [0],
+                          anchors=[(1, 2), (1, 3)])
+
+    def test_anchor_type(self):
+        self.assertEquals(anchor_type('00:00:01,000=00:00:01,500'),
+                          (1000, 1500))
+        self.assertRaises(argparse.ArgumentTypeError, anchor_type, '1=2')
+
+
+class ResyncerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.directory, 'course'))
+        self.srt = os.path.join(self.directory, 'course', 'a.srt')
+        self.vtt = os.path.join(self.directory, 'b.vtt')
+        with open(self.srt, 'w') as fd:
+            fd.write(SRT)
+        with open(self.vtt, 'w') as fd:
+            fd.write(VTT)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_run(self):
+        Resyncer([self.directory, '--offset', '1.5', '-j', '2', '-l',
+                  'CRITICAL']).run()
+        with open(self.srt) as fd:
+            self.assertEquals(fd.read(), SRT.replace(
+                '00:00:01,000 --> 00:00:02,000',
+                '00:00:02,500 --> 00:00:03,500').replace(
+                '00:01:00,000 --> 00:01:02,500',
+                '00:01:01,500 --> 00:01:04,000'))
+        with open(self.vtt) as fd:
+            self.assertEquals(fd.read(), VTT.replace(
+                '00:01.000 --> 00:02.000',
+                '00:00:02.500 --> 00:00:03.500'))
@@ -4,7 +4,12 @@ import sys
 
 from unittest import defaultTestLoader, TextTestRunner, TestSuite
 
-TESTS = ('subte_test', 'process_test', 'generator_test', )
+TESTS = ('subte_test', 'process_test', 'generator_test', 'log_test',
+         'metrics_test', 'verifier_test', 'locality_test', 'captions_test',
+         'indexer_test', 'differ_test', 'resync_test', 'linter_test',
+         'storage_test', 'tracing_test', 'importer_test',
+         'compression_test', 'memory_test', 'server_test',
+         'catalog_test', 'sync_test', 'exporter_test', 'merger_test', )
 
 
 def make_suite(prefix='', extra=(), force_all=False):
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+import json
+import threading
+import urllib2
+
+from subte.server import LRUCache, Server
+
+from tests.utils import MappingTestCase
+
+
+class LRUCacheTest(unittest.TestCase):
+
+    def test_admission_and_eviction(self):
+        cache = LRUCache(10)
+        self.assertFalse(cache.admit('a'))
+        self.assertTrue(cache.admit('a'))
+        cache.put('a', 1, 'aaaa')
+        cache.put('b', 1, 'bbbb')
+        self.assertEquals(cache.get('a', 1), 'aaaa')
+        cache.put('c', 1, 'cccc')
+        self.assertEquals(cache.get('b', 1), None)
+        self.assertEquals(cache.get('a', 1), 'aaaa')
+        self.assertEquals(cache.get('c', 2), None)
+        self.assertEquals(cache.size, 4)
+        cache.put('d', 1, 'd' * 11)
+        self.assertEquals(cache.get('d', 1), None)
+        cache.discard(['a'])
+        self.assertEquals(cache.size, 0)
+
+
+class ServerTest(MappingTestCase):
+
+    SOURCES = {'a.srt': 'lecture a', 'b.srt': 'answer b',
+               'c.srt.gz': 'lecture c'}
+    MAPPING = [{'concept': 'Intro', 'lecture': 'a', 'answer': 'b'},
+               {'concept': 'Shell', 'lecture': 'c'}]
+    TARGET = 'm101'
+
+    def setUp(self):
+        super(ServerTest, self).setUp()
+        self.server = Server(['-s', self.source_dir, '-t', self.target_dir,
+                              '--port', '0', '-l', 'CRITICAL', 'json',
+                              self.mapping_file])
+        self.server.prepare()
+        self.thread = threading.Thread(target=self.server.handle)
+        self.thread.start()
+        self.url = 'http://127.0.0.1:{}'.format(
+            self.server.httpd.server_address[1])
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.thread.join()
+        self.server.finish()
+        super(ServerTest, self).tearDown()
+
+    def get(self, path, data=None):
+        try:
+            response = urllib2.urlopen(self.url + path, data)
+        except urllib2.HTTPError as e:
+            return e.code, None
+        return response.getcode(), response.read()
+
+    def test_serve(self):
+        for _ in range(3):
+            self.assertEquals(self.get('/m101/01-intro-lecture.srt'),
+                              (200, 'lecture a'))
+        self.assertEquals(self.get('/m101/02-shell-lecture.srt'),
+                          (200, 'lecture c'))
+        self.assertEquals(self.get('/m101/03-missing-lecture.srt')[0], 404)
+        self.assertEquals(self.get('/m102/01-intro-lecture.srt')[0], 404)
+        output = self.server.metrics.render()
+        self.assertIn('subte_serve_requests_total{cache="sendfile"} 1',
+                      output)
+        self.assertIn('subte_serve_requests_total{cache="miss"} 2', output)
+        self.assertIn('subte_serve_requests_total{cache="hit"} 1', output)
+
+    def test_modified_source(self):
+        for _ in range(2):
+            self.get('/m101/01-intro-answer.srt')
+        self.write_source('b.srt', 'answer b, fixed')
+        self.assertEquals(self.get('/m101/01-intro-answer.srt'),
+                          (200, 'answer b, fixed'))
+
+    def test_reload(self):
+        self.write_mapping([{'concept': 'Intro', 'lecture': 'b'},
+                            {'concept': 'Pipes', 'lecture': 'a'}])
+        status, body = self.get('/-/reload', '')
+        self.assertEquals(status, 200)
+        self.assertEquals(json.loads(body), {'captions': 2, 'added': 1,
+                                             'removed': 2, 'changed': 1})
+        self.assertEquals(self.get('/m101/01-intro-lecture.srt'),
+                          (200, 'answer b'))
+        self.assertEquals(self.get('/m101/02-pipes-lecture.srt'),
+                          (200, 'lecture a'))
+        self.assertEquals(self.get('/m101/01-intro-answer.srt')[0], 404)
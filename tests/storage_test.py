@@ -0,0 +1,359 @@
+# -*- coding: utf-8 -*-
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+import BaseHTTPServer
+import SocketServer
+import StringIO
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import urlparse
+
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+from subte.generator import Generator
+from subte.storage import (MB, GridFSSource, LocalBackend, LocalSource,
+                           S3Backend, S3Error, get_backend, get_source,
+                           gridfs)
+
+MONGODB_URI = os.environ.get('SUBTE_TEST_MONGODB_URI',
+                             'mongodb://127.0.0.1:27017/subte_storage_test')
+
+
+class FakeS3Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """S3 stand-in storing the objects of path-style requests in a local
+    directory. Signatures are not checked. With ``drop_connections`` it
+    closes every connection after its response, without telling the
+    client, and requests to the ``dropped`` bucket get no response at all.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, directory):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0),
+                                           FakeS3Handler)
+        self.directory = directory
+        self.uploads = {}
+        self.requests = []
+        self.lock = threading.Lock()
+        self.drop_connections = False
+
+    @property
+    def endpoint(self):
+        return 'http://127.0.0.1:{}'.format(self.server_address[1])
+
+    def path(self, key):
+        return os.path.join(self.directory, key.lstrip('/'))
+
+
+class FakeS3Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def parse(self):
+        url = urlparse.urlparse(self.path)
+        query = dict(urlparse.parse_qsl(url.query, keep_blank_values=True))
+        with self.server.lock:
+            self.server.requests.append((self.command, url.path, query))
+        length = int(self.headers.get('content-length') or 0)
+        body = self.rfile.read(length) if length else ''
+        if url.path.startswith('/dropped/'):
+            self.close_connection = 1
+            return None, query, body
+        if ('aws4_request' not in self.headers.get('authorization', '') or
+           url.path.startswith('/forbidden/')):
+            self.reply(403)
+            return None, query, body
+        return url.path, query, body
+
+    def reply(self, status, body='', headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+        if self.server.drop_connections:
+            self.close_connection = 1
+
+    def do_HEAD(self):
+        key, query, body = self.parse()
+        if key is None:
+            return
+        path = self.server.path(key)
+        if not os.path.exists(path + '.etag'):
+            return self.reply(404)
+        with open(path + '.etag') as fd:
+            self.reply(200, headers={'ETag': '"{}"'.format(fd.read())})
+
+    def do_PUT(self):
+        key, query, body = self.parse()
+        if key is None:
+            return
+        etag = hashlib.md5(body).hexdigest()
+        if 'uploadId' in query:
+            with self.server.lock:
+                self.server.uploads[query['uploadId']][
+                    int(query['partNumber'])] = body
+            return self.reply(200, headers={'ETag': '"{}"'.format(etag)})
+        self.store(key, body, etag)
+        self.reply(200, headers={'ETag': '"{}"'.format(etag)})
+
+    def do_POST(self):
+        key, query, body = self.parse()
+        if key is None:
+            return
+        if 'uploads' in query:
+            with self.server.lock:
+                upload_id = str(len(self.server.uploads) + 1)
+                self.server.uploads[upload_id] = {}
+            return self.reply(200, '<InitiateMultipartUploadResult xmlns='
+                              '"http://s3.amazonaws.com/doc/2006-03-01/">'
+                              '<UploadId>{}</UploadId>'
+                              '</InitiateMultipartUploadResult>'.format(
+                                  upload_id))
+        parts = self.server.uploads.pop(query['uploadId'])
+        numbers = [int(number) for number in
+                   re.findall(r'<PartNumber>(\d+)</PartNumber>', body)]
+        data = ''.join(parts[number] for number in numbers)
+        etag = '{}-{}'.format(hashlib.md5(''.join(
+            hashlib.md5(parts[number]).digest()
+            for number in numbers)).hexdigest(), len(numbers))
+        self.store(key, data, etag)
+        self.reply(200, '<CompleteMultipartUploadResult/>')
+
+    def do_DELETE(self):
+        key, query, body = self.parse()
+        if key is None:
+            return
+        self.server.uploads.pop(query.get('uploadId'), None)
+        self.reply(204)
+
+    def store(self, key, data, etag):
+        path = self.server.path(key)
+        if not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as fd:
+            fd.write(data)
+        with open(path + '.etag', 'w') as fd:
+            fd.write(etag)
+
+
+class S3TestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.bucket_dir = os.path.join(self.directory, 'bucket')
+        self.server = FakeS3Server(self.bucket_dir)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.directory)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'wb') as fd:
+            fd.write(content)
+        return path
+
+
+class S3BackendTest(S3TestCase):
+
+    def backend(self, **kwargs):
+        return S3Backend('s3://captions/course', self.server.endpoint,
+                         'key', 'secret', **kwargs)
+
+    def test_get_backend(self):
+        self.assertTrue(isinstance(get_backend('/tmp/target'), LocalBackend))
+        self.assertTrue(isinstance(get_backend('s3://bucket/prefix'),
+                                   S3Backend))
+        self.assertRaises(ValueError, get_backend, 'ftp://host/path')
+
+    def test_upload_and_skip(self):
+        source = self.write('a.srt', 'caption')
+        backend = self.backend()
+        try:
+            self.assertEquals(backend.copy(source, '01-a-lecture.srt'),
+                              (7, True))
+            self.assertEquals(backend.copy(source, '01-a-lecture.srt'),
+                              (7, False))
+        finally:
+            backend.close()
+        with open(os.path.join(self.bucket_dir, 'captions', 'course',
+                               '01-a-lecture.srt')) as fd:
+            self.assertEquals(fd.read(), 'caption')
+        methods = [request[0] for request in self.server.requests]
+        self.assertEquals(methods, ['HEAD', 'PUT', 'HEAD'])
+
+    def test_multipart(self):
+        content = os.urandom(MB) * 2 + 'tail'
+        source = self.write('big.srt', content)
+        backend = self.backend(part_size=MB, multipart_threshold=MB)
+        try:
+            self.assertEquals(backend.copy(source, 'big.srt'),
+                              (len(content), True))
+            self.assertEquals(backend.copy(source, 'big.srt'),
+                              (len(content), False))
+        finally:
+            backend.close()
+        with open(os.path.join(self.bucket_dir, 'captions', 'course',
+                               'big.srt'), 'rb') as fd:
+            self.assertEquals(fd.read(), content)
+        parts = [request for request in self.server.requests
+                 if 'partNumber' in request[2]]
+        self.assertEquals(len(parts), 3)
+
+    def test_write_compressed(self):
+        backend = self.backend()
+        try:
+            for written in (True, False):
+                self.assertEquals(backend.write(
+                    StringIO.StringIO('caption'), 'a.srt.gz', 'gzip')[1],
+                    written)
+        finally:
+            backend.close()
+        with gzip.open(os.path.join(self.bucket_dir, 'captions', 'course',
+                                    'a.srt.gz')) as fd:
+            self.assertEquals(fd.read(), 'caption')
+
+    def test_error(self):
+        source = self.write('a.srt', 'caption')
+        backend = S3Backend('s3://forbidden', self.server.endpoint, '', '')
+        try:
+            self.assertRaises(S3Error, backend.copy, source, 'a.srt')
+        finally:
+            backend.close()
+
+    def test_dropped_connections(self):
+        self.server.drop_connections = True
+        source = self.write('a.srt', 'caption')
+        backend = self.backend()
+        try:
+            for written in (True, False):
+                self.assertEquals(backend.copy(source, 'a.srt'),
+                                  (7, written))
+        finally:
+            backend.close()
+        methods = [request[0] for request in self.server.requests]
+        self.assertEquals(methods, ['HEAD', 'PUT', 'HEAD'])
+        backend = S3Backend('s3://dropped', self.server.endpoint, '', '')
+        try:
+            self.assertRaises(S3Error, backend.copy, source, 'a.srt')
+        finally:
+            backend.close()
+
+
+class GeneratorS3Test(S3TestCase):
+
+    def test_generate(self):
+        source_dir = os.path.join(self.directory, 'source')
+        os.makedirs(source_dir)
+        for name in ('a', 'b'):
+            with open(os.path.join(source_dir, name + '.srt'), 'w') as fd:
+                fd.write(name)
+        mapping_file = self.write('mapping.json', json.dumps(
+            [{'concept': 'Intro', 'lecture': 'a', 'answer': 'b'}]))
+        for copied, unchanged in ((2, 0), (0, 2)):
+            generator = Generator(['-s', source_dir, '-t',
+                                   's3://captions/course', '--s3-endpoint',
+                                   self.server.endpoint, '-f', '-l',
+                                   'CRITICAL', 'json', mapping_file])
+            generator.run()
+            self.assertEquals(generator.stats['copied'], copied)
+            self.assertEquals(generator.stats['unchanged'], unchanged)
+        self.assertEquals(sorted(
+            name for name in os.listdir(os.path.join(self.bucket_dir,
+                                                     'captions', 'course'))
+            if not name.endswith('.etag')),
+            ['01-intro-answer.srt', '01-intro-lecture.srt'])
+
+
+class LocalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_write(self):
+        backend = LocalBackend(self.directory)
+        content = 'x' * (3 * 255 * 1024 + 7)
+        self.assertEquals(backend.write(StringIO.StringIO(content), 'a.srt'),
+                          (len(content), True))
+        source = get_source(self.directory)
+        self.assertTrue(isinstance(source, LocalSource))
+        fd = source.open('a.srt')
+        try:
+            self.assertEquals(fd.read(), content)
+        finally:
+            fd.close()
+
+    def test_remote_to_remote(self):
+        mapping_file = os.path.join(self.directory, 'mapping.json')
+        with open(mapping_file, 'w') as fd:
+            fd.write('[]')
+        generator = Generator(['-s', 'mongodb://127.0.0.1/db', '-t',
+                               's3://bucket', '-l', 'CRITICAL', 'json',
+                               mapping_file])
+        self.assertRaises(ValueError, generator.prepare)
+
+
+class GridFSSourceTest(unittest.TestCase):
+
+    def setUp(self):
+        client = MongoClient(MONGODB_URI, serverSelectionTimeoutMS=500)
+        try:
+            client.server_info()
+        except PyMongoError:
+            raise unittest.SkipTest('No mongod at {}'.format(MONGODB_URI))
+        self.db = client.get_default_database()
+        self.client = client
+        bucket = gridfs.GridFSBucket(self.db)
+        bucket.upload_from_stream('a.srt', 'a' * (300 * 1024))
+        bucket.upload_from_stream('b.srt', 'b')
+        self.directory = tempfile.mkdtemp()
+        self.mapping_file = os.path.join(self.directory, 'mapping.json')
+        with open(self.mapping_file, 'w') as fd:
+            json.dump([{'concept': 'Intro', 'lecture': 'a', 'answer': 'b'},
+                       {'concept': 'Shell', 'lecture': 'c'}], fd)
+
+    def tearDown(self):
+        self.client.drop_database(self.db.name)
+        self.client.close()
+        shutil.rmtree(self.directory)
+
+    def test_missing(self):
+        source = GridFSSource(MONGODB_URI)
+        try:
+            self.assertRaises(IOError, source.open, 'missing.srt')
+        finally:
+            source.close()
+
+    def test_generate(self):
+        target_dir = os.path.join(self.directory, 'target')
+        generator = Generator(['-j', '4', '-s', MONGODB_URI, '-t',
+                               target_dir, '-f', '-l', 'CRITICAL', 'json',
+                               self.mapping_file])
+        generator.run()
+        self.assertEquals(sorted(os.listdir(target_dir)),
+                          ['01-intro-answer.srt', '01-intro-lecture.srt'])
+        self.assertEquals(generator.stats['bytes'], 300 * 1024 + 1)
+        self.assertEquals(generator.stats['errors'], 1)
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+import errno
+import gzip
+import os
+import shutil
+import tempfile
+
+from subte.catalog import Catalog
+from subte.generator import Generator
+from subte.storage import file_digest
+from subte.sync import apply_moves, order_moves, plan_moves
+
+from tests.utils import MappingTestCase
+
+
+class PlanTest(unittest.TestCase):
+
+    def test_plan_moves(self):
+        renames, missing, stale = plan_moves(
+            ['01-a', '02-new', '03-b', '04-c'],
+            ['01-a', '02-b', '03-c', '04-gone'],
+            lambda name: name.split('-', 1)[1])
+        self.assertEquals(renames, [('02-b', '03-b'), ('03-c', '04-c')])
+        self.assertEquals(missing, ['02-new'])
+        self.assertEquals(stale, ['04-gone'])
+
+    def test_plan_moves_existing_key(self):
+        keys = {'01-a': 'x', '02-a': 'y', '03-a': 'z'}
+        found = {'01-a': 'x', '02-a': 'x', '03-a': 'y', '04-a': 'z'}
+        renames, missing, stale = plan_moves(
+            ['01-a', '02-a', '03-a', '04-b'], ['01-a', '02-a', '03-a', '04-a'],
+            keys.get, found.get)
+        self.assertEquals(renames, [('03-a', '02-a'), ('04-a', '03-a')])
+        self.assertEquals(missing, ['04-b'])
+        self.assertEquals(stale, ['02-a'])
+
+    def test_order_moves(self):
+        self.assertEquals(order_moves([('a', 'b'), ('b', 'c')]),
+                          [('b', 'c'), ('a', 'b')])
+        operations = order_moves([('a', 'b'), ('b', 'a'), ('c', 'd')],
+                                 temporary=lambda name: name + '~')
+        self.assertEquals(operations, [('c', 'd'), ('a', 'a~'), ('b', 'a'),
+                                       ('a~', 'b')])
+
+
+class ApplyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        for name in ('a', 'b', 'c'):
+            with open(os.path.join(self.directory, name), 'w') as fd:
+                fd.write(name)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def read(self, name):
+        with open(os.path.join(self.directory, name)) as fd:
+            return fd.read()
+
+    def test_cycle(self):
+        apply_moves(self.directory, order_moves([('a', 'b'), ('b', 'c'),
+                                                 ('c', 'a')]))
+        self.assertEquals(sorted(os.listdir(self.directory)),
+                          ['a', 'b', 'c'])
+        self.assertEquals([self.read(name) for name in ('a', 'b', 'c')],
+                          ['c', 'a', 'b'])
+
+    def test_rollback(self):
+        with self.assertRaises(OSError) as cm:
+            apply_moves(self.directory, [('a', 'd'), ('b', 'c')])
+        self.assertEquals(cm.exception.errno, errno.EEXIST)
+        self.assertEquals(sorted(os.listdir(self.directory)),
+                          ['a', 'b', 'c'])
+        self.assertEquals(self.read('a'), 'a')
+
+
+class GeneratorSyncTest(MappingTestCase):
+
+    SOURCES = dict((name + '.srt', name) for name in ('a', 'b', 'c', 'new'))
+
+    def run_generator(self, concepts, *arguments):
+        self.write_mapping([{'concept': concept.split(':')[0],
+                             'lecture': concept.split(':')[-1]}
+                            for concept in concepts])
+        return self.run_command(Generator, '--sync', *arguments)
+
+    def test_renumbering(self):
+        generator = self.run_generator(['a', 'b', 'c'])
+        self.assertEquals(generator.stats['copied'], 3)
+        inode = os.stat(os.path.join(self.target_dir,
+                                     '03-c-lecture.srt')).st_ino
+        with open(os.path.join(self.target_dir, 'notes.txt'), 'w') as fd:
+            fd.write('kept')
+
+        generator = self.run_generator(['new', 'a', 'c'])
+        self.assertEquals(sorted(os.listdir(self.target_dir)), [
+            '01-new-lecture.srt', '02-a-lecture.srt', '03-c-lecture.srt',
+            'notes.txt'])
+        self.assertEquals(generator.stats['copied'], 1)
+        self.assertEquals(generator.stats['renamed'], 1)
+        self.assertEquals(generator.stats['deleted'], 1)
+        self.assertEquals(os.stat(os.path.join(
+            self.target_dir, '03-c-lecture.srt')).st_ino, inode)
+
+    def test_modified_source(self):
+        self.run_generator(['a', 'b'])
+        with open(os.path.join(self.source_dir, 'a.srt'), 'w') as fd:
+            fd.write('changed')
+        generator = self.run_generator(['b', 'a'])
+        self.assertEquals(generator.stats['renamed'], 1)
+        self.assertEquals(generator.stats['copied'], 1)
+        self.assertEquals(generator.stats['deleted'], 1)
+        with open(os.path.join(self.target_dir, '02-a-lecture.srt')) as fd:
+            self.assertEquals(fd.read(), 'changed')
+
+    def read(self, name):
+        with open(os.path.join(self.target_dir, name)) as fd:
+            return fd.read()
+
+    def test_repeated_concepts(self):
+        self.run_generator(['a', 'quiz:a', 'quiz:b', 'quiz:c'])
+        generator = self.run_generator(['a', 'quiz:b', 'quiz:c'])
+        self.assertEquals(sorted(os.listdir(self.target_dir)), [
+            '01-a-lecture.srt', '02-quiz-lecture.srt', '03-quiz-lecture.srt'])
+        self.assertEquals([self.read('02-quiz-lecture.srt'),
+                           self.read('03-quiz-lecture.srt')], ['b', 'c'])
+        self.assertEquals(generator.stats['renamed'], 2)
+        self.assertEquals(generator.stats['deleted'], 1)
+        self.assertEquals(generator.stats['copied'], 0)
+
+    def test_compress(self):
+        self.run_generator(['a', 'b'])
+        generator = self.run_generator(['b', 'a'], '-z', 'gzip')
+        self.assertEquals(sorted(os.listdir(self.target_dir)), [
+            '01-b-lecture.srt.gz', '02-a-lecture.srt.gz'])
+        self.assertEquals(generator.stats['renamed'], 0)
+        self.assertEquals(generator.stats['copied'], 2)
+        self.assertEquals(generator.stats['deleted'], 2)
+        with gzip.open(os.path.join(self.target_dir,
+                                    '02-a-lecture.srt.gz')) as fd:
+            self.assertEquals(fd.read(), 'a')
+
+    def test_unreadable_source(self):
+        self.run_generator(['a', 'b'])
+        os.remove(os.path.join(self.source_dir, 'a.srt'))
+        generator = self.run_generator(['a', 'b'])
+        self.assertEquals(self.read('01-a-lecture.srt'), 'a')
+        self.assertEquals(generator.stats['errors'], 1)
+        self.assertEquals(generator.stats.get('deleted', 0), 0)
+        self.assertEquals(generator.errors[0]['destination'],
+                          '01-a-lecture.srt')
+
+    def test_catalog(self):
+        catalog_file = os.path.join(self.directory, 'catalog.db')
+        self.run_generator(['a', 'b', 'c'], '--catalog', catalog_file)
+        self.run_generator(['new', 'a', 'c'], '--catalog', catalog_file)
+        catalog = Catalog(catalog_file)
+        try:
+            rows = catalog.query('SELECT filename, number, source, digest '
+                                 'FROM outputs ORDER BY filename')
+        finally:
+            catalog.close()
+        self.assertEquals([tuple(row.values())[:3] for row in rows], [
+            ('01-new-lecture.srt', 1, 'new.srt'),
+            ('02-a-lecture.srt', 2, 'a.srt'),
+            ('03-c-lecture.srt', 3, 'c.srt')])
+        self.assertEquals([row['digest'] for row in rows], [
+            file_digest(os.path.join(self.target_dir, row['filename']))
+            for row in rows])
+
+    def test_unsupported(self):
+        generator = Generator(['-s', self.source_dir, '-t', self.target_dir,
+                               '--sync', '-r', 'json', self.mapping_file])
+        self.assertRaises(ValueError, generator.prepare)
+
+
+if __name__ == '__main__':
+    unittest.main()
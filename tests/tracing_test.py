@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+import json
+import os
+import threading
+
+from subte.generator import Generator
+from subte.tracing import NullTracer, Tracer
+
+from tests.utils import MappingTestCase
+
+
+class TracerTest(unittest.TestCase):
+
+    def test_span(self):
+        tracer = Tracer()
+        with tracer.span('outer', item=1):
+            thread = threading.Thread(target=tracer.add,
+                                      args=('inner', tracer.origin,
+                                            tracer.origin + 0.5))
+            thread.start()
+            thread.join()
+        trace = tracer.get_trace()
+        events = dict((event['name'], event)
+                      for event in trace['traceEvents'])
+        self.assertEquals(events['outer']['ph'], 'X')
+        self.assertEquals(events['outer']['args'], {'item': 1})
+        self.assertEquals(events['inner']['dur'], 500000)
+        self.assertNotEquals(events['inner']['tid'], events['outer']['tid'])
+        self.assertEquals(len([event for event in trace['traceEvents']
+                               if event['ph'] == 'M']), 2)
+
+    def test_null_tracer(self):
+        tracer = NullTracer()
+        with tracer.span('outer'):
+            tracer.add('inner', 0, 1)
+        self.assertFalse(hasattr(tracer, 'events'))
+
+
+class GeneratorTraceTest(MappingTestCase):
+
+    SOURCES = {'a.srt': 'a', 'b.srt': 'b'}
+    MAPPING = [{'concept': 'Intro', 'lecture': 'a', 'answer': 'b'}]
+
+    def test_trace(self):
+        trace_file = os.path.join(self.directory, 'trace.json')
+        self.run_command(Generator, '-j', '2', '--trace', trace_file, '-f')
+        with open(trace_file) as fd:
+            events = json.load(fd)['traceEvents']
+        names = [event['name'] for event in events if event['ph'] == 'X']
+        self.assertEquals(sorted(set(names)), ['copy_file', 'finish',
+                                               'handle', 'initialize',
+                                               'prepare'])
+        copies = [event for event in events if event['name'] == 'copy_file']
+        self.assertEquals(sorted(event['args']['destination']
+                                 for event in copies),
+                          ['01-intro-answer.srt', '01-intro-lecture.srt'])
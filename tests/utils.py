@@ -1,5 +1,15 @@
 # -*- coding: utf-8 -*-
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+import gzip
+import json
+import os
+import shutil
 import sys
+import tempfile
 
 from contextlib import contextmanager
 from StringIO import StringIO
@@ -14,3 +24,52 @@ def capture_sys_output():
         yield capture_out, capture_err
     finally:
         sys.stdout, sys.stderr = current_out, current_err
+
+
+class MappingTestCase(unittest.TestCase):
+    """Temporary directory with a ``source`` directory holding the
+    ``SOURCES`` captions, a ``TARGET`` directory path and a mapping file
+    with the ``MAPPING`` items, for the commands built on ``Generator``.
+    """
+
+    SOURCES = {}
+    MAPPING = []
+    TARGET = 'target'
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.source_dir = os.path.join(self.directory, 'source')
+        self.target_dir = os.path.join(self.directory, self.TARGET)
+        self.mapping_file = os.path.join(self.directory, 'mapping.json')
+        os.makedirs(self.source_dir)
+        for name, content in sorted(self.SOURCES.items()):
+            self.write_source(name, content)
+        self.write_mapping(self.MAPPING)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write_source(self, name, content):
+        """Writes a source caption, gzip compressed for ``.gz`` names.
+        """
+        path = os.path.join(self.source_dir, name)
+        opener = gzip.open if name.endswith('.gz') else open
+        with opener(path, 'wb') as fd:
+            fd.write(content)
+        return path
+
+    def write_mapping(self, mapping):
+        with open(self.mapping_file, 'w') as fd:
+            json.dump(mapping, fd)
+
+    def run_command(self, command_class, *arguments):
+        """Runs ``command_class`` on the source and target directories and
+        the mapping file, and returns it. ``arguments`` go before the mode
+        and may override the directories.
+        """
+        command = command_class(['-s', self.source_dir, '-t',
+                                 self.target_dir, '-l', 'CRITICAL'] +
+                                list(arguments) +
+                                ['json', self.mapping_file])
+        command.run()
+        return command
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+import gzip
+import hashlib
+import json
+import os
+import shutil
+
+from subte.generator import Generator
+from subte.storage import file_digest
+from subte.verifier import Verifier
+
+from tests.utils import MappingTestCase
+
+
+class VerifierTest(MappingTestCase):
+
+    SOURCES = {'a.srt': 'lecture a', 'b.srt': 'answer b',
+               'c.srt': 'lecture c'}
+    MAPPING = [{'concept': 'Intro', 'lecture': 'a', 'answer': 'b'},
+               {'concept': 'Shell', 'lecture': 'c'}]
+
+    def setUp(self):
+        super(VerifierTest, self).setUp()
+        os.makedirs(self.target_dir)
+
+    def write(self, directory, name, content):
+        with open(os.path.join(directory, name), 'w') as fd:
+            fd.write(content)
+
+    def verify(self, *args):
+        return self.run_command(Verifier, '-j', '2', *args)
+
+    def test_file_digest(self):
+        path = os.path.join(self.source_dir, 'a.srt')
+        self.assertEquals(file_digest(path, chunk_size=4),
+                          hashlib.sha1('lecture a').hexdigest())
+        empty = os.path.join(self.source_dir, 'empty.srt')
+        self.write(self.source_dir, 'empty.srt', '')
+        self.assertEquals(file_digest(empty, 'md5'),
+                          hashlib.md5('').hexdigest())
+
+    def test_valid(self):
+        self.write(self.target_dir, '01-intro-lecture.srt', 'lecture a')
+        self.write(self.target_dir, '01-intro-answer.srt', 'answer b')
+        self.write(self.target_dir, '02-shell-lecture.srt', 'lecture c')
+        verifier = self.verify()
+        self.assertTrue(verifier.valid)
+        self.assertEquals(verifier.report['checked'], 3)
+
+    def test_invalid(self):
+        self.write(self.target_dir, '01-intro-lecture.srt', 'lecture a')
+        self.write(self.target_dir, '01-intro-answer.srt', 'answer x')
+        self.write(self.target_dir, '03-old-lecture.srt', 'old')
+        report_file = os.path.join(self.directory, 'report.json')
+        verifier = self.verify('--report', report_file)
+        self.assertFalse(verifier.valid)
+        self.assertEquals(verifier.report['missing'],
+                          ['02-shell-lecture.srt'])
+        self.assertEquals(verifier.report['extra'], ['03-old-lecture.srt'])
+        self.assertEquals(verifier.report['mismatched'],
+                          ['01-intro-answer.srt'])
+        with open(report_file) as fd:
+            self.assertEquals(json.load(fd), verifier.report)
+
+    def test_reverse(self):
+        shutil.rmtree(self.target_dir)
+        os.rename(self.source_dir, self.target_dir)
+        os.makedirs(self.source_dir)
+        self.write(self.source_dir, '01-intro-lecture.srt', 'lecture a')
+        self.write(self.source_dir, '01-intro-answer.srt', 'answer b')
+        self.write(self.source_dir, '02-shell-lecture.srt', 'lecture c')
+        self.assertTrue(self.verify('-r').valid)
+
+    def test_pairs(self):
+        source_es = os.path.join(self.directory, 'source_es')
+        target_es = os.path.join(self.directory, 'target_es')
+        os.makedirs(source_es)
+        os.makedirs(target_es)
+        for name, content in (('a.srt', 'lecture a'), ('b.srt', 'answer b'),
+                              ('c.srt', 'lecture c')):
+            self.write(source_es, name, content + ' es')
+        self.write(self.target_dir, '01-intro-lecture.srt', 'lecture a')
+        self.write(self.target_dir, '01-intro-answer.srt', 'answer b')
+        self.write(self.target_dir, '02-shell-lecture.srt', 'lecture c')
+        self.write(target_es, '01-intro-lecture.srt', 'lecture a es')
+        self.write(target_es, '01-intro-answer.srt', 'answer b')
+        verifier = self.verify('-p', source_es, target_es)
+        self.assertFalse(verifier.valid)
+        self.assertEquals(verifier.report['checked'], 5)
+        self.assertEquals(verifier.report['missing'],
+                          ['target_es/02-shell-lecture.srt'])
+        self.assertEquals(verifier.report['mismatched'],
+                          ['target_es/01-intro-answer.srt'])
+
+    def test_compressed(self):
+        self.run_command(Generator, '-z', 'gzip')
+        verifier = self.verify('-z', 'gzip')
+        self.assertTrue(verifier.valid)
+        self.assertEquals(verifier.report['checked'], 3)
+        with gzip.open(os.path.join(self.target_dir,
+                                    '02-shell-lecture.srt.gz'), 'wb') as fd:
+            fd.write('lecture x')
+        self.assertEquals(self.verify('-z', 'gzip').report['mismatched'],
+                          ['02-shell-lecture.srt.gz'])